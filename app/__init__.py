@@ -1,7 +1,10 @@
+import threading
+
 from flask import Flask
 from flask_login import LoginManager
 from .config import Config
 from .db import DB
+from .json_provider import FastJSONProvider
 from flask_wtf.csrf import CSRFProtect
 csrf = CSRFProtect() 
 from flask_cors import CORS 
@@ -13,6 +16,7 @@ def create_app():
     # initialize flask app
     app = Flask(__name__)
     app.config.from_object(Config)
+    app.json = FastJSONProvider(app)
     csrf.init_app(app) 
     CORS(app, origins="http://localhost:3000", supports_credentials=True)
     
@@ -20,6 +24,44 @@ def create_app():
     app.db = DB(app)
     login.init_app(app)
 
+    # read-through cache for product pages, listings and category pages
+    from .controllers.catalogCache import CatalogCache
+    app.catalog_cache = CatalogCache(app.config['CATALOG_CACHE_SIZE'], app.config['CATALOG_CACHE_SECONDS'],
+                                     app.config['CATALOG_CACHE_REDIS_URL'])
+
+    # typeahead index for /products/suggest
+    from .controllers.suggestionIndex import SuggestionIndex
+    app.suggestions = SuggestionIndex()
+
+    # releases cart stock holds that ran out
+    from .controllers.stockHoldSweeper import StockHoldSweeper
+    app.stock_hold_sweeper = StockHoldSweeper(app)
+
+    # collects review upvote clicks and writes them in batches
+    from .controllers.upvoteBuffer import UpvoteBuffer
+    app.upvote_buffer = UpvoteBuffer(app)
+
+    # the index load and the background threads are only for serving, so they start with the first
+    # request instead of here: `flask stats ...` and the bench scripts build the app too
+    start_lock = threading.Lock()
+    started = []
+
+    @app.before_request
+    def start_serving():
+        if started:
+            return
+        with start_lock:
+            if started:
+                return
+            started.append(True)
+            try:
+                app.suggestions.reload()
+            except Exception as e:
+                # the suggest endpoint retries on its next request
+                print(f"Failed to load suggestion index: {e}")
+            app.stock_hold_sweeper.start()
+            app.upvote_buffer.start()
+
     from .index import bp as index_bp
     app.register_blueprint(index_bp)
 
@@ -46,4 +88,17 @@ def create_app():
     from .sellers import bp as seller_bp
     app.register_blueprint(seller_bp)
 
+    # monitoring routes, unauthenticated so only when asked for
+    if app.config['DEBUG_ENDPOINTS']:
+        from .debug import bp as debug_bp
+        app.register_blueprint(debug_bp)
+
+    # gzip/brotli for large responses
+    from . import compression
+    compression.init_app(app)
+
+    # maintenance commands (flask stats ...)
+    from . import commands
+    commands.init_app(app)
+
     return app
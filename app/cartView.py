@@ -3,6 +3,7 @@ from flask import render_template
 from flask_login import current_user, login_required
 from app.controllers.cartManager import CartManager
 from app.models.cartDAL import CartDAL
+from app.db import unit_of_work
 
 
 # CartView
@@ -10,6 +11,7 @@ bp = Blueprint('carts', __name__)
 
 @bp.route('/carts', methods=['GET'])
 @login_required
+@unit_of_work(read_only=True)
 def get_cart_items():
     if not current_user.is_authenticated:
         return jsonify({'message': 'Unauthorized'}), 401
@@ -23,6 +25,7 @@ def get_cart_items():
 
 @bp.route('/get-paginated-carts', methods=['GET'])
 @login_required
+@unit_of_work(read_only=True)
 def get_paginated_cart_items():
     if not current_user.is_authenticated:
         return jsonify({'message': 'Unauthorized'}), 401
@@ -50,6 +53,18 @@ def add_item_to_cart(product_id):
     else:
         return jsonify({"status": "Failed to add"}), 500
 
+# several cart edits in one request, so the cart page can debounce clicks:
+# {"operations": [{"product_id": 1, "delta": 2}, {"product_id": 5, "set": 3}, {"product_id": 7, "remove": true}]}
+# all of them are applied or none are; returns the updated cart
+@bp.route('/carts/batch', methods = ['POST'])
+@login_required
+def batch_update_cart():
+    body = request.get_json(silent=True) or {}
+    response = CartManager.apply_cart_batch(current_user.uid, body.get('operations'))
+    if not response.get("success"):
+        return jsonify({"status": "Failed to update cart", "error": response["error"]}), 400
+    return jsonify({'items': response['items'], 'total_price': response['total_price']}), 200
+
 @bp.route('/delete-item/<int:product_id>', methods = ['DELETE'])
 def remove_item_from_cart(product_id):
     success = CartManager.delete_item_from_cart(current_user.uid,product_id)
@@ -0,0 +1,118 @@
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+from .models.cart import Cart
+from .models.cartDAL import CartDAL
+from .models.product_stats import ProductStats
+from .models.rating_histogram import RatingHistogram
+from .models.stock_hold import StockHold
+
+# maintenance commands, run with e.g. `flask stats check`
+stats_cli = AppGroup('stats', help='Maintain the ProductStats summary table.')
+
+
+# rebuild ProductStats from the raw tables
+@stats_cli.command('rebuild')
+def rebuild_stats():
+    total = ProductStats.rebuild()
+    click.echo(f"Rebuilt ProductStats for {total} products")
+
+
+# compare ProductStats against the raw tables, exits with status 1 if anything drifted
+@stats_cli.command('check')
+def check_stats():
+    drifted = ProductStats.check_consistency()
+    for row in drifted:
+        diffs = ', '.join(
+            f"{column}: stored={stored} actual={actual}"
+            for column, (stored, actual) in row.items()
+            if column != 'product_name' and stored != actual
+        )
+        click.echo(f"{row['product_name']}: {diffs}")
+    if drifted:
+        raise click.ClickException(f"{len(drifted)} products out of sync, run `flask stats rebuild`")
+    click.echo("ProductStats is consistent")
+
+
+carts_cli = AppGroup('carts', help='Maintain the cart totals in the Cart table.')
+
+
+# recompute every cart total from CartContains
+@carts_cli.command('rebuild')
+def rebuild_carts():
+    total = Cart.rebuild()
+    click.echo(f"Rebuilt Cart totals, {total} non-empty carts")
+
+
+# compare Cart against CartContains, exits with status 1 if anything drifted
+@carts_cli.command('check')
+def check_carts():
+    drifted = Cart.check_consistency()
+    for row in drifted:
+        diffs = ', '.join(
+            f"{column}: stored={stored} actual={actual}"
+            for column, (stored, actual) in row.items()
+            if column != 'uid' and stored != actual
+        )
+        click.echo(f"uid {row['uid']}: {diffs}")
+    if drifted:
+        raise click.ClickException(f"{len(drifted)} carts out of sync, run `flask carts rebuild`")
+    click.echo("Cart totals are consistent")
+
+
+# check that the cart items query is driven by the CartContains primary key, exits with status 1 if not
+@carts_cli.command('explain')
+@click.option('--uid', type=int, help='user whose cart to plan for (default: the biggest cart)')
+def explain_cart_query(uid):
+    if uid is None:
+        rows = current_app.db.execute('''
+            SELECT uid FROM Cart ORDER BY item_count DESC, uid LIMIT 1
+        ''')
+        uid = rows[0][0] if rows else 0
+    problems = CartDAL.check_items_plan(uid)
+    for problem in problems:
+        click.echo(problem)
+    if problems:
+        raise click.ClickException("cart items query plan regressed")
+    click.echo(f"cart items query for uid {uid} uses cartcontains_pkey")
+
+holds_cli = AppGroup('holds', help='Maintain cart stock holds.')
+
+
+# release every expired hold now
+@holds_cli.command('sweep')
+def sweep_holds():
+    released = StockHold.sweep_all(current_app.config['STOCK_HOLD_SWEEP_BATCH'])
+    click.echo(f"Released {released} expired stock holds")
+
+
+ratings_cli = AppGroup('ratings', help='Maintain the product and seller rating histograms.')
+
+
+# recompute every rating histogram from the reviews
+@ratings_cli.command('rebuild')
+def rebuild_ratings():
+    for kind in RatingHistogram.TABLES:
+        total = RatingHistogram.rebuild(kind)
+        click.echo(f"Rebuilt {kind} rating histograms, {total} reviewed {kind}s")
+
+
+# compare the histograms against the reviews, exits with status 1 if anything drifted
+@ratings_cli.command('check')
+def check_ratings():
+    drifted = 0
+    for kind in RatingHistogram.TABLES:
+        for key, stored, actual in RatingHistogram.check_consistency(kind):
+            click.echo(f"{kind} {key}: stored={stored} actual={actual}")
+            drifted += 1
+    if drifted:
+        raise click.ClickException(f"{drifted} rating histograms out of sync, run `flask ratings rebuild`")
+    click.echo("Rating histograms are consistent")
+
+
+def init_app(app):
+    app.cli.add_command(stats_cli)
+    app.cli.add_command(carts_cli)
+    app.cli.add_command(holds_cli)
+    app.cli.add_command(ratings_cli)
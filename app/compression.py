@@ -0,0 +1,62 @@
+import gzip
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:
+    # optional, without it clients get gzip
+    brotli = None
+
+# Compresses response bodies of at least RESPONSE_COMPRESSION_MIN_BYTES for clients that accept it:
+# brotli when the package is installed and the client lists br, gzip otherwise. Small bodies aren't
+# worth the CPU and the headers; streamed, already encoded and non-2xx responses are left alone.
+# A compressed response is a different representation, so its ETag gets the encoding as suffix;
+# @versioned (app/conditional.py) accepts those suffixed tags back in If-None-Match.
+COMPRESSIBLE_TYPES = ('application/json', 'text/html', 'text/plain', 'text/css', 'application/javascript')
+
+# ETag suffix of each encoding
+ETAG_SUFFIXES = {'br': '-br', 'gzip': '-gzip'}
+
+
+def compress(data, encoding, level):
+    if encoding == 'br':
+        # brotli's quality runs 0-11, map the gzip style 1-9 level onto it
+        return brotli.compress(data, quality=min(11, level + 2))
+    return gzip.compress(data, compresslevel=level)
+
+
+def choose_encoding(accept_encodings):
+    if brotli is not None and accept_encodings['br']:
+        return 'br'
+    if accept_encodings['gzip']:
+        return 'gzip'
+    return None
+
+
+def init_app(app):
+    min_bytes = app.config['RESPONSE_COMPRESSION_MIN_BYTES']
+    level = app.config['RESPONSE_COMPRESSION_LEVEL']
+    if min_bytes <= 0:
+        return
+
+    @app.after_request
+    def compress_response(response):
+        if response.direct_passthrough or response.is_streamed \
+                or not 200 <= response.status_code < 300 or response.status_code == 204 \
+                or 'Content-Encoding' in response.headers \
+                or response.mimetype not in COMPRESSIBLE_TYPES:
+            return response
+        response.vary.add('Accept-Encoding')
+        encoding = choose_encoding(request.accept_encodings)
+        if encoding is None:
+            return response
+        data = response.get_data()
+        if len(data) < min_bytes:
+            return response
+        response.set_data(compress(data, encoding, level))
+        response.headers['Content-Encoding'] = encoding
+        etag, weak = response.get_etag()
+        if etag is not None:
+            response.set_etag(etag + ETAG_SUFFIXES[encoding], weak)
+        return response
@@ -0,0 +1,60 @@
+import hashlib
+from datetime import datetime, timedelta, timezone
+from functools import wraps
+
+from flask import make_response, request
+
+from .compression import ETAG_SUFFIXES
+from .models.content_version import ContentVersion
+
+
+def versioned(scope_for, unless=None):
+    """Route decorator for conditional GETs. scope_for(**view_args) names the
+    ContentVersion scope the response depends on; the strong ETag is that
+    scope's version plus the request's path and query string, and the scope's
+    last change is the Last-Modified once it is a full second old (HTTP dates
+    have whole seconds, so a later write in the same second would look
+    unmodified). A request whose If-None-Match (or,
+    without one, If-Modified-Since) still matches gets a 304 before the view
+    runs, so none of its queries do; a tag the compression hook suffixed with
+    its encoding matches too. unless() returning True answers the request
+    without any of that, for variants of the response that change without a
+    version bump (e.g. ones including buffered upvote clicks). Put it below
+    @unit_of_work so the version lookup shares the request transaction."""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if unless is not None and unless():
+                return view(*args, **kwargs)
+            scope = scope_for(*args, **kwargs)
+            version, updated_at = ContentVersion.get(scope)
+            # ContentVersion timestamps are naive UTC
+            now = datetime.now(timezone.utc).replace(tzinfo=None)
+            settled = updated_at is not None and updated_at <= now - timedelta(seconds=1)
+            etag = hashlib.sha1(f"{scope}\n{version}\n{request.full_path}".encode()).hexdigest()[:20]
+            sent_etag = etag
+            if request.if_none_match:
+                variants = [etag] + [etag + suffix for suffix in ETAG_SUFFIXES.values()]
+                matched = [tag for tag in variants if request.if_none_match.contains(tag)]
+                not_modified = bool(matched)
+                if matched:
+                    # answer with the representation the client holds
+                    sent_etag = matched[0]
+            else:
+                since = request.if_modified_since
+                not_modified = since is not None and settled \
+                    and updated_at.replace(microsecond=0) <= since.replace(tzinfo=None)
+            if not_modified:
+                response = make_response('', 304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(sent_etag)
+            if settled:
+                response.last_modified = updated_at
+            # clients may keep the response but have to check back every time
+            response.headers['Cache-Control'] = 'no-cache'
+            return response
+        return wrapper
+    return decorator
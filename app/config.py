@@ -13,4 +13,50 @@ class Config(object):
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     # was hard to send the csrf tokens when testing so we can disable it for now.
     # not really sure how it works completely but for api testing we should be fine w/o it
-    WTF_CSRF_ENABLED = False 
\ No newline at end of file
+    WTF_CSRF_ENABLED = False
+    # seconds the /products page may reuse the product count of an unfiltered category (0 = always count)
+    CATALOG_COUNT_CACHE_SECONDS = int(os.environ.get('CATALOG_COUNT_CACHE_SECONDS', 30))
+    # seconds between full reloads of the /products/suggest typeahead index in each worker
+    SUGGEST_REFRESH_SECONDS = int(os.environ.get('SUGGEST_REFRESH_SECONDS', 300))
+    # connection pool per worker process: at most DB_POOL_SIZE + DB_MAX_OVERFLOW connections,
+    # so workers * that should stay below Postgres max_connections. see DB.pool_stats()
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 5))
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 10))
+    # seconds to wait for a free connection before giving up
+    DB_POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT', 30))
+    # seconds after which a connection is replaced (-1 = never)
+    DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 1800))
+    # test connections with a cheap query on checkout so a restarted db doesn't fail requests
+    DB_POOL_PRE_PING = os.environ.get('DB_POOL_PRE_PING', 'true').lower() == 'true'
+    # milliseconds before postgres cancels a statement (0 = no limit)
+    DB_STATEMENT_TIMEOUT_MS = int(os.environ.get('DB_STATEMENT_TIMEOUT_MS', 10000))
+    # times a SERIALIZABLE transaction is attempted before a serialization failure is given up on
+    DB_SERIALIZATION_ATTEMPTS = int(os.environ.get('DB_SERIALIZATION_ATTEMPTS', 5))
+    # serve the unauthenticated /debug/* monitoring endpoints (app/debug.py)
+    DEBUG_ENDPOINTS = os.environ.get('DEBUG_ENDPOINTS', 'false').lower() == 'true'
+    # time every statement per fingerprint (/debug/queries, Server-Timing header), and print
+    # statements taking at least DB_SLOW_QUERY_MS milliseconds to the slow query log (0 = no log)
+    DB_QUERY_STATS = os.environ.get('DB_QUERY_STATS', 'true').lower() == 'true'
+    DB_SLOW_QUERY_MS = int(os.environ.get('DB_SLOW_QUERY_MS', 200))
+    # seconds adding an item to a cart holds its stock for (see models/stock_hold.py)
+    STOCK_HOLD_SECONDS = int(os.environ.get('STOCK_HOLD_SECONDS', 900))
+    # seconds between sweeps releasing expired holds in each worker (0 = no sweeper thread,
+    # run `flask holds sweep` from cron instead) and how many holds one sweep statement releases
+    STOCK_HOLD_SWEEP_SECONDS = int(os.environ.get('STOCK_HOLD_SWEEP_SECONDS', 60))
+    STOCK_HOLD_SWEEP_BATCH = int(os.environ.get('STOCK_HOLD_SWEEP_BATCH', 500))
+    # catalog read cache (controllers/catalogCache.py): seconds an entry is served (0 = no caching),
+    # entries kept per worker, and an optional redis:// URL for a cache shared by all workers
+    CATALOG_CACHE_SECONDS = int(os.environ.get('CATALOG_CACHE_SECONDS', 60))
+    CATALOG_CACHE_SIZE = int(os.environ.get('CATALOG_CACHE_SIZE', 1024))
+    CATALOG_CACHE_REDIS_URL = os.environ.get('CATALOG_CACHE_REDIS_URL')
+    # compress response bodies of at least this many bytes (0 = never) at this gzip level (1-9),
+    # brotli is used instead when installed and accepted (app/compression.py)
+    RESPONSE_COMPRESSION_MIN_BYTES = int(os.environ.get('RESPONSE_COMPRESSION_MIN_BYTES', 1024))
+    RESPONSE_COMPRESSION_LEVEL = int(os.environ.get('RESPONSE_COMPRESSION_LEVEL', 6))
+    # encode jsonify() responses with orjson when it is installed (app/json_provider.py)
+    JSON_FAST = os.environ.get('JSON_FAST', 'true').lower() == 'true'
+    # review upvote clicks are collected per worker and written together every UPVOTE_FLUSH_MS
+    # milliseconds (0 = write each click right away) or once UPVOTE_FLUSH_EVENTS are waiting.
+    # unflushed clicks are only visible in the worker that took them, see controllers/upvoteBuffer.py
+    UPVOTE_FLUSH_MS = int(os.environ.get('UPVOTE_FLUSH_MS', 500))
+    UPVOTE_FLUSH_EVENTS = int(os.environ.get('UPVOTE_FLUSH_EVENTS', 200))
@@ -2,6 +2,12 @@ from flask import current_app as app
 from flask import render_template
 from app.models.cartDAL import CartDAL
 from app.models.order import OrderDAL
+from app.models.cart import Cart
+from app.models.stock_hold import StockHold
+from app.db import retry_serializable
+
+# most edits one /carts/batch request may carry
+MAX_BATCH_OPERATIONS = 100
 
 # use the cart manager as the responsible entity for the orders as well. 
 # This is where you specify the edge cases or check everything before passing it into the DAL.
@@ -44,54 +50,100 @@ class CartManager:
     @staticmethod
     def get_paginated_carts_by_user(uid, page, items_per_page):
         items = CartDAL.get_paginated_carts_by_user(uid, page, items_per_page)
-        
-        all_items = CartDAL.get_items(uid)
-        total_price = 0
-        for i in all_items:
-            total_price += i['quantity'] * i['at_price']
 
-        total_items = CartDAL.count_items_in_cart(uid)
-        total_pages = (total_items + items_per_page - 1) // items_per_page
-        return items, total_price, total_pages
+        # total and item count are maintained in Cart, no need to pull the whole cart
+        cart = Cart.get(uid)
+        total_pages = (cart.item_count + items_per_page - 1) // items_per_page
+        return items, cart.total_price, total_pages
 
     @staticmethod
+    @retry_serializable()
+    # holding a unit of stock is the stock check: it fails when everything left is in someone's cart
     def add_item_to_cart(uid, product_id):
-        product_stock = CartManager.check_product_stock(product_id)
-        if product_stock <= 0:
-            raise Exception("Out of Stock :(")
-        return CartDAL.add_item(uid, product_id)
+        with app.db.begin():
+            if StockHold.hold(uid, product_id) is None:
+                raise Exception("Out of Stock :(")
+            return CartDAL.add_item(uid, product_id)
 
     @staticmethod
     def delete_item_from_cart(uid, product_id):
-        return CartDAL.remove_item_from_cart(uid, product_id)
+        with app.db.begin():
+            StockHold.release(uid, product_id)
+            return CartDAL.remove_item_from_cart(uid, product_id)
 
     @staticmethod
     def decrease_quantity(uid, product_id):
-        new_quantity = CartDAL.decrease_quantity_of_item(uid, product_id)
-        return new_quantity
+        with app.db.begin():
+            new_quantity = CartDAL.decrease_quantity_of_item(uid, product_id)
+            if new_quantity is not None:
+                StockHold.release(uid, product_id, keep=new_quantity)
+            return new_quantity
 
     @staticmethod
     def clear_cart(uid):
-        return CartDAL.clear_cart(uid)
+        with app.db.begin():
+            StockHold.release_all(uid)
+            return CartDAL.clear_cart(uid)
     
     @staticmethod
-    def place_order(uid):
-        cart_items, total_price = CartManager.get_cart_for_user(uid)
+    # validate a /carts/batch body: a list of {product_id, delta|set|remove} edits.
+    # Returns (product_id, kind, value) tuples in order, raises ValueError on anything else
+    def parse_cart_batch(operations):
+        if not isinstance(operations, list) or not operations:
+            raise ValueError("operations must be a non-empty list")
+        if len(operations) > MAX_BATCH_OPERATIONS:
+            raise ValueError(f"at most {MAX_BATCH_OPERATIONS} operations per batch")
+        parsed = []
+        for op in operations:
+            if not isinstance(op, dict) or type(op.get('product_id')) is not int:
+                raise ValueError(f"operation {op!r} needs an integer product_id")
+            kinds = [kind for kind in ('delta', 'set', 'remove') if kind in op]
+            if len(kinds) != 1:
+                raise ValueError(f"operation {op!r} needs exactly one of delta, set or remove")
+            kind = kinds[0]
+            value = op[kind]
+            if kind != 'remove' and (type(value) is not int or (kind == 'set' and value < 0)):
+                raise ValueError(f"operation {op!r} needs a {'non-negative ' if kind == 'set' else ''}integer {kind}")
+            parsed.append((op['product_id'], kind, value))
+        return parsed
 
-        for item in cart_items:
-            stock_quantity = CartManager.check_product_stock(item['product_id'])
-            if stock_quantity < item['quantity']:
-                return{
-                    "success": False,
-                    "error": f"Insufficient stock for product {item['product_name']}"
-            }
-                #  raise Exception(f"Insufficient stock for product {item['product_name']}")
+    @staticmethod
+    def apply_cart_batch(uid, operations):
+        try:
+            parsed = CartManager.parse_cart_batch(operations)
+            items, total_price = CartManager.write_cart_batch(uid, parsed)
+            return {"success": True, "items": items, "total_price": total_price}
+        except Exception as e:
+            print("Cart batch failed:", e)
+            return {"success": False, "error": str(e)}
 
-        user_balance = CartManager.check_user_balance(uid)
-        if user_balance < total_price:
-            return {
-            "success": False,
-            "error": "Insufficient funds."
-            }
+    @staticmethod
+    @retry_serializable()
+    # apply parsed batch edits in order and return the new cart. However many edits there are this is one
+    # query for the current quantities, one statement moving the stock holds (which is the stock check)
+    # and one statement writing the cart; a batch that doesn't fit the stock changes nothing
+    def write_cart_batch(uid, parsed):
+        with app.db.begin():
+            quantities = CartDAL.get_quantities(uid, list({product_id for product_id, _, _ in parsed}))
+            for product_id, kind, value in parsed:
+                if product_id not in quantities:
+                    raise Exception(f"Product {product_id} not found")
+                if kind == 'delta':
+                    quantities[product_id] = max(0, quantities[product_id] + value)
+                elif kind == 'set':
+                    quantities[product_id] = value
+                else:
+                    quantities[product_id] = 0
+            product_ids = list(quantities)
+            new_quantities = [quantities[product_id] for product_id in product_ids]
+            short = StockHold.set_holds(uid, product_ids, new_quantities)
+            if short:
+                raise Exception(f"Out of Stock :( (products {', '.join(map(str, sorted(short)))})")
+            CartDAL.set_quantities(uid, product_ids, new_quantities)
+            return CartManager.get_cart_for_user(uid)
 
-        return CartDAL.place_order(total_price, uid)
+    @staticmethod
+    def place_order(uid):
+        # stock and balance are checked inside the checkout transaction itself (mostly by converting
+        # the cart's holds), checking them here first would only race other orders
+        return CartDAL.place_order(uid)
@@ -0,0 +1,142 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+from decimal import Decimal
+
+try:
+    import redis
+except ImportError:
+    # optional, only needed when CATALOG_CACHE_REDIS_URL is set
+    redis = None
+
+# Read-through cache for catalog reads (product pages, listings, category pages), see
+# ProductCatalog and ProductListing. Two tiers:
+#   - an in-process LRU of CATALOG_CACHE_SIZE entries, each kept CATALOG_CACHE_SECONDS
+#   - optionally a Redis (or anything speaking its protocol) at CATALOG_CACHE_REDIS_URL shared by
+#     all worker processes, checked when the LRU misses
+# Entries are keyed by namespace (which query) + its parameters, and the callers put the
+# ContentVersion of what they read into the parameters, so any write that bumps the version
+# (seller, review and checkout paths) makes every worker miss and reload; superseded entries just
+# age out. The Seller write paths also call invalidate(product_name), which frees this process's
+# entries for the product and its category pages right away.
+# Redis holds JSON, never pickles (anyone able to write to the Redis could otherwise run code in
+# every worker): callers pass encode/decode to turn their value into JSON types and back (the
+# models through to_dict()), and Decimals are tagged so prices come back as Decimals.
+
+# namespaces cached per product (their params start with the product_name), see invalidate
+PRODUCT_NAMESPACES = ('product', 'listings')
+
+
+def encode_json(value):
+    if isinstance(value, Decimal):
+        return {'__decimal__': str(value)}
+    raise TypeError(f"{type(value).__name__} can't go into the catalog cache")
+
+
+def decode_json(obj):
+    if len(obj) == 1 and '__decimal__' in obj:
+        return Decimal(obj['__decimal__'])
+    return obj
+
+
+class CatalogCache:
+    def __init__(self, max_entries, ttl, redis_url=None):
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()  # key -> (expiry on the time.monotonic() clock, value)
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.counters = {'hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0,
+                         'redis_hits': 0, 'redis_errors': 0}
+        self.redis = None
+        if redis_url:
+            if redis is None:
+                print("CATALOG_CACHE_REDIS_URL is set but the redis package is not installed, using the LRU only")
+            else:
+                self.redis = redis.Redis.from_url(redis_url)
+
+    @staticmethod
+    def make_key(namespace, params):
+        return f"{namespace}:{json.dumps(params, default=str, sort_keys=True)}"
+
+    def count(self, counter):
+        with self.lock:
+            self.counters[counter] += 1
+
+    # the cached result of loader() for namespace + params, calling it on a miss. encode(value)
+    # gives the JSON types stored in redis and decode(stored) rebuilds the value from them
+    def get_or_load(self, namespace, params, loader, encode=None, decode=None):
+        if self.ttl <= 0:
+            return loader()
+        key = CatalogCache.make_key(namespace, params)
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] > now:
+                self.entries.move_to_end(key)
+                self.counters['hits'] += 1
+                return entry[1]
+        value = self.redis_get(key, decode)
+        if value is None:
+            self.count('misses')
+            value = loader()
+            self.redis_set(key, value, encode)
+        else:
+            self.count('redis_hits')
+        self.store(key, value, now)
+        return value
+
+    def store(self, key, value, now):
+        with self.lock:
+            self.entries[key] = (now + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.counters['evictions'] += 1
+
+    # a product or one of its listings changed: drop its entries (keyed by [product_name, ...])
+    # and every category page, which can all change order with one price
+    def invalidate(self, product_name):
+        prefixes = tuple(f"{namespace}:{json.dumps([product_name])[:-1]}," for namespace in PRODUCT_NAMESPACES)
+        with self.lock:
+            self.counters['invalidations'] += 1
+            for key in [key for key in self.entries
+                        if key.startswith(prefixes) or key.split(':', 1)[0] not in PRODUCT_NAMESPACES]:
+                del self.entries[key]
+
+    @staticmethod
+    def redis_key(key):
+        return f"catalog:{key}"
+
+    def redis_get(self, key, decode=None):
+        if self.redis is None:
+            return None
+        try:
+            value = self.redis.get(CatalogCache.redis_key(key))
+            if value is None:
+                return None
+            value = json.loads(value, object_hook=decode_json)
+            return decode(value) if decode is not None else value
+        except Exception as e:
+            self.count('redis_errors')
+            print(f"Failed to read catalog cache from redis: {e}")
+            return None
+
+    def redis_set(self, key, value, encode=None):
+        if self.redis is None:
+            return
+        try:
+            stored = encode(value) if encode is not None else value
+            self.redis.setex(CatalogCache.redis_key(key), self.ttl, json.dumps(stored, default=encode_json))
+        except Exception as e:
+            self.count('redis_errors')
+            print(f"Failed to write catalog cache to redis: {e}")
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counters)
+            stats['entries'] = len(self.entries)
+        lookups = stats['hits'] + stats['redis_hits'] + stats['misses']
+        stats['hit_ratio'] = round((stats['hits'] + stats['redis_hits']) / lookups, 3) if lookups else 0
+        stats['redis'] = self.redis is not None
+        return stats
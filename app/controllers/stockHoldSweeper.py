@@ -0,0 +1,36 @@
+import threading
+
+from app.models.stock_hold import StockHold
+
+# Background thread releasing expired cart holds (see app/models/stock_hold.py) every
+# STOCK_HOLD_SWEEP_SECONDS, STOCK_HOLD_SWEEP_BATCH holds per statement. Every worker process runs
+# one; sweeps skip holds another sweep has locked, so they don't step on each other.
+# `flask holds sweep` does the same once, for running from cron with the thread turned off.
+
+class StockHoldSweeper:
+    def __init__(self, app):
+        self.app = app
+        self.interval = app.config['STOCK_HOLD_SWEEP_SECONDS']
+        self.batch_size = app.config['STOCK_HOLD_SWEEP_BATCH']
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self):
+        if self.interval <= 0 or self.thread is not None:
+            return
+        self.thread = threading.Thread(target=self.run, name='stock-hold-sweeper', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            with self.app.app_context():
+                try:
+                    released = StockHold.sweep_all(self.batch_size)
+                    if released:
+                        print(f"Released {released} expired stock holds")
+                except Exception as e:
+                    # try again next round
+                    print(f"Failed to sweep stock holds: {e}")
@@ -0,0 +1,85 @@
+import bisect
+import heapq
+import threading
+import time
+
+from app.models.productCatalog import ProductCatalog
+
+# In-memory typeahead index over catalog product names and categories for /products/suggest.
+# It is loaded from the database when the app starts, patched in place when sellers add or edit
+# catalog entries, and fully reloaded every SUGGEST_REFRESH_SECONDS so purchase counts (and writes
+# handled by other worker processes) catch up. Lookups never touch the database.
+#
+# Every word position of a name is a key ("lush dill" and "dill" both point at "Lush Dill"), kept in
+# one sorted list so a prefix lookup is a bisect plus a short scan.
+
+class SuggestionIndex:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.keys = []      # sorted (key, name) pairs
+        self.entries = {}   # name -> suggestion dict, see make_entry
+        self.loaded_at = None
+
+    @staticmethod
+    def make_entry(name, category, weight, type):
+        return {'name': name, 'category': category, 'weight': weight, 'type': type}
+
+    @staticmethod
+    def keys_for(name):
+        words = name.lower().split()
+        return [(" ".join(words[i:]), name) for i in range(len(words))]
+
+    # rebuild the whole index from the catalog
+    def reload(self):
+        entries = {}
+        category_weights = {}
+        for product_name, category, total_purchases in ProductCatalog.get_suggestion_rows():
+            entries[product_name] = SuggestionIndex.make_entry(product_name, category, total_purchases, 'product')
+            category_weights[category] = category_weights.get(category, 0) + total_purchases
+        for category, weight in category_weights.items():
+            if category not in entries:
+                entries[category] = SuggestionIndex.make_entry(category, category, weight, 'category')
+        keys = sorted(key for name in entries for key in SuggestionIndex.keys_for(name))
+        with self.lock:
+            self.entries = entries
+            self.keys = keys
+            self.loaded_at = time.monotonic()
+
+    def is_stale(self, max_age):
+        return self.loaded_at is None or time.monotonic() - self.loaded_at > max_age
+
+    # a product was added to the catalog
+    def add(self, name, category):
+        with self.lock:
+            if name in self.entries:
+                self.entries[name]['category'] = category
+                return
+            self.entries[name] = SuggestionIndex.make_entry(name, category, 0, 'product')
+            # suggest() scans self.keys without the lock, so insert into a copy and swap it in
+            # like reload() does instead of shifting the list under a reader
+            keys = list(self.keys)
+            for key in SuggestionIndex.keys_for(name):
+                bisect.insort(keys, key)
+            self.keys = keys
+
+    # a catalog entry was edited (the name itself never changes)
+    def update(self, name, category):
+        with self.lock:
+            entry = self.entries.get(name)
+            if entry is not None:
+                entry['category'] = category
+
+    # top k names or categories with a word starting with prefix, most purchased first
+    def suggest(self, prefix, k=8):
+        prefix = " ".join(prefix.lower().split())
+        if not prefix:
+            return []
+        keys, entries = self.keys, self.entries
+        matches = set()
+        i = bisect.bisect_left(keys, (prefix,))
+        while i < len(keys) and keys[i][0].startswith(prefix):
+            matches.add(keys[i][1])
+            i += 1
+        best = heapq.nlargest(k, (entries[name] for name in matches if name in entries),
+                              key=lambda entry: (entry['weight'], entry['type'] == 'category'))
+        return [{'name': e['name'], 'category': e['category'], 'type': e['type']} for e in best]
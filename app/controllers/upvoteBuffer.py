@@ -0,0 +1,155 @@
+import atexit
+import threading
+
+from app.models.product_review_upvote import ProductReviewUpvote
+from app.models.seller_review_upvote import SellerReviewUpvote
+
+# In-memory buffer for review upvote clicks. Instead of one INSERT/DELETE transaction per click,
+# ProductReviewUpvote/SellerReviewUpvote record what the voter wants (upvoted or not) here; repeated
+# toggles of the same (review, voter) collapse into the last one, and a background thread writes
+# everything collected in one statement per kind (apply_upvotes) every UPVOTE_FLUSH_MS, or as soon
+# as UPVOTE_FLUSH_EVENTS toggles are waiting. Nothing is written for a toggle that ends where it
+# started. The count and "did I upvote" endpoints put the toggles that aren't committed yet on top
+# of what they read (overlay), so a voter sees their click right away; review listings and their
+# ETags catch up with the flush, which bumps the product's ContentVersion.
+# Each worker process has its own buffer, a crash loses at most one interval of clicks.
+# Read-your-writes only holds within one worker: with several gunicorn workers a voter's next
+# request may land on a worker that hasn't seen the click and shows the stored state until the
+# flush (at most UPVOTE_FLUSH_MS later). Deployments that need the click to show on every reload
+# route a user's requests to the same worker (sticky sessions on the session cookie) or run a
+# single worker; UPVOTE_FLUSH_MS=0 gives the same answer everywhere at the cost of the batching.
+# UPVOTE_FLUSH_MS=0 turns the buffer off and every click is written on its own again.
+
+MODELS = {'product': ProductReviewUpvote, 'seller': SellerReviewUpvote}
+
+
+class UpvoteBuffer:
+    def __init__(self, app):
+        self.app = app
+        self.interval = app.config['UPVOTE_FLUSH_MS'] / 1000
+        self.max_events = app.config['UPVOTE_FLUSH_EVENTS']
+        # turned on by start(), until then (and in CLI commands) clicks are written directly
+        self.enabled = False
+        self.lock = threading.Lock()
+        # kind -> review key -> voter_id -> upvoted. pending collects new clicks, flushing holds the
+        # batch being written until it committed so overlay() still sees it meanwhile
+        self.pending = {kind: {} for kind in MODELS}
+        self.flushing = {kind: {} for kind in MODELS}
+        self.size = 0
+        self.counters = {'events': 0, 'coalesced': 0, 'flushes': 0, 'flushed_rows': 0, 'flush_errors': 0,
+                         'dropped': 0}
+        self.wake = threading.Event()
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self):
+        if self.interval <= 0 or self.thread is not None:
+            return
+        self.enabled = True
+        self.thread = threading.Thread(target=self.run, name='upvote-buffer', daemon=True)
+        self.thread.start()
+        # write what is left when the worker shuts down
+        atexit.register(self.stop)
+
+    def stop(self, timeout=10):
+        self.stopped.set()
+        self.wake.set()
+        # let a flush in progress finish first, two at once would clobber each other's flushing
+        if self.thread is not None:
+            self.thread.join(timeout)
+            if self.thread.is_alive():
+                print(f"Upvote flush still running after {timeout}s, not flushing {self.size} pending clicks")
+                return
+        with self.app.app_context():
+            self.flush()
+
+    def run(self):
+        while not self.stopped.is_set():
+            self.wake.wait(self.interval)
+            self.wake.clear()
+            with self.app.app_context():
+                self.flush()
+
+    # voter_id now wants the review (upvoted=True) or not
+    def record(self, kind, review, voter_id, upvoted):
+        with self.lock:
+            voters = self.pending[kind].setdefault(review, {})
+            if voter_id in voters:
+                self.counters['coalesced'] += 1
+            else:
+                self.size += 1
+            voters[voter_id] = upvoted
+            self.counters['events'] += 1
+            full = self.size >= self.max_events
+        if full:
+            self.wake.set()
+
+    # forget the clicks waiting for a review that is being deleted
+    def discard(self, kind, review):
+        with self.lock:
+            self.size -= len(self.pending[kind].pop(review, {}))
+
+    # voter_id -> upvoted of the review's clicks that may not be in the database yet
+    def overlay(self, kind, review):
+        with self.lock:
+            voters = dict(self.flushing[kind].get(review, {}))
+            voters.update(self.pending[kind].get(review, {}))
+        return voters
+
+    # a stored count adjusted by the overlay, stored_voters being which of the overlay's voters
+    # have an upvote stored (read in the same statement as the count)
+    @staticmethod
+    def adjust_count(upvote_count, stored_voters, overlay):
+        for voter_id, upvoted in overlay.items():
+            if upvoted and voter_id not in stored_voters:
+                upvote_count += 1
+            elif not upvoted and voter_id in stored_voters:
+                upvote_count -= 1
+        return upvote_count
+
+    def flush(self):
+        with self.lock:
+            batches, self.pending = self.pending, {kind: {} for kind in MODELS}
+            self.flushing = batches
+            self.size = 0
+        try:
+            for kind, reviews in batches.items():
+                if reviews:
+                    self.write(kind, reviews)
+        finally:
+            with self.lock:
+                self.flushing = {kind: {} for kind in MODELS}
+
+    def write(self, kind, reviews):
+        # (review key..., voter_id, upvoted) sorted so concurrent flushes lock rows in the same order
+        rows = sorted(review + (voter_id, upvoted)
+                      for review, voters in reviews.items()
+                      for voter_id, upvoted in voters.items())
+        model = MODELS[kind]
+        try:
+            model.apply_upvotes(rows)
+            self.count(flushes=1, flushed_rows=len(rows))
+            return
+        except Exception as e:
+            self.count(flush_errors=1)
+            print(f"Failed to flush {len(rows)} {kind} review upvotes, writing them one by one: {e}")
+        # one bad row (e.g. a review deleted meanwhile) shouldn't cost the others
+        for row in rows:
+            try:
+                model.apply_upvotes([row])
+                self.count(flushed_rows=1)
+            except Exception as e:
+                self.count(dropped=1)
+                print(f"Dropped {kind} review upvote {row}: {e}")
+
+    def count(self, **increments):
+        with self.lock:
+            for counter, increment in increments.items():
+                self.counters[counter] += increment
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counters)
+            stats['pending'] = self.size
+        stats['enabled'] = self.enabled
+        return stats
@@ -1,4 +1,200 @@
-from sqlalchemy import create_engine, text
+import hashlib
+import random
+import re
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from flask import current_app, g, has_app_context, has_request_context
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+
+# SQLSTATEs of transactions postgres aborted because of concurrent ones;
+# rerunning the whole transaction is expected to succeed
+RETRYABLE_SQLSTATES = {'40001',  # serialization_failure
+                       '40P01'}  # deadlock_detected
+
+# upper bounds (ms) of the statement duration histogram buckets
+QUERY_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, float('inf'))
+# distinct fingerprints tracked per worker, statements beyond that are counted under 'other'
+MAX_QUERY_FINGERPRINTS = 1000
+
+STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+NUMBER_LITERAL = re.compile(r'\b\d+(?:\.\d+)?\b')
+LITERAL_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+WHITESPACE = re.compile(r'\s+')
+
+
+class PoolMetrics:
+    """Counters for connection checkouts from the engine pool.
+
+    wait is the time spent getting a connection out of the pool (which
+    includes opening a new one and the pre-ping); overflow_checkouts
+    counts checkouts that needed a connection beyond pool_size, and
+    timeouts counts checkouts that gave up after pool_timeout.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.checkouts = 0
+        self.overflow_checkouts = 0
+        self.timeouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def record_checkout(self, wait, overflow):
+        with self.lock:
+            self.checkouts += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+            if overflow:
+                self.overflow_checkouts += 1
+
+    def record_timeout(self):
+        with self.lock:
+            self.timeouts += 1
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'checkouts': self.checkouts,
+                'overflow_checkouts': self.overflow_checkouts,
+                'timeouts': self.timeouts,
+                'avg_wait_ms': round(1000 * self.total_wait / self.checkouts, 3) if self.checkouts else 0,
+                'max_wait_ms': round(1000 * self.max_wait, 3)
+            }
+
+
+class QueryStats:
+    """Counters per statement fingerprint for every statement run on the engine.
+
+    The fingerprint is the statement with whitespace collapsed and literals
+    replaced by ? (bound parameters already are placeholders), so each DAL
+    query is one entry however often and with whatever values it runs. An
+    entry has the calls, total and max duration, a duration histogram
+    (QUERY_BUCKETS_MS), the rows returned, the connection wait its
+    statements paid (the first statement after a pool checkout carries that
+    checkout's wait) and the DAL methods that ran it. Statements taking at
+    least slow_ms are printed to the slow query log.
+    """
+    def __init__(self, slow_ms):
+        self.lock = threading.Lock()
+        self.slow_ms = slow_ms
+        self.entries = {}
+        # statement text -> (fingerprint, normalized text), the same strings come back all the time
+        self.normalized = {}
+        self.slow_queries = 0
+        self.since = time.time()
+
+    def fingerprint(self, statement):
+        known = self.normalized.get(statement)
+        if known is not None:
+            return known
+        normalized = STRING_LITERAL.sub('?', statement)
+        normalized = NUMBER_LITERAL.sub('?', normalized)
+        normalized = LITERAL_LIST.sub('(...)', normalized)
+        normalized = WHITESPACE.sub(' ', normalized).strip()
+        known = (hashlib.md5(normalized.encode()).hexdigest()[:12], normalized)
+        if len(self.normalized) < 4 * MAX_QUERY_FINGERPRINTS:
+            self.normalized[statement] = known
+        return known
+
+    def record(self, statement, caller, duration, rows, wait):
+        fingerprint, normalized = self.fingerprint(statement)
+        ms = 1000 * duration
+        bucket = next(i for i, bound in enumerate(QUERY_BUCKETS_MS) if ms <= bound)
+        slow = self.slow_ms and ms >= self.slow_ms
+        with self.lock:
+            entry = self.entries.get(fingerprint)
+            if entry is None:
+                if len(self.entries) >= MAX_QUERY_FINGERPRINTS:
+                    fingerprint, normalized = 'other', '(statements past MAX_QUERY_FINGERPRINTS)'
+                    entry = self.entries.get(fingerprint)
+                if entry is None:
+                    entry = self.entries[fingerprint] = {
+                        'statement': normalized, 'calls': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'rows': 0,
+                        'wait_ms': 0.0, 'buckets': [0] * len(QUERY_BUCKETS_MS), 'callers': {}
+                    }
+            entry['calls'] += 1
+            entry['total_ms'] += ms
+            entry['max_ms'] = max(entry['max_ms'], ms)
+            entry['rows'] += rows
+            entry['wait_ms'] += 1000 * wait
+            entry['buckets'][bucket] += 1
+            entry['callers'][caller] = entry['callers'].get(caller, 0) + 1
+            if slow:
+                self.slow_queries += 1
+        if slow:
+            print(f"Slow query {ms:.1f}ms in {caller} ({rows} rows, fingerprint {fingerprint}): {normalized}")
+
+    @staticmethod
+    # upper bound of the histogram bucket the q-quantile falls in
+    def quantile(buckets, calls, q):
+        seen = 0
+        for bound, count in zip(QUERY_BUCKETS_MS, buckets):
+            seen += count
+            if seen >= q * calls:
+                return bound if bound != float('inf') else None
+        return None
+
+    def report(self, sort='total', limit=20):
+        """The entries sorted by sort (total, avg, max or calls), busiest first,
+        with the overall totals since the worker started."""
+        with self.lock:
+            entries = [(fingerprint, dict(entry, buckets=list(entry['buckets']), callers=dict(entry['callers'])))
+                       for fingerprint, entry in self.entries.items()]
+            slow_queries = self.slow_queries
+        key = {
+            'total': lambda entry: entry['total_ms'],
+            'avg': lambda entry: entry['total_ms'] / entry['calls'],
+            'max': lambda entry: entry['max_ms'],
+            'calls': lambda entry: entry['calls'],
+        }.get(sort, lambda entry: entry['total_ms'])
+        entries.sort(key=lambda item: key(item[1]), reverse=True)
+        total_ms = sum(entry['total_ms'] for _, entry in entries)
+        queries = []
+        for fingerprint, entry in entries[:limit]:
+            calls = entry['calls']
+            queries.append({
+                'fingerprint': fingerprint,
+                'statement': entry['statement'],
+                'callers': dict(sorted(entry['callers'].items(), key=lambda item: -item[1])),
+                'calls': calls,
+                'total_ms': round(entry['total_ms'], 3),
+                'share': round(entry['total_ms'] / total_ms, 4) if total_ms else 0,
+                'avg_ms': round(entry['total_ms'] / calls, 3),
+                'p50_ms': self.quantile(entry['buckets'], calls, 0.5),
+                'p95_ms': self.quantile(entry['buckets'], calls, 0.95),
+                'max_ms': round(entry['max_ms'], 3),
+                'rows_per_call': round(entry['rows'] / calls, 1),
+                'wait_ms': round(entry['wait_ms'], 3),
+                'histogram': {f"<={bound}ms" if bound != float('inf') else 'more': count
+                              for bound, count in zip(QUERY_BUCKETS_MS, entry['buckets']) if count}
+            })
+        return {
+            'since': self.since,
+            'statements': sum(entry['calls'] for _, entry in entries),
+            'fingerprints': len(entries),
+            'total_ms': round(total_ms, 3),
+            'slow_ms': self.slow_ms,
+            'slow_queries': slow_queries,
+            'queries': queries
+        }
+
+
+def query_caller():
+    """Class.method (or module.function) of the innermost app frame outside
+    this module, i.e. the DAL method that ran the statement."""
+    frame = sys._getframe(1)
+    while frame is not None:
+        module = frame.f_globals.get('__name__', '')
+        if module.startswith('app.') and module != __name__:
+            name = frame.f_code.co_qualname
+            return name if '.' in name else f"{module.rsplit('.', 1)[-1]}.{name}"
+        frame = frame.f_back
+    return '?'
 
 
 class DB:
@@ -10,17 +206,185 @@ class DB:
     If you want to execute multiple SQL statements in the same
     transaction, use the following pattern:
 
-    >>> with app.db.engine.begin() as conn:
+    >>> with app.db.begin() as conn:
     >>>     # everything in this block executes as one transaction
     >>>     value = conn.execute(text('SELECT...'), bar='foo').first()[0]
     >>>     conn.execute(text('INSERT...'), par=value)
-    >>>     conn.execute(text('UPDATE...'), par=value)
+    >>>     app.db.execute('UPDATE...', par=value)  # also joins the transaction
     >>>
 
+    Transactions run at SERIALIZABLE, so postgres may abort one that
+    raced another; decorate the function holding the begin() block
+    with @retry_serializable() to rerun it a bounded number of times.
+
+    A route decorated with @unit_of_work() runs all of its statements
+    (execute() calls and begin() blocks) on one connection in one
+    transaction, opened by its first statement, committed when the view
+    returns and rolled back if it raises. unit_of_work(read_only=True) runs that transaction READ ONLY
+    at READ COMMITTED instead of SERIALIZABLE.
+
+    Pool sizing and the statement timeout come from Config (DB_POOL_*,
+    DB_STATEMENT_TIMEOUT_MS); pool_stats() reports how the pool is used.
+
+    With DB_QUERY_STATS every statement on the engine (execute() as well as
+    conn.execute() in begin() blocks) is timed into QueryStats, see
+    query_report(); statements over DB_SLOW_QUERY_MS are logged, and each
+    response gets a Server-Timing header with its database time.
     """
     def __init__(self, app):
-        self.engine = create_engine(app.config['SQLALCHEMY_DATABASE_URI'], 
-                                    execution_options={"isolation_level": "SERIALIZABLE"})
+        config = app.config
+        connect_args = {}
+        if config.get('DB_STATEMENT_TIMEOUT_MS'):
+            connect_args['options'] = f"-c statement_timeout={int(config['DB_STATEMENT_TIMEOUT_MS'])}"
+        self.max_overflow = config.get('DB_MAX_OVERFLOW', 10)
+        self.engine = create_engine(app.config['SQLALCHEMY_DATABASE_URI'],
+                                    execution_options={"isolation_level": "SERIALIZABLE"},
+                                    pool_size=config.get('DB_POOL_SIZE', 5),
+                                    max_overflow=self.max_overflow,
+                                    pool_timeout=config.get('DB_POOL_TIMEOUT', 30),
+                                    pool_recycle=config.get('DB_POOL_RECYCLE', -1),
+                                    pool_pre_ping=config.get('DB_POOL_PRE_PING', False),
+                                    connect_args=connect_args)
+        self.metrics = PoolMetrics()
+        self.retry_lock = threading.Lock()
+        self.serialization_retries = 0
+        self.serialization_failures = 0
+        # release a request transaction the view didn't get to finish (it raised)
+        app.teardown_request(self.end_request_transaction)
+        self.query_stats = None
+        if config.get('DB_QUERY_STATS', True):
+            self.query_stats = QueryStats(config.get('DB_SLOW_QUERY_MS', 0))
+            event.listen(self.engine, 'before_cursor_execute', self.before_cursor_execute)
+            event.listen(self.engine, 'after_cursor_execute', self.after_cursor_execute)
+            event.listen(self.engine, 'handle_error', self.statement_failed)
+            app.after_request(self.add_server_timing)
+
+    def connect(self):
+        """Check a connection out of the pool, recording the wait in self.metrics."""
+        start = time.perf_counter()
+        try:
+            conn = self.engine.connect()
+        except PoolTimeoutError:
+            self.metrics.record_timeout()
+            raise
+        wait = time.perf_counter() - start
+        pool = self.engine.pool
+        self.metrics.record_checkout(wait, pool.checkedout() > pool.size())
+        # charged to the first statement on the connection, see QueryStats
+        conn.info['checkout_wait'] = wait
+        return conn
+
+    # engine events timing every statement into query_stats
+
+    @staticmethod
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+    def after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        duration = time.perf_counter() - conn.info['query_start'].pop()
+        wait = conn.info.pop('checkout_wait', 0.0)
+        rows = max(cursor.rowcount, 0)
+        self.query_stats.record(statement, query_caller(), duration, rows, wait)
+        if has_request_context():
+            timing = g.setdefault('db_timing', [0, 0.0, 0.0])
+            timing[0] += 1
+            timing[1] += duration
+            timing[2] += wait
+
+    @staticmethod
+    def statement_failed(context):
+        # the statement raised, so after_cursor_execute won't pop its start time
+        conn = context.connection
+        if conn is not None and conn.info.get('query_start'):
+            conn.info['query_start'].pop()
+
+    @staticmethod
+    def add_server_timing(response):
+        """Database time of the request for the browser's network panel: db is the
+        time spent in statements, db-wait the time spent getting connections."""
+        timing = g.get('db_timing')
+        if timing is not None:
+            statements, duration, wait = timing
+            response.headers.add('Server-Timing', f'db;dur={1000 * duration:.1f};desc="{statements} queries"')
+            response.headers.add('Server-Timing', f'db-wait;dur={1000 * wait:.1f}')
+        return response
+
+    def start_request_transaction(self, read_only=False):
+        """Make the rest of the current request run in one transaction, see
+        unit_of_work. The connection is only checked out by the first
+        statement, so a request answered from a cache never takes one."""
+        if 'db_request' not in g:
+            g.db_request = read_only
+
+    def open_request_transaction(self):
+        conn = self.connect()
+        if g.db_request:
+            conn = conn.execution_options(isolation_level="READ COMMITTED", postgresql_readonly=True)
+        g.db_transaction = (conn, conn.begin())
+        g.db_connection = conn
+        return conn
+
+    def end_request_transaction(self, exc=None):
+        """Commit (or on exc, roll back) the request transaction if there is
+        one and return its connection to the pool. A failed commit raises."""
+        g.pop('db_request', None)
+        if 'db_transaction' not in g:
+            return
+        conn, transaction = g.pop('db_transaction')
+        g.pop('db_connection', None)
+        try:
+            if exc is None:
+                transaction.commit()
+            else:
+                transaction.rollback()
+        finally:
+            conn.close()
+
+    def current_connection(self):
+        """The connection of the transaction currently open in this app
+        context (a begin() block or a unit_of_work request), if any."""
+        if not has_app_context():
+            return None
+        conn = g.get('db_connection')
+        if conn is None and 'db_request' in g and 'db_transaction' not in g:
+            conn = self.open_request_transaction()
+        return conn
+
+    def in_transaction(self):
+        """Whether statements run now would join an outer transaction (a begin()
+        block or a unit_of_work request), without opening the request's one."""
+        return has_app_context() and (g.get('db_connection') is not None or 'db_request' in g)
+
+    @contextmanager
+    def begin(self):
+        """Run a block of statements as one transaction on one pooled connection
+        (committed on success, rolled back on an exception). execute() calls
+        made inside the block run on the same connection. Nested in another
+        begin() block or a unit_of_work request, the block becomes a
+        savepoint of that transaction."""
+        conn = self.current_connection()
+        if conn is not None:
+            with conn.begin_nested():
+                yield conn
+            return
+        with self.connect() as conn:
+            with conn.begin():
+                if not has_app_context():
+                    yield conn
+                    return
+                g.db_connection = conn
+                try:
+                    yield conn
+                finally:
+                    g.pop('db_connection', None)
+
+    @contextmanager
+    def begin_maintenance(self):
+        """begin() without DB_STATEMENT_TIMEOUT_MS, for the rebuild and check
+        commands whose whole-table statements take longer than a request may."""
+        with self.begin() as conn:
+            conn.execute(text('SET LOCAL statement_timeout = 0'))
+            yield conn
 
     def execute(self, sqlstr, **kwargs):
         """Execute a single SQL statement sqlstr.
@@ -38,9 +402,115 @@ class DB:
         for additional details.  See models/*.py for examples of
         calling this function.
         """
-        with self.engine.begin() as conn:
-            result = conn.execute(text(sqlstr), kwargs)
-            if result.returns_rows:
-                return result.fetchall()
+        conn = self.current_connection()
+        if conn is not None:
+            return self.run(conn, sqlstr, kwargs)
+        with self.begin() as conn:
+            return self.run(conn, sqlstr, kwargs)
+
+    def execute_dicts(self, sqlstr, **kwargs):
+        """Execute a query like execute(), but return each row as a dict
+        keyed by column name, for results that go straight to jsonify()
+        without a model object per row."""
+        conn = self.current_connection()
+        if conn is not None:
+            return self.run_dicts(conn, sqlstr, kwargs)
+        with self.begin() as conn:
+            return self.run_dicts(conn, sqlstr, kwargs)
+
+    @staticmethod
+    def run_dicts(conn, sqlstr, params):
+        result = conn.execute(text(sqlstr), params)
+        keys = list(result.keys())
+        return [dict(zip(keys, row)) for row in result]
+
+    @staticmethod
+    def run(conn, sqlstr, params):
+        result = conn.execute(text(sqlstr), params)
+        if result.returns_rows:
+            return result.fetchall()
+        else:
+            return result.rowcount
+
+    def pool_stats(self):
+        """Current pool occupancy plus the checkout counters, for sizing
+        workers against Postgres max_connections."""
+        pool = self.engine.pool
+        stats = {
+            'pool_size': pool.size(),
+            'max_overflow': self.max_overflow,
+            'checked_out': pool.checkedout(),
+            'checked_in': pool.checkedin(),
+            'overflow': max(pool.overflow(), 0)
+        }
+        stats.update(self.metrics.snapshot())
+        return stats
+
+    def query_report(self, sort='total', limit=20):
+        """The limit busiest statement fingerprints of this worker, see QueryStats.report()."""
+        if self.query_stats is None:
+            return {'enabled': False}
+        return self.query_stats.report(sort, limit)
+
+    def record_retry(self, gave_up):
+        with self.retry_lock:
+            if gave_up:
+                self.serialization_failures += 1
             else:
-                return result.rowcount
+                self.serialization_retries += 1
+
+    def transaction_stats(self):
+        """How often retry_serializable reran a transaction, and how often it
+        ran out of attempts."""
+        with self.retry_lock:
+            return {
+                'serialization_retries': self.serialization_retries,
+                'serialization_failures': self.serialization_failures
+            }
+
+
+def is_serialization_failure(e):
+    return isinstance(e, DBAPIError) and getattr(e.orig, 'pgcode', None) in RETRYABLE_SQLSTATES
+
+
+def unit_of_work(read_only=False):
+    """Route decorator: run every statement of the request on one connection
+    in one transaction (see DB). Use read_only=True for endpoints that only
+    read, so they run at READ COMMITTED without serializable overhead."""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            db = current_app.db
+            db.start_request_transaction(read_only)
+            response = view(*args, **kwargs)
+            db.end_request_transaction()
+            return response
+        return wrapper
+    return decorator
+
+
+def retry_serializable(max_attempts=None):
+    """Rerun the decorated function when postgres aborts its transaction
+    with a serialization failure (or deadlock), up to max_attempts times
+    (Config DB_SERIALIZATION_ATTEMPTS by default) with a short randomized
+    backoff. The function must own its transaction, i.e. do all its work
+    in one app.db.begin() block; when it is called inside an already open
+    transaction a retry cannot help, so the error is raised right away."""
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            db = current_app.db
+            attempts = max_attempts or current_app.config.get('DB_SERIALIZATION_ATTEMPTS', 5)
+            for attempt in range(1, attempts + 1):
+                try:
+                    return fn(*args, **kwargs)
+                except DBAPIError as e:
+                    if not is_serialization_failure(e) or db.in_transaction():
+                        raise
+                    if attempt == attempts:
+                        db.record_retry(gave_up=True)
+                        raise
+                    db.record_retry(gave_up=False)
+                    time.sleep(random.uniform(0, 0.01 * 2 ** attempt))
+        return wrapper
+    return decorator
@@ -0,0 +1,35 @@
+from flask import current_app as app
+from flask import jsonify, request, Blueprint
+
+# Operational endpoints for monitoring the running app. They have no authentication and show
+# internals (e.g. SQL text and call sites), so they are only registered with DEBUG_ENDPOINTS=true;
+# keep them off public deployments or behind a proxy that restricts /debug/
+bp = Blueprint('debug', __name__)
+
+# Connection pool occupancy and checkout wait/overflow/timeout counters for this worker
+@bp.route('/debug/pool', methods=['GET'])
+def pool_stats():
+    return jsonify(app.db.pool_stats()), 200
+
+# Time spent per SQL statement fingerprint in this worker, busiest first
+# (?sort=total|avg|max|calls, ?limit=20)
+@bp.route('/debug/queries', methods=['GET'])
+def query_stats():
+    sort = request.args.get('sort', 'total')
+    limit = request.args.get('limit', 20, type=int)
+    return jsonify(app.db.query_report(sort, limit)), 200
+
+# Serialization failure retries of SERIALIZABLE transactions in this worker
+@bp.route('/debug/transactions', methods=['GET'])
+def transaction_stats():
+    return jsonify(app.db.transaction_stats()), 200
+
+# Hit/miss/eviction counters of the catalog read cache in this worker
+@bp.route('/debug/cache', methods=['GET'])
+def cache_stats():
+    return jsonify(app.catalog_cache.stats()), 200
+
+# Buffered/coalesced/flushed review upvote clicks in this worker
+@bp.route('/debug/upvotes', methods=['GET'])
+def upvote_stats():
+    return jsonify(app.upvote_buffer.stats()), 200
@@ -0,0 +1,32 @@
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    # optional, without it every response goes through the stdlib encoder
+    orjson = None
+
+# JSON provider behind every jsonify() call. The payloads are plain dicts and lists out of the models
+# (product.to_dict(), hand-built order dicts) full of Decimal prices and datetimes, so with orjson
+# installed the compact responses are encoded by it. The output stays what the stdlib provider
+# produces: keys sorted, Decimal as a string and dates in HTTP date format (DefaultJSONProvider.default
+# handles those, orjson is told to hand them over instead of writing ISO dates). Indented output
+# (debug mode) and anything orjson refuses, such as ints beyond 64 bits, go to the stdlib encoder.
+class FastJSONProvider(DefaultJSONProvider):
+    # the arguments DefaultJSONProvider.response passes for compact output
+    COMPACT_ARGS = ({}, {'separators': (',', ':')})
+
+    def __init__(self, app):
+        super().__init__(app)
+        self.fast = orjson is not None and app.config.get('JSON_FAST', True)
+
+    def dumps(self, obj, **kwargs):
+        if self.fast and kwargs in FastJSONProvider.COMPACT_ARGS:
+            option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+            if self.sort_keys:
+                option |= orjson.OPT_SORT_KEYS
+            try:
+                return orjson.dumps(obj, default=self.default, option=option).decode()
+            except TypeError:
+                pass
+        return super().dumps(obj, **kwargs)
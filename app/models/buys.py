@@ -2,6 +2,8 @@
 from flask import current_app as app
 
 class Buys: 
+    __slots__ = ('buyer_id', 'purchase_id', 'at_balance')
+
     # INIT: Initialize a Buys object
     def __init__(self, buyer_id, purchase_id, at_balance):
         self.buyer_id = buyer_id
@@ -43,6 +45,15 @@ class Buys:
 
         # Return the query output 
         return [Buys(*row) for row in rows]
+
+    # All records in the Buys table as plain dicts, for callers that only serialize them:
+    # skips building a Buys object per row
+    @staticmethod
+    def get_all_buys_dicts():
+        return app.db.execute_dicts('''
+        SELECT buyer_id, purchase_id, at_balance
+        FROM Buys
+        ''')
     
     # ____________
     # METHOD
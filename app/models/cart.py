@@ -0,0 +1,79 @@
+from flask import current_app as app
+from sqlalchemy import text
+
+# Cart holds each user's cart total and number of distinct items, so the cart page reads them in one
+# row lookup instead of summing CartContains on every view. Every CartDAL write (and the checkout and
+# batch paths) adjusts the row in the same statement that changes CartContains; `flask carts check`
+# compares it against CartContains and `flask carts rebuild` recomputes it.
+class Cart:
+    # recompute the totals from CartContains, one row per user with a non-empty cart
+    COMPUTE_QUERY = '''
+        SELECT uid, SUM(quantity * at_price) AS total_price, COUNT(*) AS item_count
+        FROM CartContains
+        GROUP BY uid
+    '''
+
+    def __init__(self, uid, total_price, item_count):
+        self.uid = uid
+        self.total_price = total_price
+        self.item_count = item_count
+
+    @staticmethod
+    # uid's totals, an empty cart when they have never had a row
+    def get(uid):
+        rows = app.db.execute('''
+        SELECT uid, total_price, item_count
+        FROM Cart
+        WHERE uid = :uid
+        ''', uid=uid)
+        return Cart(*(rows[0])) if rows else Cart(uid, 0, 0)
+
+    @staticmethod
+    # recompute the totals of the given users from their CartContains rows
+    def refresh(uids):
+        app.db.execute('''
+        INSERT INTO Cart (uid, total_price, item_count)
+        SELECT u.uid, COALESCE(SUM(cc.quantity * cc.at_price), 0), COUNT(cc.product_id)
+        FROM unnest(CAST(:uids AS INT[])) AS u(uid)
+        LEFT JOIN CartContains cc ON cc.uid = u.uid
+        GROUP BY u.uid
+        ON CONFLICT (uid)
+        DO UPDATE SET total_price = EXCLUDED.total_price, item_count = EXCLUDED.item_count
+        ''', uids=uids)
+
+    @staticmethod
+    # zero every cart and recompute the non-empty ones, returns how many carts have items
+    def rebuild():
+        with app.db.begin_maintenance() as conn:
+            conn.execute(text('UPDATE Cart SET total_price = 0, item_count = 0'))
+            result = conn.execute(text(f'''
+                INSERT INTO Cart (uid, total_price, item_count)
+                {Cart.COMPUTE_QUERY}
+                ON CONFLICT (uid)
+                DO UPDATE SET total_price = EXCLUDED.total_price, item_count = EXCLUDED.item_count
+            '''))
+            return result.rowcount
+
+    @staticmethod
+    # compare Cart against CartContains, returns one dict per user whose totals drifted
+    def check_consistency():
+        with app.db.begin_maintenance():
+            rows = app.db.execute(f'''
+            SELECT COALESCE(s.uid, c.uid),
+                s.total_price, COALESCE(c.total_price, 0),
+                s.item_count, COALESCE(c.item_count, 0)
+            FROM Cart s
+            FULL OUTER JOIN ({Cart.COMPUTE_QUERY}) c ON c.uid = s.uid
+            WHERE s.uid IS NULL
+                OR s.total_price <> COALESCE(c.total_price, 0)
+                OR s.item_count <> COALESCE(c.item_count, 0)
+            ORDER BY 1
+            ''')
+        return [
+            {
+                'uid': row[0],
+                'total_price': (row[1], row[2]),
+                'item_count': (row[3], row[4])
+            }
+            for row in rows
+        ]
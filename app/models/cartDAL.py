@@ -1,4 +1,21 @@
+import json
+
 from flask import current_app as app
+from sqlalchemy import text
+from app.db import retry_serializable
+from app.models.cart import Cart
+from app.models.content_version import ContentVersion
+
+# a user's cart items, starting from their CartContains rows (the (uid, product_id) primary key) and
+# joining exactly one listing and one catalog row per item
+CART_ITEMS_QUERY = '''
+        SELECT cc.product_id, pl.product_name, cc.quantity, cc.at_price, pc.description, pl.seller_id, pc.image_url
+        FROM CartContains cc
+        JOIN ProductListing pl ON pl.product_id = cc.product_id
+        JOIN ProductCatalog pc ON pc.product_name = pl.product_name
+        WHERE cc.uid = :uid
+        ORDER BY cc.product_id ASC
+'''
 
 # CartDAL
 class CartDAL:
@@ -11,9 +28,9 @@ class CartDAL:
 
     @staticmethod
     def get_product_stock(product_id):
-        # how many items are present in stock for a particular product
+        # how many items are present in stock for a particular product (and not held by other carts)
         rows = app.db.execute ('''
-            SELECT quantity
+            SELECT quantity - reserved
             FROM ProductListing 
             WHERE product_id = :product_id
         ''', product_id = product_id)
@@ -32,78 +49,128 @@ class CartDAL:
     @staticmethod
     def get_paginated_carts_by_user(uid, page, items_per_page):
         offset = (page - 1) * items_per_page 
-        rows = app.db.execute ('''
-        WITH Pdeets AS
-        (
-        SELECT pc.image_url, pl.product_name, pc.description
-        FROM ProductCatalog pc
-        JOIN ProductListing pl ON pl.product_name = pc.product_name
-        ) 
-        SELECT DISTINCT pl.product_id, pl.product_name, cc.quantity, cc.at_price, pd.description, pl.seller_id, pd.image_url
-        FROM ProductListing pl
-        JOIN Pdeets pd ON pd.product_name = pl.product_name
-        JOIN CartContains cc ON cc.product_id = pl.product_id
-        WHERE cc.uid = :uid 
-        ORDER BY pl.product_id ASC
+        rows = app.db.execute(CART_ITEMS_QUERY + '''
         LIMIT :items_per_page OFFSET :offset
         ''', uid=uid, items_per_page = items_per_page, offset = offset)
-        items = []
-        for row in rows:
-            item = {
-                'product_id' : row [0],
-                'product_name': row[1],
-                'quantity': row[2],
-                'at_price': row[3], 
-                'image_url': row[4], 
-                'seller_id': row[5]
-            }
-            items.append(item)
-        return items
+        return [CartDAL.item_dict(row) for row in rows]
 
     @staticmethod
     def count_items_in_cart(uid):
-        result = app.db.execute('''
-        SELECT COUNT(*)
-        FROM CartContains
-        WHERE uid = :uid
-        ''', uid=uid)
-        return result[0][0] if result else 0
+        # kept up to date in Cart by the writes below
+        return Cart.get(uid).item_count
 
     @staticmethod
     def get_items(uid) :
-        # Similar code to the one above but to make it easier for backend methods as seen down below as well.
-        rows = app.db.execute ('''
-        WITH Pdeets AS
-        (
-        SELECT pc.image_url, pl.product_name, pc.description
-        FROM ProductCatalog pc
-        JOIN ProductListing pl ON pl.product_name = pc.product_name
-        ) 
-        SELECT DISTINCT pl.product_id, pl.product_name, cc.quantity, cc.at_price, pd.description, pl.seller_id, pd.image_url
+        # Same as above but the whole cart, for the backend methods down below as well.
+        rows = app.db.execute(CART_ITEMS_QUERY, uid=uid)
+        return [CartDAL.item_dict(row) for row in rows]
+
+    @staticmethod
+    def item_dict(row):
+        return {
+            'product_id' : row[0],
+            'product_name': row[1],
+            'quantity': row[2],
+            'at_price': row[3], 
+            'description': row[4],
+            'seller_id': row[5],
+            'image_url': row[6]
+        }
+
+    @staticmethod
+    # EXPLAIN the cart query for uid and return what's wrong with the plan (empty when it's fine):
+    # CartContains must be read through its (uid, product_id) primary key and nothing may need
+    # deduplicating. Sequential scans are turned off for the EXPLAIN so that a small dev database
+    # still shows whether the query *can* be driven by the key, whatever the planner picks for tiny tables
+    def check_items_plan(uid):
+        with app.db.begin() as conn:
+            conn.execute(text('SET LOCAL enable_seqscan = off'))
+            plan = conn.execute(text('EXPLAIN (FORMAT JSON) ' + CART_ITEMS_QUERY), {'uid': uid}).scalar()
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        nodes = []
+        pending = [plan[0]['Plan']]
+        while pending:
+            node = pending.pop()
+            nodes.append(node)
+            pending.extend(node.get('Plans', []))
+        problems = []
+        # index names are unique per schema; a Bitmap Heap Scan carries the relation and its child
+        # Bitmap Index Scan the index, so look for the index on any node
+        if not any(node.get('Index Name') == 'cartcontains_pkey' for node in nodes):
+            problems.append("CartContains is not read through cartcontains_pkey")
+        for node in nodes:
+            if node['Node Type'] == 'Seq Scan':
+                problems.append(f"sequential scan on {node.get('Relation Name')}")
+            if node['Node Type'] == 'Unique' or (node['Node Type'] == 'Aggregate' and node.get('Strategy') == 'Hashed'):
+                problems.append("plan deduplicates rows (DISTINCT)")
+        return problems
+
+    @staticmethod
+    def get_quantities(uid, product_ids):
+        # {product_id: quantity in uid's cart (0 if not in it)} for the listings among product_ids that exist
+        rows = app.db.execute('''
+        SELECT pl.product_id, COALESCE(cc.quantity, 0)
         FROM ProductListing pl
-        JOIN Pdeets pd ON pd.product_name = pl.product_name
-        JOIN CartContains cc ON cc.product_id = pl.product_id
-        WHERE cc.uid = :uid 
-        ''', uid=uid)
-        items = []
-        for row in rows:
-            item = {
-                'product_id' : row [0],
-                'product_name': row[1],
-                'quantity': row[2],
-                'at_price': row[3], 
-                'image_url': row[4], 
-                'seller_id': row[5]
-            }
-            items.append(item)
-        return items
-    
+        LEFT JOIN CartContains cc ON cc.uid = :uid AND cc.product_id = pl.product_id
+        WHERE pl.product_id = ANY(:product_ids)
+        ''', uid=uid, product_ids=product_ids)
+        return {row[0]: row[1] for row in rows}
+
+    @staticmethod
+    def set_quantities(uid, product_ids, quantities):
+        # set the quantities of several cart items in one statement: quantity 0 removes the item,
+        # new items are added at the listing's current price, existing ones keep theirs.
+        # The cart total and item count in Cart move by the difference
+        app.db.execute('''
+        WITH target AS (
+            SELECT product_id, quantity
+            FROM unnest(CAST(:product_ids AS INT[]), CAST(:quantities AS INT[])) AS t(product_id, quantity)
+        ),
+        delta AS (
+            SELECT SUM(CASE
+                    WHEN cc.uid IS NULL THEN t.quantity * pl.price
+                    ELSE (t.quantity - cc.quantity) * cc.at_price
+                END) AS amount,
+                SUM(CASE
+                    WHEN cc.uid IS NULL AND t.quantity > 0 THEN 1
+                    WHEN cc.uid IS NOT NULL AND t.quantity = 0 THEN -1
+                    ELSE 0
+                END) AS items
+            FROM target t
+            JOIN ProductListing pl ON pl.product_id = t.product_id
+            LEFT JOIN CartContains cc ON cc.uid = :uid AND cc.product_id = t.product_id
+        ),
+        removed AS (
+            DELETE FROM CartContains cc
+            USING target t
+            WHERE cc.uid = :uid AND cc.product_id = t.product_id AND t.quantity = 0
+        ),
+        upserted AS (
+            INSERT INTO CartContains (uid, product_id, quantity, at_price)
+            SELECT :uid, t.product_id, t.quantity, pl.price
+            FROM target t
+            JOIN ProductListing pl ON pl.product_id = t.product_id
+            WHERE t.quantity > 0
+            ON CONFLICT (uid, product_id)
+            DO UPDATE SET quantity = EXCLUDED.quantity
+        )
+        INSERT INTO Cart (uid, total_price, item_count)
+        SELECT :uid, COALESCE(amount, 0), COALESCE(items, 0)
+        FROM delta
+        ON CONFLICT (uid)
+        DO UPDATE SET total_price = Cart.total_price + EXCLUDED.total_price,
+            item_count = Cart.item_count + EXCLUDED.item_count
+        ''', uid=uid, product_ids=product_ids, quantities=quantities)
+
     @staticmethod
     def add_item(uid, product_id) -> bool:
         # Increases quantity of item if it already exists
         # If item does not exist in cart, add item. 
+        # Either way the cart total grows by one unit's price (and the item count by one for a new item)
         try:
             rows = app.db.execute('''
+            WITH added AS (
             INSERT INTO CartContains (uid ,product_id, quantity, at_price)
             VALUES(
             :uid, 
@@ -111,7 +178,15 @@ class CartDAL:
             1, 
             (SELECT p.price FROM ProductListing p WHERE p.product_id=:product_id))
             ON CONFLICT(uid, product_id)
-            DO UPDATE SET quantity = GREATEST(1, CartContains.quantity + 1);
+            DO UPDATE SET quantity = GREATEST(1, CartContains.quantity + 1)
+            RETURNING quantity, at_price
+            )
+            INSERT INTO Cart (uid, total_price, item_count)
+            SELECT :uid, at_price, CASE WHEN quantity = 1 THEN 1 ELSE 0 END
+            FROM added
+            ON CONFLICT (uid)
+            DO UPDATE SET total_price = Cart.total_price + EXCLUDED.total_price,
+                item_count = Cart.item_count + EXCLUDED.item_count;
             ''', 
             uid = uid, product_id = product_id)
             return True
@@ -124,9 +199,16 @@ class CartDAL:
         # Remove an item from the cart of a user
         try:
             rows = app.db.execute('''
+            WITH removed AS (
             DELETE 
             FROM CartContains cc
             WHERE cc.uid = :uid AND cc.product_id = :product_id
+            RETURNING cc.quantity * cc.at_price AS amount
+            )
+            UPDATE Cart c
+            SET total_price = c.total_price - r.amount, item_count = c.item_count - 1
+            FROM removed r
+            WHERE c.uid = :uid
             ''', uid= uid, product_id = product_id)
             return True
         except Exception as e:
@@ -136,16 +218,25 @@ class CartDAL:
     @staticmethod
     def decrease_quantity_of_item(uid, product_id) -> int:
         # Decrease the quantity of an item by 1
-        # Basically like the minus sign in the cart
+        # Basically like the minus sign in the cart (an item never goes below 1)
+        # The last SELECT still sees the quantity from before the update, hence the subtraction
         try:
             rows = app.db.execute('''
+            WITH decreased AS (
             UPDATE CartContains cc
-            SET quantity = CASE
-                    WHEN cc.quantity > 1 THEN cc.quantity - 1
-                    ELSE cc.quantity
-            END
-            WHERE cc.uid = :uid AND cc.product_id = :product_id 
-            RETURNING cc.quantity
+            SET quantity = cc.quantity - 1
+            WHERE cc.uid = :uid AND cc.product_id = :product_id AND cc.quantity > 1
+            RETURNING cc.at_price
+            ),
+            total AS (
+            UPDATE Cart c
+            SET total_price = c.total_price - d.at_price
+            FROM decreased d
+            WHERE c.uid = :uid
+            )
+            SELECT cc.quantity - (SELECT COUNT(*) FROM decreased)
+            FROM CartContains cc
+            WHERE cc.uid = :uid AND cc.product_id = :product_id
             ''', uid= uid, product_id = product_id)
             print(rows)
             return rows[0][0]
@@ -157,31 +248,88 @@ class CartDAL:
         # Clears the cart of a user
         try:
             rows = app.db.execute('''
+            WITH cleared AS (
             DELETE
             FROM CartContains cc
             WHERE cc.uid = :uid
+            )
+            UPDATE Cart
+            SET total_price = 0, item_count = 0
+            WHERE uid = :uid
             ''', uid=uid)
             return True
         except Exception as e:
             print(f"Failed to clear cart: {e}")
             return False
+
     @staticmethod
-    def sync_order_sequence():
+    def place_order(uid):
         try:
-            app.db.execute('''
-                SELECT setval('orders_purchase_id_seq', (SELECT COALESCE(MAX(purchase_id), 0) FROM Orders));
-            ''')
-        except Exception as e:
-            print(f"Failed to sync order sequence: {e}")
-            raise
+            purchase_id, date_time, product_names = CartDAL.submit_order(uid)
+            print(f"Order {purchase_id} committed for uid={uid}")
+            # purchase counts and stock on their pages changed
+            ContentVersion.bump(product_names)
 
+            return {
+            "success": True,
+            "message": "Order placed successfully.",
+            "purchase_id": purchase_id,
+            "date_time": date_time
+        }
+        except Exception as e:
+            print("Transaction failed:", e)
+            return {
+            "success": False,
+            "error": str(e)}
 
     @staticmethod
-    def place_order(cost,uid):
-        try:
-            CartDAL.sync_order_sequence()
-            app.db.execute("BEGIN")
-            print("Transaction started.")
+    @retry_serializable()
+    # the whole checkout as one SERIALIZABLE transaction, a fixed number of statements however big the cart is.
+    # Stock and balance are checked by the UPDATEs themselves (conditional decrement), so an order that
+    # can't be filled raises and everything rolls back; it is rerun if it races another checkout
+    def submit_order(uid):
+        with app.db.begin():
+            cart = app.db.execute('''
+                SELECT cc.product_id, pl.product_name, cc.quantity * cc.at_price
+                FROM CartContains cc
+                JOIN ProductListing pl ON pl.product_id = cc.product_id
+                WHERE cc.uid = :uid
+            ''', uid=uid)
+            if not cart:
+                raise Exception("Your cart is empty.")
+            cost = sum(row[2] for row in cart)
+
+            # Take the items out of stock, turning the cart's holds into the decrement. An item is
+            # short when its hold plus the stock nobody holds doesn't cover it (only happens once a
+            # hold expired)
+            stocked = app.db.execute('''
+                UPDATE ProductListing pl
+                SET quantity = pl.quantity - cc.quantity,
+                    reserved = pl.reserved - COALESCE(h.quantity, 0)
+                FROM CartContains cc
+                LEFT JOIN StockHold h ON h.uid = cc.uid AND h.product_id = cc.product_id
+                WHERE cc.uid = :uid AND cc.product_id = pl.product_id
+                    AND pl.quantity - pl.reserved + COALESCE(h.quantity, 0) >= cc.quantity
+                RETURNING pl.product_id
+            ''', uid=uid)
+            short = {row[0] for row in cart} - {row[0] for row in stocked}
+            if short:
+                name = next(row[1] for row in cart if row[0] in short)
+                raise Exception(f"Insufficient stock for product {name}")
+            app.db.execute('''
+                DELETE FROM StockHold h
+                USING CartContains cc
+                WHERE h.uid = :uid AND cc.uid = :uid AND cc.product_id = h.product_id
+            ''', uid=uid)
+
+            # Subtract the total cost from balance of the user, if they can afford it
+            charged = app.db.execute('''
+                UPDATE Users
+                SET balance = balance - :cost
+                WHERE user_id = :uid AND balance >= :cost
+            ''', cost=cost, uid=uid)
+            if not charged:
+                raise Exception("Insufficient funds.")
 
             # Create an entry in the orders table
             rows = app.db.execute('''
@@ -190,73 +338,62 @@ class CartDAL:
                 RETURNING purchase_id, date_time
             ''', cost=cost)
             purchase_id, date_time = rows[0]
-            print(f"Order created: purchase_id={purchase_id}, date_time={date_time}")
-
-            cart_items = CartDAL.get_items(uid)
-            # print(f"Cart items retrieved: {cart_items}")
-
-            # insert entries to the OrderContains table
-            for item in cart_items:
-                app.db.execute('''
-                    INSERT INTO OrderContains (purchase_id, product_id, quantity, at_price)
-                    VALUES (:purchase_id, :product_id, :quantity, :at_price)
-                ''', purchase_id=purchase_id, product_id=item['product_id'], quantity=item['quantity'], at_price=item['at_price'])
-                print(f"Inserted into OrderContains for product_id={item['product_id']}")
 
-            # Update the quantity of the product
-            for item in cart_items: 
-                app.db.execute('''
-                    UPDATE ProductListing 
-                    SET quantity = quantity - :quantity
-                    WHERE product_id = :product_id;
-                ''', product_id = item['product_id'], quantity = item['quantity'])
-                print(f"Updated ProductListing quantity for product_id={item['product_id']}")
+            # Copy the cart into OrderContains
+            app.db.execute('''
+                INSERT INTO OrderContains (purchase_id, product_id, quantity, at_price)
+                SELECT :purchase_id, product_id, quantity, at_price
+                FROM CartContains
+                WHERE uid = :uid
+            ''', purchase_id=purchase_id, uid=uid)
 
-            # Subtract the total cost from balance of the user
+            # Pay every seller in the order once
             app.db.execute('''
-                UPDATE Users
-                SET balance = balance - :cost
-                WHERE user_id = :uid
-            ''', cost = cost, uid= uid)
-            print(f"Updated user balance for uid={uid}")
+                UPDATE Users u
+                SET balance = u.balance + s.earned
+                FROM (
+                    SELECT pl.seller_id, SUM(cc.quantity * cc.at_price) AS earned
+                    FROM CartContains cc
+                    JOIN ProductListing pl ON pl.product_id = cc.product_id
+                    WHERE cc.uid = :uid
+                    GROUP BY pl.seller_id
+                ) s
+                WHERE u.user_id = s.seller_id
+            ''', uid=uid)
 
-            # Update seller balances
-            for item in cart_items:
-                print(f"Updating seller balance: product_id={item['product_id']}, seller_id={item['seller_id']}, at_price={item['at_price']}, quantity={item['quantity']}")
-                app.db.execute('''
-                    UPDATE Users
-                    SET balance = balance + (:at_price * :quantity)
-                    WHERE user_id = (SELECT seller_id FROM ProductListing WHERE product_id = :product_id)
-                ''', at_price = item['at_price'], quantity = item['quantity'], product_id = item['product_id'])
-                print(f"Updated seller balance {item['seller_id']} for product_id={item['product_id']}")
-            
             # Insert purchase to Buys
             app.db.execute('''
-            INSERT INTO Buys (buyer_id, purchase_id, at_balance)
-            VALUES (:buyer_id, :purchase_id, :at_balance)
-        ''', buyer_id=uid, purchase_id=purchase_id, at_balance=(cost * -1))  # at_balance tracks the cost
-            print(f"Inserted into Buys: buyer_id={uid}, purchase_id={purchase_id}, totcost={cost}")
+                INSERT INTO Buys (buyer_id, purchase_id, at_balance)
+                VALUES (:buyer_id, :purchase_id, :at_balance)
+            ''', buyer_id=uid, purchase_id=purchase_id, at_balance=(cost * -1))  # at_balance tracks the cost
 
-    #    Clear cart after submission of an order
-            CartDAL.clear_cart(uid)
-            print(f"Cleared cart for uid={uid}")
+            # Count the order towards the purchase totals in ProductStats
+            app.db.execute('''
+                UPDATE ProductStats ps
+                SET total_purchases = ps.total_purchases + o.purchases
+                FROM (
+                    SELECT pl.product_name, COUNT(oc.product_id) AS purchases
+                    FROM OrderContains oc
+                    JOIN ProductListing pl ON pl.product_id = oc.product_id
+                    WHERE oc.purchase_id = :purchase_id
+                    GROUP BY pl.product_name
+                ) o
+                WHERE ps.product_name = o.product_name
+            ''', purchase_id=purchase_id)
 
-            app.db.execute("COMMIT")
-            print("Transaction committed successfully.")
+            # Clear cart after submission of an order (not clear_cart(), which would swallow a failure)
+            app.db.execute('''
+                WITH cleared AS (
+                    DELETE FROM CartContains
+                    WHERE uid = :uid
+                )
+                UPDATE Cart
+                SET total_price = 0, item_count = 0
+                WHERE uid = :uid
+            ''', uid=uid)
+
+        return purchase_id, date_time, {row[1] for row in cart}
 
-            return {
-            "success": True,
-            "message": "Order placed successfully.",
-            "purchase_id": purchase_id,
-            "date_time": date_time
-        }
-        except Exception as e:
-            app.db.execute("ROLLBACK")
-            print("Transaction failed:", e)
-            return {
-            "success": False,
-            "message": str(e)}
-            
     @staticmethod
     # just a dummy function to test order submission and changes of the user's balance.
     def update_balance(uid):
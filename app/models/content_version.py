@@ -0,0 +1,71 @@
+from flask import current_app as app
+from flask import g, has_app_context
+from sqlalchemy import text
+
+# ContentVersion counts changes per scope ("product:<name>", "category:<category>", "category:all")
+# so readers can tell whether what they have is still current without rerunning the query:
+# the @versioned routes (app/conditional.py) build their ETag from it and the catalog cache keys
+# its entries by it. Every write that changes what a product page, its reviews or a catalog page
+# shows calls bump() for the products involved once it has committed.
+class ContentVersion:
+    # current time in the same convention as Orders.date_time
+    NOW = "(current_timestamp AT TIME ZONE 'UTC')"
+
+    BUMP = f'''
+    INSERT INTO ContentVersion (scope, version, updated_at)
+    SELECT scope, 1, {NOW}
+    FROM (
+        SELECT 'product:' || product_name AS scope
+        FROM unnest(CAST(:product_names AS VARCHAR[])) AS product_name
+        UNION
+        SELECT 'category:' || category
+        FROM ProductCatalog
+        WHERE product_name = ANY(CAST(:product_names AS VARCHAR[]))
+        UNION
+        SELECT 'category:' || category
+        FROM unnest(CAST(:categories AS VARCHAR[])) AS category
+        UNION
+        SELECT 'category:all'
+    ) s
+    ORDER BY scope
+    ON CONFLICT (scope) DO UPDATE SET version = ContentVersion.version + 1, updated_at = EXCLUDED.updated_at
+    '''
+
+    @staticmethod
+    def product_scope(product_name):
+        return f"product:{product_name}"
+
+    @staticmethod
+    def category_scope(category):
+        return f"category:{category}"
+
+    @staticmethod
+    # (version, updated_at) of a scope, (0, None) if it never changed. Remembered for the rest of the
+    # request so the ETag and the cache lookups of one request agree
+    def get(scope):
+        seen = g.setdefault('content_versions', {}) if has_app_context() else {}
+        if scope not in seen:
+            rows = app.db.execute('''
+            SELECT version, updated_at
+            FROM ContentVersion
+            WHERE scope = :scope
+            ''', scope=scope)
+            seen[scope] = tuple(rows[0]) if rows else (0, None)
+        return seen[scope]
+
+    @staticmethod
+    # bump the products, their categories (plus any extra categories, e.g. the one a product just
+    # left) and "all". Runs in its own short READ COMMITTED transaction, so concurrent bumps of the
+    # same rows wait for each other instead of failing, and the write it follows has to be committed
+    # already. A failed bump is only printed: the write itself went through
+    def bump(product_names, categories=()):
+        if has_app_context():
+            g.pop('content_versions', None)
+        try:
+            with app.db.connect() as conn:
+                conn = conn.execution_options(isolation_level="READ COMMITTED")
+                with conn.begin():
+                    conn.execute(text(ContentVersion.BUMP),
+                                 {'product_names': list(product_names), 'categories': list(categories)})
+        except Exception as e:
+            print(f"Failed to bump content versions for {list(product_names)}: {e}")
@@ -1,7 +1,12 @@
 from flask import current_app as app
+from .product_stats import ProductStats
 
 
 class Product:
+   # row objects are built by the thousand per request, slots keep them small (no per-instance __dict__)
+   __slots__ = ('product_id', 'product_name', 'price', 'category', 'description', 'image_url', 'seller_id',
+                'quantity', 'total_reviews', 'avg_rating', 'total_purchases', 'creator_id')
+
    def __init__(self, product_id, product_name, seller_id, price, quantity, category, description, image_url, creator_id, total_reviews=0, avg_rating=0, total_purchases=0):
        self.product_id = product_id
        self.product_name = product_name
@@ -55,10 +60,11 @@ class Product:
    '''
    @staticmethod
    def get_all(column=None, order_by=None, limit=0, offset = 0):
-       query = '''
+       # review count and average come from the maintained ProductStats summary
+       query = f'''
                SELECT p.product_id, p.product_name, seller_id, price, quantity, category, image_url, description, creator_id,
-               COALESCE(pr.total_reviews, 0) AS total_reviews,
-               COALESCE(pr.average_rating, 0) AS avg_rating,
+               COALESCE(ps.total_reviews, 0) AS total_reviews,
+               {ProductStats.AVG_RATING} AS avg_rating,
                COALESCE(o.total_purchases, 0) AS total_purchases
 
 
@@ -68,13 +74,7 @@ class Product:
                NATURAL JOIN ProductCatalog
 
 
-               LEFT JOIN (
-                   SELECT product_name,
-                       COUNT(rating) AS total_reviews,
-                       ROUND(AVG(rating), 1) AS average_rating
-                   FROM ProductReview
-                   GROUP BY product_name
-               ) pr ON p.product_name = pr.product_name
+               LEFT JOIN ProductStats ps ON ps.product_name = p.product_name
 
 
                LEFT JOIN (
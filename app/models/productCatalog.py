@@ -1,44 +1,58 @@
+import re
+import time
 from flask import current_app as app
+from .product_stats import ProductStats
+from .content_version import ContentVersion
+
 class ProductCatalog:
-   DEFAULT_GET_QUERY = '''
-               WITH MinPrices AS (
-                   SELECT product_name, MIN(price) AS min_price
-                   FROM ProductListing
-                   GROUP BY product_name
-               )
+   # per product stats come from the maintained ProductStats summary (see models/product_stats.py)
+   # instead of aggregating ProductReview and OrderContains on every request
+   SELECT_COLUMNS = f'''
                SELECT p.product_id, p.product_name, p.price, category, image_url, description,
-               COALESCE(pr.total_reviews, 0) AS total_reviews,
-               COALESCE(pr.average_rating, 0) AS avg_rating,
-               COALESCE(o.total_purchases, 0) AS total_purchases
-
-
+               ps.total_reviews AS total_reviews,
+               {ProductStats.AVG_RATING} AS avg_rating,
+               ps.total_purchases AS total_purchases
+               '''
+   FROM_CLAUSE = '''
                FROM ProductListing p
 
 
                NATURAL JOIN ProductCatalog
 
 
-               LEFT JOIN (
-                   SELECT product_name,
-                       COUNT(rating) AS total_reviews,
-                       ROUND(AVG(rating), 1) AS average_rating
-                   FROM ProductReview
-                   GROUP BY product_name
-               ) pr ON p.product_name = pr.product_name
+               JOIN ProductStats ps ON ps.product_name = p.product_name AND ps.min_price = p.price
+
 
+               '''
+   DEFAULT_GET_QUERY = SELECT_COLUMNS + FROM_CLAUSE
 
-               LEFT JOIN (
-                   SELECT product_id,
-                       COUNT(product_id) AS total_purchases
-                   FROM OrderContains
-                   GROUP BY product_id
-               ) o ON p.product_id = o.product_id
+   # catalog search goes through the indexed ProductCatalog.search_vector (name weighted above description),
+   # :search_term is the prefix tsquery built by search_query()
+   SEARCH_CONDITION = "search_vector @@ to_tsquery('english', :search_term)"
+   RELEVANCE = "ts_rank(search_vector, to_tsquery('english', :search_term))"
 
+   # SQL expression behind each sortable column of DEFAULT_GET_QUERY, for keyset (cursor) predicates
+   SORT_EXPRESSIONS = {
+       'price': 'p.price',
+       'avg_rating': ProductStats.AVG_RATING,
+       'total_purchases': 'ps.total_purchases'
+   }
 
-               JOIN MinPrices mp ON mp.product_name = p.product_name AND mp.min_price = p.price
+   # ?category= values of the frontend -> category names in the catalog (see products.py)
+   CATEGORIES = {
+       "flowers": "Flowers",
+       "succulents": "Succulents",
+       "herbs": "Herbs",
+       "fruit-veg": "Fruits and Vegetables"
+   }
 
+   # category -> (expiry on the time.monotonic() clock, product count), see get_products_page.
+   # only "all" and the known CATEGORIES are cached, so junk ?category= values can't grow it
+   TOTAL_CACHE = {}
+
+   __slots__ = ('product_id', 'product_name', 'min_price', 'category', 'description', 'image_url',
+                'total_reviews', 'avg_rating', 'total_purchases')
 
-               '''
    def __init__(self, product_id, product_name, min_price, category, description, image_url, total_reviews=0, avg_rating=0, total_purchases=0):
        self.product_id = product_id
        self.product_name = product_name
@@ -50,7 +64,34 @@ class ProductCatalog:
        self.avg_rating = avg_rating
        self.total_purchases = total_purchases
 
+   def to_dict(self):
+       return {
+           'product_id': self.product_id,
+           'product_name': self.product_name,
+           'min_price': self.min_price,
+           'category': self.category,
+           'description': self.description,
+           'image_url': self.image_url,
+           'total_reviews': self.total_reviews,
+           'avg_rating': self.avg_rating,
+           'total_purchases': self.total_purchases
+       }
+
+   # how a list of products is stored in app.catalog_cache's redis tier, and rebuilt from it
+   def encode_products(products):
+       return [product.to_dict() for product in products]
+
+   def decode_products(rows):
+       return [ProductCatalog(**row) for row in rows]
+
+   # product detail page, served from app.catalog_cache when it can
    def get_product_by_name(product_name):
+       version = ContentVersion.get(ContentVersion.product_scope(product_name))[0]
+       return app.catalog_cache.get_or_load('product', [product_name, version],
+                                            lambda: ProductCatalog.load_product_by_name(product_name),
+                                            ProductCatalog.encode_products, ProductCatalog.decode_products)
+
+   def load_product_by_name(product_name):
        query = ProductCatalog.DEFAULT_GET_QUERY
        query += " WHERE p.product_name = :product_name;"
        rows = app.db.execute(query, product_name=product_name)
@@ -63,34 +104,149 @@ class ProductCatalog:
    '''
    def get_products_by_category(category, search_term=None, column=None, order_by=None, limit=0, offset = 0):
        query = ProductCatalog.DEFAULT_GET_QUERY
-       if search_term:
-           search_term = f"%{search_term.lower()}%"
-       if category != "all":
-           query += f" WHERE category = :cat"
-           if search_term:
-            query += f" AND (LOWER(p.product_name) LIKE :search_term OR LOWER(description) LIKE :search_term)"
-       else:
-           if search_term:
-               query += f" WHERE (LOWER(p.product_name) LIKE :search_term OR LOWER(description) LIKE :search_term)"
-       if column and order_by:
-           query += f" ORDER BY {column} {order_by}"
+       conditions, search_term = ProductCatalog.filter_conditions(category, search_term)
+       if conditions:
+           query += " WHERE " + " AND ".join(conditions)
+       order = ProductCatalog.order_clause(column, order_by, search_term)
+       if order:
+           query += f" ORDER BY {order}"
        query += f" LIMIT :lim"
        query += f" OFFSET :offset;"
        rows = app.db.execute(query, cat = category, search_term = search_term, lim=limit, offset=offset)
        return [ProductCatalog(*row) for row in rows]
 
-  
-   def get_total_products(category, search_term = None):
-       query = f"SELECT COUNT(*) FROM ({ProductCatalog.DEFAULT_GET_QUERY}) AS total_count"
+   '''
+   same page as get_products_by_category plus the total number of matching products, from one query:
+   COUNT(*) OVER () is computed on the filtered rows before LIMIT/OFFSET, so the catalog joins run once
+   instead of once for the page and again for get_total_products. pages are cached in app.catalog_cache.
+   for the unfiltered categories the total can come from a short-lived in-process cache
+   (CATALOG_COUNT_CACHE_SECONDS in Config, 0 turns it off), skipping the count entirely.
+   '''
+   def get_products_page(category, search_term=None, column=None, order_by=None, limit=0, offset=0):
+       version = ContentVersion.get(ContentVersion.category_scope(category))[0]
+       return app.catalog_cache.get_or_load(
+           'page', [category, version, search_term, column, order_by, limit, offset],
+           lambda: ProductCatalog.load_products_page(category, search_term, column, order_by, limit, offset),
+           lambda page: [ProductCatalog.encode_products(page[0]), page[1]],
+           lambda page: (ProductCatalog.decode_products(page[0]), page[1]))
+
+   def load_products_page(category, search_term=None, column=None, order_by=None, limit=0, offset=0):
+       if not search_term:
+           total = ProductCatalog.get_cached_total(category)
+           if total is not None:
+               products = ProductCatalog.get_products_by_category(category, column=column, order_by=order_by, limit=limit, offset=offset)
+               return products, total
+       query = f"{ProductCatalog.SELECT_COLUMNS}, COUNT(*) OVER () AS total_count {ProductCatalog.FROM_CLAUSE}"
+       conditions, search_param = ProductCatalog.filter_conditions(category, search_term)
+       if conditions:
+           query += " WHERE " + " AND ".join(conditions)
+       order = ProductCatalog.order_clause(column, order_by, search_param)
+       if order:
+           query += f" ORDER BY {order}"
+       query += " LIMIT :lim OFFSET :offset;"
+       rows = app.db.execute(query, cat=category, search_term=search_param, lim=limit, offset=offset)
+       if rows:
+           total = rows[0][-1]
+       else:
+           # past the last page the window has no row to ride on, fall back to a plain count
+           total = ProductCatalog.get_total_products(category, search_term=search_term) if offset else 0
+       if not search_term:
+           ProductCatalog.set_cached_total(category, total)
+       return [ProductCatalog(*row[:-1]) for row in rows], total
+
+   # WHERE conditions (and the tsquery parameter) shared by the catalog listing queries
+   def filter_conditions(category, search_term=None):
+       conditions = []
        if category != "all":
-           query += f" WHERE category = :cat"
+           conditions.append("category = :cat")
+       search_term = ProductCatalog.search_query(search_term)
        if search_term:
-           if category != "all":
-               query += " AND (LOWER(product_name) LIKE :search_term OR LOWER(description) LIKE :search_term)"
-           else:
-               query += " WHERE (LOWER(product_name) LIKE :search_term OR LOWER(description) LIKE :search_term)"
-           search_term = f"%{search_term.lower()}%"
+           conditions.append(ProductCatalog.SEARCH_CONDITION)
+       return conditions, search_term
+
+   # turn what the user typed into a tsquery where every word must match as a prefix,
+   # e.g. "lush dil" -> "lush:* & dil:*"; None if there is nothing searchable in it
+   def search_query(search_term):
+       if not search_term:
+           return None
+       words = re.findall(r"[^\W_]+", search_term.lower())
+       return " & ".join(f"{word}:*" for word in words) or None
+
+   # ORDER BY clause for a sort column; relevance only means something when searching
+   def order_clause(column, order_by, search_term=None):
+       if not (column and order_by):
+           return None
+       if column == 'relevance':
+           return f"{ProductCatalog.RELEVANCE} {order_by}" if search_term else None
+       return f"{column} {order_by}"
+
+   # cached product count for an unfiltered category, None when missing, expired or caching is off
+   def get_cached_total(category):
+       entry = ProductCatalog.TOTAL_CACHE.get(category)
+       if entry is None or entry[0] < time.monotonic():
+           return None
+       return entry[1]
+
+   def set_cached_total(category, total):
+       ttl = app.config.get('CATALOG_COUNT_CACHE_SECONDS', 0)
+       if ttl > 0 and (category == "all" or category in ProductCatalog.CATEGORIES.values()):
+           ProductCatalog.TOTAL_CACHE[category] = (time.monotonic() + ttl, total)
+
+   '''
+   keyset (cursor) version of get_products_by_category for infinite scroll.
+   after is the (sort value, product_id) of the last product already shown, or None for the first batch.
+   rows are ordered by the sort column with product_id as tie-breaker so the scan resumes right after
+   that product instead of building and discarding every earlier row like OFFSET does.
+   '''
+   def get_products_after(category, after=None, search_term=None, column=None, order_by=None, limit=0):
+       version = ContentVersion.get(ContentVersion.category_scope(category))[0]
+       return app.catalog_cache.get_or_load(
+           'after', [category, version, after, search_term, column, order_by, limit],
+           lambda: ProductCatalog.load_products_after(category, after, search_term, column, order_by, limit),
+           ProductCatalog.encode_products, ProductCatalog.decode_products)
+
+   def load_products_after(category, after=None, search_term=None, column=None, order_by=None, limit=0):
+       query = ProductCatalog.DEFAULT_GET_QUERY
+       conditions, search_term = ProductCatalog.filter_conditions(category, search_term)
+       after_value, after_id = after if after else (None, None)
+       if column and order_by:
+           if after:
+               expression = ProductCatalog.SORT_EXPRESSIONS[column]
+               op = '>' if order_by == 'ASC' else '<'
+               conditions.append(f"({expression} {op} :after_value OR ({expression} = :after_value AND p.product_id > :after_id))")
+           order = f"{column} {order_by}, p.product_id ASC"
+       else:
+           if after:
+               conditions.append("p.product_id > :after_id")
+           order = "p.product_id ASC"
+       if conditions:
+           query += " WHERE " + " AND ".join(conditions)
+       query += f" ORDER BY {order}"
+       query += " LIMIT :lim;"
+       rows = app.db.execute(query, cat=category, search_term=search_term, after_value=after_value, after_id=after_id, lim=limit)
+       return [ProductCatalog(*row) for row in rows]
+
+   # value of the sort column for a product returned by the catalog queries, used to build the next cursor
+   def sort_value(product, column):
+       if column == 'price':
+           return product.min_price
+       return getattr(product, column) if column else None
+
+
+   # (product_name, category, total_purchases) of every catalog entry, loaded into the typeahead index
+   def get_suggestion_rows():
+       return app.db.execute('''
+       SELECT pc.product_name, pc.category, COALESCE(ps.total_purchases, 0)
+       FROM ProductCatalog pc
+       LEFT JOIN ProductStats ps ON ps.product_name = pc.product_name
+       ''')
+
+   def get_total_products(category, search_term = None):
+       query = f"SELECT COUNT(*) {ProductCatalog.FROM_CLAUSE}"
+       conditions, search_term = ProductCatalog.filter_conditions(category, search_term)
+       if conditions:
+           query += " WHERE " + " AND ".join(conditions)
        query += ";"
        rows = app.db.execute(query, cat = category, search_term=search_term)
        total = rows[0][0] if rows else 0
-       return total
\ No newline at end of file
+       return total
@@ -1,5 +1,8 @@
 from flask import current_app as app
+from .content_version import ContentVersion
 class ProductListing():
+    __slots__ = ('product_id', 'product_name', 'seller_id', 'price', 'quantity', 'active', 'seller_name')
+
     def __init__(self, product_id, product_name, seller_id, price, quantity, active, seller_name):
        self.product_id = product_id
        self.product_name = product_name
@@ -8,11 +11,32 @@ class ProductListing():
        self.quantity = quantity
        self.active = active
        self.seller_name = seller_name
+
+    def to_dict(self):
+        return {
+            'product_id': self.product_id,
+            'product_name': self.product_name,
+            'seller_id': self.seller_id,
+            'price': self.price,
+            'quantity': self.quantity,
+            'active': self.active,
+            'seller_name': self.seller_name
+        }
     
     @staticmethod
+    # listings of a product page, served from app.catalog_cache when it can
     def get_listing_by_name(product_name):
+        version = ContentVersion.get(ContentVersion.product_scope(product_name))[0]
+        return app.catalog_cache.get_or_load('listings', [product_name, version],
+                                             lambda: ProductListing.load_listing_by_name(product_name),
+                                             lambda listings: [listing.to_dict() for listing in listings],
+                                             lambda rows: [ProductListing(**row) for row in rows])
+
+    @staticmethod
+    def load_listing_by_name(product_name):
         query = '''
-                SELECT pl.*, u.firstname || ' ' || u.lastname AS seller_name
+                SELECT pl.product_id, pl.product_name, pl.seller_id, pl.price, pl.quantity, pl.active,
+                    u.firstname || ' ' || u.lastname AS seller_name
                 FROM ProductListing pl 
                 JOIN Users u 
                 on pl.seller_id = u.user_id
@@ -1,7 +1,11 @@
 from flask import current_app as app
+from .content_version import ContentVersion
+from .rating_histogram import RatingHistogram
 from datetime import datetime
 
 class ProductReview:
+    __slots__ = ('buyer_id', 'product_name', 'rating', 'comment', 'date_time', 'upvote_count')
+
     def __init__(self, buyer_id, product_name, rating, comment, date_time, upvote_count=None):
         self.buyer_id = buyer_id
         self.product_name = product_name
@@ -15,7 +19,7 @@ class ProductReview:
     # Use the ProductCatalog since that is that product (can be sold in diff listings by diff sellers)
     def get_product_review(buyer_id, product_name):
         rows = app.db.execute('''
-        SELECT pr.buyer_id, pr.product_name, pr.rating, pr.comment, pr.date_time
+        SELECT pr.buyer_id, pr.product_name, pr.rating, pr.comment, pr.date_time, pr.upvote_count
         FROM ProductReview pr
         JOIN ProductCatalog p ON pr.product_name = p.product_name
         WHERE pr.buyer_id = :buyer_id AND pr.product_name = :product_name
@@ -27,7 +31,7 @@ class ProductReview:
     # Get all product reviews by a buyer
     def get_product_reviews_by_buyer(buyer_id):
         rows = app.db.execute('''
-        SELECT pr.buyer_id, pr.product_name, pr.rating, pr.comment, pr.date_time
+        SELECT pr.buyer_id, pr.product_name, pr.rating, pr.comment, pr.date_time, pr.upvote_count
         FROM ProductReview pr
         JOIN ProductCatalog p ON pr.product_name = p.product_name
         WHERE pr.buyer_id = :buyer_id
@@ -46,40 +50,22 @@ class ProductReview:
         # 2) standard sorting options
 
         if sort_by == "top_helpful_recent":
-            # top 3 most helpful reviews
-            # need to do groupby for aggregate query use!!
-            top_helpful_reviews = app.db.execute('''
-                SELECT pr.buyer_id, u.firstname, u.lastname, pr.product_name, pr.rating, pr.comment, pr.date_time, COUNT(pru.voter_id) AS upvote_count
-                FROM ProductReview pr
-                JOIN Users u ON pr.buyer_id = u.user_id
-                LEFT JOIN ProductReviewUpvote pru ON pr.buyer_id = pru.buyer_id AND pr.product_name = pru.product_name
-                WHERE pr.product_name = :product_name
-                GROUP BY pr.buyer_id, u.firstname, u.lastname, pr.product_name, pr.rating, pr.comment, pr.date_time
-                ORDER BY upvote_count DESC
-                LIMIT 3
-            ''', product_name=product_name)
-
-            # use buyer_id, product_id to filter out the queries we need
-            top_helpful_ids = [(row[0], row[3]) for row in top_helpful_reviews]
-
-            # get rest of reviews by time
-            all_recent_reviews = app.db.execute('''
-                SELECT pr.buyer_id, u.firstname, u.lastname, pr.product_name, pr.rating, pr.comment, pr.date_time, COUNT(pru.voter_id) AS upvote_count
-                FROM ProductReview pr
-                JOIN Users u 
-                ON pr.buyer_id = u.user_id
-                LEFT JOIN ProductReviewUpvote pru 
-                ON pr.buyer_id = pru.buyer_id AND pr.product_name = pru.product_name
-                WHERE pr.product_name = :product_name AND (pr.buyer_id, pr.product_name) NOT IN :top_helpful_ids
-                GROUP BY pr.buyer_id, u.firstname, u.lastname, pr.product_name, pr.rating, pr.comment, pr.date_time
-                ORDER BY pr.date_time DESC
-            ''', product_name=product_name, top_helpful_ids=tuple(top_helpful_ids))
-
-            # combo results for special sorting case
-            combined_reviews = top_helpful_reviews + all_recent_reviews
-
-            # paginate combined list
-            paginated_combined_reviews = combined_reviews[offset : offset + items_per_page]
+            # top 3 most helpful reviews, then the rest by most recent -- one query:
+            # helpful_rank numbers every review of the product by upvotes, the first 3 keep their
+            # rank and everything after sorts as 4 and by date, and only the requested page is returned
+            paginated_combined_reviews = app.db.execute('''
+                SELECT buyer_id, firstname, lastname, product_name, rating, comment, date_time, upvote_count
+                FROM (
+                    SELECT pr.buyer_id, u.firstname, u.lastname, pr.product_name, pr.rating, pr.comment, pr.date_time,
+                        pr.upvote_count,
+                        ROW_NUMBER() OVER (ORDER BY pr.upvote_count DESC, pr.date_time DESC, pr.buyer_id) AS helpful_rank
+                    FROM ProductReview pr
+                    JOIN Users u ON pr.buyer_id = u.user_id
+                    WHERE pr.product_name = :product_name
+                ) ranked
+                ORDER BY LEAST(helpful_rank, 4), date_time DESC, buyer_id
+                LIMIT :items_per_page OFFSET :offset
+            ''', product_name=product_name, items_per_page=items_per_page, offset=offset)
 
             return [
                 {
@@ -98,7 +84,7 @@ class ProductReview:
         else:
             # all other sorting cases
             sort_column = {
-                "helpful": "upvote_count DESC, pr.date_time DESC",
+                "helpful": "pr.upvote_count DESC, pr.date_time DESC",
                 "rating_high": "pr.rating DESC",
                 "rating_low": "pr.rating ASC",
                 "date_newest": "pr.date_time DESC",
@@ -106,12 +92,10 @@ class ProductReview:
             }.get(sort_by)
 
             rows = app.db.execute(f'''
-                SELECT pr.buyer_id, u.firstname, u.lastname, pr.product_name, pr.rating, pr.comment, pr.date_time, COUNT(pru.voter_id) AS upvote_count
+                SELECT pr.buyer_id, u.firstname, u.lastname, pr.product_name, pr.rating, pr.comment, pr.date_time, pr.upvote_count
                 FROM ProductReview pr
                 JOIN Users u ON pr.buyer_id = u.user_id
-                LEFT JOIN ProductReviewUpvote pru ON pr.buyer_id = pru.buyer_id AND pr.product_name = pru.product_name
                 WHERE pr.product_name = :product_name
-                GROUP BY pr.buyer_id, u.firstname, u.lastname, pr.product_name, pr.rating, pr.comment, pr.date_time
                 ORDER BY {sort_column}
                 LIMIT :items_per_page OFFSET :offset
             ''', product_name=product_name, items_per_page=items_per_page, offset=offset)
@@ -142,23 +126,9 @@ class ProductReview:
     
     @staticmethod
     # Get the product rating summary for a product -- for ProductDetailPage
+    # (read from the product's rating histogram, which also gives the star distribution)
     def get_product_rating_summary(product_name):
-        rows = app.db.execute('''
-        SELECT 
-            AVG(pr.rating) AS average_rating,
-            MIN(pr.rating) AS lowest_rating,
-            MAX(pr.rating) AS highest_rating,
-            COUNT(pr.rating) AS total_ratings
-        FROM ProductReview pr
-        WHERE pr.product_name = :product_name
-        ''', product_name=product_name)
-        
-        return {
-            'average_rating' : rows[0][0] if rows else None,
-            'lowest_rating' : rows[0][1] if rows else None,
-            'highest_rating' : rows[0][2] if rows else None,
-            'total_ratings' : rows[0][3] if rows else None
-        }
+        return RatingHistogram.get('product', product_name).summary()
 
     ## CREATE, UPDATE, DELETE PRODUCT REVIEW ##
 
@@ -166,10 +136,29 @@ class ProductReview:
     # Write a new product review
     def new_product_review(product_name, buyer_id, rating, comment, date_time):
         try:
-            rows = app.db.execute('''
-            INSERT INTO ProductReview (product_name, buyer_id, rating, comment, date_time)
-            VALUES (:product_name, :buyer_id, :rating, :comment, :date_time)
+            # same statement also folds the rating into the ProductStats summary and the rating histogram
+            rows = app.db.execute(f'''
+            WITH ins AS (
+                INSERT INTO ProductReview (product_name, buyer_id, rating, comment, date_time)
+                VALUES (:product_name, :buyer_id, :rating, :comment, :date_time)
+                RETURNING product_name, rating
+            ), hist AS (
+                INSERT INTO ProductRatingHistogram (product_name, {RatingHistogram.COLUMNS})
+                SELECT ins.product_name, {RatingHistogram.one_hot('ins.rating')}
+                FROM ins
+                ON CONFLICT (product_name) DO UPDATE
+                SET {RatingHistogram.add_excluded('ProductRatingHistogram')}
+            )
+            INSERT INTO ProductStats (product_name, min_price, total_reviews, rating_sum)
+            SELECT ins.product_name,
+                (SELECT MIN(price) FROM ProductListing pl WHERE pl.product_name = ins.product_name),
+                1, ins.rating
+            FROM ins
+            ON CONFLICT (product_name) DO UPDATE
+            SET total_reviews = ProductStats.total_reviews + 1,
+                rating_sum = ProductStats.rating_sum + EXCLUDED.rating_sum
             ''', product_name=product_name, buyer_id=buyer_id, rating=rating, comment=comment, date_time=date_time)
+            ContentVersion.bump([product_name])
             return True
         except Exception as e:
             print(f"Failed to write item: {e}")
@@ -179,11 +168,26 @@ class ProductReview:
     # Delete product review
     def delete_product_review(product_name, buyer_id):
         try:
-            rows = app.db.execute('''
-            DELETE 
-            FROM ProductReview
-            WHERE product_name = :product_name AND buyer_id = :buyer_id
+            # same statement also takes the rating back out of the ProductStats summary and the histogram
+            rows = app.db.execute(f'''
+            WITH del AS (
+                DELETE 
+                FROM ProductReview
+                WHERE product_name = :product_name AND buyer_id = :buyer_id
+                RETURNING product_name, rating
+            ), hist AS (
+                UPDATE ProductRatingHistogram h
+                SET {RatingHistogram.shift('h', removed='del.rating')}
+                FROM del
+                WHERE h.product_name = del.product_name
+            )
+            UPDATE ProductStats ps
+            SET total_reviews = ps.total_reviews - 1,
+                rating_sum = ps.rating_sum - del.rating
+            FROM del
+            WHERE ps.product_name = del.product_name
             ''', product_name=product_name, buyer_id=buyer_id)
+            ContentVersion.bump([product_name])
             return True
         except Exception as e:
             print(f"Failed to delete item: {e}")
@@ -193,11 +197,29 @@ class ProductReview:
     # Edit product review
     def edit_product_review(product_name, buyer_id, rating, comment, date_time):
         try:
-            rows = app.db.execute('''
-                UPDATE ProductReview 
-                SET rating = :rating, comment = :comment, date_time = :date_time
-                WHERE product_name = :product_name AND buyer_id = :buyer_id
+            # old.rating is read from the statement snapshot, i.e. before the update is applied
+            rows = app.db.execute(f'''
+                WITH old AS (
+                    SELECT product_name, rating
+                    FROM ProductReview
+                    WHERE product_name = :product_name AND buyer_id = :buyer_id
+                ), upd AS (
+                    UPDATE ProductReview 
+                    SET rating = :rating, comment = :comment, date_time = :date_time
+                    WHERE product_name = :product_name AND buyer_id = :buyer_id
+                    RETURNING product_name, rating
+                ), hist AS (
+                    UPDATE ProductRatingHistogram h
+                    SET {RatingHistogram.shift('h', added='upd.rating', removed='old.rating')}
+                    FROM upd JOIN old ON old.product_name = upd.product_name
+                    WHERE h.product_name = upd.product_name
+                )
+                UPDATE ProductStats ps
+                SET rating_sum = ps.rating_sum + upd.rating - old.rating
+                FROM upd JOIN old ON old.product_name = upd.product_name
+                WHERE ps.product_name = upd.product_name
                 ''', product_name=product_name, buyer_id=buyer_id, rating=rating, comment=comment, date_time=date_time)
+            ContentVersion.bump([product_name])
             return True
         except Exception as e:
             print(f"Failed to delete item: {e}")
@@ -209,7 +231,7 @@ class ProductReview:
     # Get the most recent k product reviews authored by a specific user, along with product names
     def get_k_recent_product_reviews_by_user(uid, k):
         rows = app.db.execute('''
-        SELECT pr.buyer_id, pr.product_name, pr.rating, pr.comment, pr.date_time
+        SELECT pr.buyer_id, pr.product_name, pr.rating, pr.comment, pr.date_time, pr.upvote_count
         FROM ProductReview pr
         JOIN ProductListing p ON pr.product_name = p.product_name
         WHERE pr.buyer_id = :uid
@@ -225,7 +247,7 @@ class ProductReview:
     def get_paginated_product_reviews_by_user(uid, page, items_per_page):
         offset = (page - 1) * items_per_page # calculate offset
         rows = app.db.execute('''
-        SELECT pr.buyer_id, pr.product_name, pr.rating, pr.comment, pr.date_time
+        SELECT pr.buyer_id, pr.product_name, pr.rating, pr.comment, pr.date_time, pr.upvote_count
         FROM ProductReview pr
         JOIN ProductCatalog p ON pr.product_name = p.product_name
         WHERE pr.buyer_id = :uid
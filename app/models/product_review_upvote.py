@@ -1,4 +1,6 @@
 from flask import current_app as app
+from .content_version import ContentVersion
+from app.db import retry_serializable
 
 class ProductReviewUpvote:
     def __init__(self, buyer_id, product_id, voter_id):
@@ -9,22 +11,59 @@ class ProductReviewUpvote:
     @staticmethod
     # Get the total number of upvotes for a specific product review
     def get_product_review_upvotes(product_name, buyer_id):
-        # get the total count of upvotes
+        # the count is kept on the review row by the upvote writes below, plus the clicks still
+        # waiting in app.upvote_buffer (checked against the stored upvotes of the same voters)
+        overlay = app.upvote_buffer.overlay('product', (product_name, buyer_id))
         rows = app.db.execute('''
-        SELECT COUNT(*) AS upvote_count
-        FROM ProductReviewUpvote pru
-        WHERE pru.buyer_id = :buyer_id AND pru.product_name = :product_name
-        ''', buyer_id=buyer_id, product_name=product_name)
-        upvote_count = rows[0][0] if rows else 0
+        SELECT upvote_count, ARRAY(
+            SELECT voter_id
+            FROM ProductReviewUpvote
+            WHERE buyer_id = :buyer_id AND product_name = :product_name
+                AND voter_id = ANY(CAST(:voter_ids AS INT[])))
+        FROM ProductReview
+        WHERE buyer_id = :buyer_id AND product_name = :product_name
+        ''', buyer_id=buyer_id, product_name=product_name, voter_ids=list(overlay))
+        upvote_count = app.upvote_buffer.adjust_count(rows[0][0], set(rows[0][1]), overlay) if rows else 0
         
         product_review_upvotes = {
             "upvote_count": upvote_count
         }
         return product_review_upvotes
     
+    @staticmethod
+    # Upvote count and whether voter_id (None when logged out) upvoted, for several reviews of a
+    # product at once: buyer_id -> {"upvote_count", "user_upvoted"}. Reviews that don't exist are left out
+    def get_product_review_upvote_info(product_name, buyer_ids, voter_id=None):
+        overlays = {buyer_id: app.upvote_buffer.overlay('product', (product_name, buyer_id)) for buyer_id in buyer_ids}
+        # the voters whose stored upvotes matter: the current user and everyone with a buffered click
+        voter_ids = {voter for overlay in overlays.values() for voter in overlay}
+        if voter_id is not None:
+            voter_ids.add(voter_id)
+        rows = app.db.execute('''
+        SELECT pr.buyer_id, pr.upvote_count, ARRAY(
+            SELECT pru.voter_id
+            FROM ProductReviewUpvote pru
+            WHERE pru.product_name = pr.product_name AND pru.buyer_id = pr.buyer_id
+                AND pru.voter_id = ANY(CAST(:voter_ids AS INT[])))
+        FROM ProductReview pr
+        WHERE pr.product_name = :product_name AND pr.buyer_id = ANY(CAST(:buyer_ids AS INT[]))
+        ''', product_name=product_name, buyer_ids=list(buyer_ids), voter_ids=list(voter_ids))
+        upvote_info = {}
+        for buyer_id, upvote_count, stored in rows:
+            stored, overlay = set(stored), overlays[buyer_id]
+            upvote_info[buyer_id] = {
+                "upvote_count": app.upvote_buffer.adjust_count(upvote_count, stored, overlay),
+                "user_upvoted": overlay.get(voter_id, voter_id in stored) if voter_id is not None else False
+            }
+        return upvote_info
+
     @staticmethod
     # Check if a user has an upvote
     def check_user_product_review_upvote(product_name, buyer_id, voter_id):
+        # their latest click wins when it isn't written yet
+        overlay = app.upvote_buffer.overlay('product', (product_name, buyer_id))
+        if voter_id in overlay:
+            return overlay[voter_id]
         rows = app.db.execute('''
         SELECT *
         FROM ProductReviewUpvote
@@ -35,11 +74,24 @@ class ProductReviewUpvote:
     @staticmethod
     # Upvote a product review
     def upvote_product_review(product_name, buyer_id, voter_id):
+        if app.upvote_buffer.enabled:
+            # written with the other clicks by the buffer's next flush
+            app.upvote_buffer.record('product', (product_name, buyer_id), voter_id, True)
+            return True
         try:
+            # add the upvote and count it on the review in the same statement
             rows = app.db.execute('''
-            INSERT INTO ProductReviewUpvote (product_name, buyer_id, voter_id)
-            VALUES (:product_name, :buyer_id, :voter_id)
+            WITH voted AS (
+                INSERT INTO ProductReviewUpvote (product_name, buyer_id, voter_id)
+                VALUES (:product_name, :buyer_id, :voter_id)
+                RETURNING product_name, buyer_id
+            )
+            UPDATE ProductReview pr
+            SET upvote_count = pr.upvote_count + 1
+            FROM voted v
+            WHERE pr.product_name = v.product_name AND pr.buyer_id = v.buyer_id
             ''', product_name=product_name, buyer_id=buyer_id, voter_id=voter_id)
+            ContentVersion.bump([product_name])
             return True
         except Exception as e:
             print(f"Failed to write item: {e}")
@@ -48,12 +100,23 @@ class ProductReviewUpvote:
     @staticmethod
     # Remove upvote for a product review
     def remove_upvote_product_review(product_name, buyer_id, voter_id):
+        if app.upvote_buffer.enabled:
+            app.upvote_buffer.record('product', (product_name, buyer_id), voter_id, False)
+            return True
         try:
             rows = app.db.execute('''
-                DELETE 
-                FROM ProductReviewUpvote
-                WHERE product_name = :product_name AND buyer_id = :buyer_id AND voter_id = :voter_id
+                WITH removed AS (
+                    DELETE 
+                    FROM ProductReviewUpvote
+                    WHERE product_name = :product_name AND buyer_id = :buyer_id AND voter_id = :voter_id
+                    RETURNING product_name, buyer_id
+                )
+                UPDATE ProductReview pr
+                SET upvote_count = pr.upvote_count - 1
+                FROM removed r
+                WHERE pr.product_name = r.product_name AND pr.buyer_id = r.buyer_id
                 ''', product_name=product_name, buyer_id=buyer_id, voter_id=voter_id)
+            ContentVersion.bump([product_name])
             return True
         except Exception as e:
             print(f"Failed to delete item: {e}")
@@ -62,13 +125,68 @@ class ProductReviewUpvote:
     @staticmethod
     # Remove all upvotes for a product review (in the case that a product review is deleted)
     def delete_product_review_upvotes(product_name, buyer_id):
+        app.upvote_buffer.discard('product', (product_name, buyer_id))
         try:
             rows = app.db.execute('''
-                DELETE 
-                FROM ProductReviewUpvote
+                WITH removed AS (
+                    DELETE 
+                    FROM ProductReviewUpvote
+                    WHERE product_name = :product_name AND buyer_id = :buyer_id
+                )
+                UPDATE ProductReview
+                SET upvote_count = 0
                 WHERE product_name = :product_name AND buyer_id = :buyer_id
                 ''', product_name=product_name, buyer_id=buyer_id)
+            ContentVersion.bump([product_name])
             return True
         except Exception as e:
             print(f"Failed to delete items: {e}")
-            return False
\ No newline at end of file
+            return False
+
+    # write a batch of buffered clicks (see controllers/upvoteBuffer.py): rows of
+    # (product_name, buyer_id, voter_id, upvoted), at most one per review and voter. Adds and removes
+    # the upvotes that differ from what is stored, skipping reviews that are gone, and moves the
+    # reviews' counts by the net change, all in one statement
+    @staticmethod
+    @retry_serializable()
+    def apply_upvotes(rows):
+        product_names, buyer_ids, voter_ids, upvoted = (list(column) for column in zip(*rows))
+        changed = app.db.execute('''
+        WITH clicks AS (
+            SELECT *
+            FROM unnest(CAST(:product_names AS VARCHAR[]), CAST(:buyer_ids AS INT[]),
+                        CAST(:voter_ids AS INT[]), CAST(:upvoted AS BOOLEAN[]))
+                AS c(product_name, buyer_id, voter_id, upvoted)
+        ),
+        added AS (
+            INSERT INTO ProductReviewUpvote (product_name, buyer_id, voter_id)
+            SELECT c.product_name, c.buyer_id, c.voter_id
+            FROM clicks c
+            JOIN ProductReview pr ON pr.product_name = c.product_name AND pr.buyer_id = c.buyer_id
+            WHERE c.upvoted
+            ON CONFLICT DO NOTHING
+            RETURNING product_name, buyer_id
+        ),
+        removed AS (
+            DELETE FROM ProductReviewUpvote pru
+            USING clicks c
+            WHERE NOT c.upvoted AND pru.product_name = c.product_name AND pru.buyer_id = c.buyer_id
+                AND pru.voter_id = c.voter_id
+            RETURNING pru.product_name, pru.buyer_id
+        )
+        UPDATE ProductReview pr
+        SET upvote_count = pr.upvote_count + d.delta
+        FROM (
+            SELECT product_name, buyer_id, SUM(delta) AS delta
+            FROM (
+                SELECT product_name, buyer_id, 1 AS delta FROM added
+                UNION ALL
+                SELECT product_name, buyer_id, -1 FROM removed
+            ) changes
+            GROUP BY product_name, buyer_id
+        ) d
+        WHERE pr.product_name = d.product_name AND pr.buyer_id = d.buyer_id AND d.delta <> 0
+        RETURNING pr.product_name
+        ''', product_names=product_names, buyer_ids=buyer_ids, voter_ids=voter_ids, upvoted=upvoted)
+        if changed:
+            ContentVersion.bump({row[0] for row in changed})
@@ -0,0 +1,93 @@
+from flask import current_app as app
+from sqlalchemy import text
+
+# ProductStats is a per product_name summary (cheapest listing price, review count and rating sum,
+# number of purchases) that the catalog page reads instead of aggregating ProductReview and
+# OrderContains on every request. It is kept current by the write paths in CartDAL.place_order,
+# ProductReview (new/edit/delete) and Seller (catalog, listing and price changes).
+class ProductStats:
+    # recompute the summary from the raw tables, one row per catalog entry
+    COMPUTE_QUERY = '''
+        SELECT pc.product_name,
+            mp.min_price,
+            COALESCE(pr.total_reviews, 0) AS total_reviews,
+            COALESCE(pr.rating_sum, 0) AS rating_sum,
+            COALESCE(o.total_purchases, 0) AS total_purchases
+        FROM ProductCatalog pc
+        LEFT JOIN (
+            SELECT product_name, MIN(price) AS min_price
+            FROM ProductListing
+            GROUP BY product_name
+        ) mp ON mp.product_name = pc.product_name
+        LEFT JOIN (
+            SELECT product_name, COUNT(rating) AS total_reviews, SUM(rating) AS rating_sum
+            FROM ProductReview
+            GROUP BY product_name
+        ) pr ON pr.product_name = pc.product_name
+        LEFT JOIN (
+            SELECT pl.product_name, COUNT(oc.product_id) AS total_purchases
+            FROM OrderContains oc
+            JOIN ProductListing pl ON pl.product_id = oc.product_id
+            GROUP BY pl.product_name
+        ) o ON o.product_name = pc.product_name
+    '''
+
+    # average rating as displayed on the catalog page (rounded to one decimal, 0 when unreviewed)
+    AVG_RATING = "COALESCE(ROUND(ps.rating_sum::numeric / NULLIF(ps.total_reviews, 0), 1), 0)"
+
+    def __init__(self, product_name, min_price, total_reviews, rating_sum, total_purchases):
+        self.product_name = product_name
+        self.min_price = min_price
+        self.total_reviews = total_reviews
+        self.rating_sum = rating_sum
+        self.total_purchases = total_purchases
+
+    @staticmethod
+    def get(product_name):
+        rows = app.db.execute('''
+        SELECT product_name, min_price, total_reviews, rating_sum, total_purchases
+        FROM ProductStats
+        WHERE product_name = :product_name
+        ''', product_name=product_name)
+        return ProductStats(*(rows[0])) if rows else None
+
+    @staticmethod
+    # Throw away the summary and rebuild it from ProductListing, ProductReview and OrderContains
+    def rebuild():
+        with app.db.begin_maintenance() as conn:
+            conn.execute(text('DELETE FROM ProductStats'))
+            result = conn.execute(text(f'''
+                INSERT INTO ProductStats (product_name, min_price, total_reviews, rating_sum, total_purchases)
+                {ProductStats.COMPUTE_QUERY}
+            '''))
+            return result.rowcount
+
+    @staticmethod
+    # Compare the summary against the raw tables, returns one dict per product that has drifted
+    def check_consistency():
+        with app.db.begin_maintenance():
+            rows = app.db.execute(f'''
+            SELECT COALESCE(s.product_name, c.product_name),
+                s.min_price, c.min_price,
+                s.total_reviews, c.total_reviews,
+                s.rating_sum, c.rating_sum,
+                s.total_purchases, c.total_purchases
+            FROM ProductStats s
+            FULL OUTER JOIN ({ProductStats.COMPUTE_QUERY}) c ON c.product_name = s.product_name
+            WHERE s.product_name IS NULL OR c.product_name IS NULL
+                OR s.min_price IS DISTINCT FROM c.min_price
+                OR s.total_reviews <> c.total_reviews
+                OR s.rating_sum <> c.rating_sum
+                OR s.total_purchases <> c.total_purchases
+            ORDER BY 1
+            ''')
+        return [
+            {
+                'product_name': row[0],
+                'min_price': (row[1], row[2]),
+                'total_reviews': (row[3], row[4]),
+                'rating_sum': (row[5], row[6]),
+                'total_purchases': (row[7], row[8])
+            }
+            for row in rows
+        ]
@@ -0,0 +1,116 @@
+from decimal import Decimal
+
+from flask import current_app as app
+from sqlalchemy import text
+
+STARS = (1, 2, 3, 4, 5)
+
+# Number of reviews per star rating of every product (ProductRatingHistogram) and seller
+# (SellerRatingHistogram). Count, average, lowest and highest rating and the distribution shown in
+# the rating summaries all follow from the five counters, so a summary is one row lookup instead of
+# aggregating the entity's reviews. The review write paths in ProductReview and SellerReview move
+# the counters in the same statement as the review; `flask ratings check` compares them against the
+# reviews and `flask ratings rebuild` recomputes them.
+class RatingHistogram:
+    # table, key column and review table per kind
+    TABLES = {
+        'product': ('ProductRatingHistogram', 'product_name', 'ProductReview'),
+        'seller': ('SellerRatingHistogram', 'seller_id', 'SellerReview'),
+    }
+    COLUMNS = ', '.join(f"star_{star}" for star in STARS)
+
+    # SQL pieces for the review write statements
+
+    @staticmethod
+    # the counters of a single rating, for INSERT ... SELECT
+    def one_hot(rating):
+        return ', '.join(f"({rating} = {star})::int" for star in STARS)
+
+    @staticmethod
+    # ON CONFLICT DO UPDATE assignments adding the EXCLUDED counters
+    def add_excluded(table):
+        return ', '.join(f"star_{star} = {table}.star_{star} + EXCLUDED.star_{star}" for star in STARS)
+
+    @staticmethod
+    # UPDATE assignments moving one review from the removed rating to the added one (either may be
+    # None for a review that is only written or only deleted)
+    def shift(alias, added=None, removed=None):
+        terms = []
+        for star in STARS:
+            term = f"star_{star} = {alias}.star_{star}"
+            if added is not None:
+                term += f" + ({added} = {star})::int"
+            if removed is not None:
+                term += f" - ({removed} = {star})::int"
+            terms.append(term)
+        return ', '.join(terms)
+
+    # recompute the counters of every reviewed entity of a kind from its reviews
+    @staticmethod
+    def compute_query(kind):
+        table, key, reviews = RatingHistogram.TABLES[kind]
+        counts = ', '.join(f"COUNT(*) FILTER (WHERE rating = {star})" for star in STARS)
+        return f'''
+            SELECT {key}, {counts}
+            FROM {reviews}
+            GROUP BY {key}
+        '''
+
+    def __init__(self, counts):
+        self.counts = dict(zip(STARS, counts))
+
+    # the rating summary of the entity, same keys as the old aggregate plus the star distribution
+    def summary(self):
+        total = sum(self.counts.values())
+        rated = [star for star in STARS if self.counts[star]]
+        return {
+            # a numeric like postgres' AVG gave
+            'average_rating': (Decimal(sum(star * count for star, count in self.counts.items())) / total)
+                .quantize(Decimal('1e-16')) if total else None,
+            'lowest_rating': rated[0] if rated else None,
+            'highest_rating': rated[-1] if rated else None,
+            'total_ratings': total,
+            'rating_distribution': {star: self.counts[star] for star in STARS}
+        }
+
+    @staticmethod
+    # histogram of a product (kind 'product', key product_name) or seller (kind 'seller', key seller_id),
+    # all zeros when it has no reviews
+    def get(kind, key):
+        table, key_column, reviews = RatingHistogram.TABLES[kind]
+        rows = app.db.execute(f'''
+        SELECT {RatingHistogram.COLUMNS}
+        FROM {table}
+        WHERE {key_column} = :key
+        ''', key=key)
+        return RatingHistogram(rows[0] if rows else (0,) * len(STARS))
+
+    @staticmethod
+    # throw away the histograms of a kind and recompute them from the reviews, returns how many entities have reviews
+    def rebuild(kind):
+        table, key, reviews = RatingHistogram.TABLES[kind]
+        with app.db.begin_maintenance() as conn:
+            conn.execute(text(f'DELETE FROM {table}'))
+            result = conn.execute(text(f'''
+                INSERT INTO {table} ({key}, {RatingHistogram.COLUMNS})
+                {RatingHistogram.compute_query(kind)}
+            '''))
+            return result.rowcount
+
+    @staticmethod
+    # compare the histograms of a kind against the reviews, returns (key, stored counts, actual counts)
+    # for every entity that drifted
+    def check_consistency(kind):
+        table, key, reviews = RatingHistogram.TABLES[kind]
+        stored = ', '.join(f"COALESCE(s.star_{star}, 0)" for star in STARS)
+        actual = ', '.join(f"COALESCE(c.star_{star}, 0)" for star in STARS)
+        with app.db.begin_maintenance():
+            rows = app.db.execute(f'''
+            SELECT COALESCE(s.{key}, c.{key}), ARRAY[{stored}], ARRAY[{actual}]
+            FROM {table} s
+            FULL OUTER JOIN ({RatingHistogram.compute_query(kind)}) c ({key}, {RatingHistogram.COLUMNS})
+                ON c.{key} = s.{key}
+            WHERE ARRAY[{stored}] <> ARRAY[{actual}]
+            ORDER BY 1
+            ''')
+        return [(row[0], list(row[1]), list(row[2])) for row in rows]
@@ -1,8 +1,14 @@
 from flask import current_app as app
 from app.models.product import Product
+from app.db import retry_serializable
+from app.models.content_version import ContentVersion
+from app.models.product_stats import ProductStats
 from datetime import datetime
 
 class OrderInfo:
+    __slots__ = ('product_id', 'order_quantity', 'at_price', 'fulfillment_time', 'name', 'price', 'category',
+                 'description', 'image_url', 'product_quantity', 'date_time', 'fulfillment_status', 'address',
+                 'purchase_id')
 
     def __init__(self, product_id, order_quantity, at_price, fulfillment_time,
                  name, price, category, description, image_url, product_quantity, 
@@ -22,16 +28,61 @@ class OrderInfo:
         self.address = address
         self.purchase_id = purchase_id
 
+    # what the seller order pages show of an ordered item
+    def to_dict(self):
+        return {
+            "product_id": self.product_id,
+            'purchase_id': self.purchase_id,
+            "order_quantity": self.order_quantity,
+            "at_price": self.at_price,
+            "fulfillment_time": self.fulfillment_time,
+            "name": self.name,
+            "price": self.price,
+            "category": self.category,
+            "description": self.description,
+            "image_url": self.image_url,
+            "product_quantity": self.product_quantity,
+            "date_time": self.date_time,
+            "fulfillment_status": str(self.fulfillment_status),
+            'address': self.address,
+        }
+
 class Seller:
+    # fold the price of the listing written by the {cte} statement into the ProductStats summary.
+    # a seller has at most one listing per product, and the subquery sees the pre-statement
+    # snapshot, so their listing is excluded and the new price used instead
+    REFRESH_MIN_PRICE = '''
+    INSERT INTO ProductStats(product_name, min_price)
+    SELECT {cte}.product_name, LEAST({cte}.price, (
+        SELECT MIN(pl.price)
+        FROM ProductListing pl
+        WHERE pl.product_name = {cte}.product_name AND pl.seller_id <> :seller_id))
+    FROM {cte}
+    ON CONFLICT (product_name) DO UPDATE SET min_price = EXCLUDED.min_price
+    '''
+
+    # a write to these products committed: move their ContentVersions on (new ETags, cache keys)
+    # and drop their cached catalog reads in this worker. categories are extra ones to bump
+    @staticmethod
+    def product_changed(product_names, categories=()):
+        product_names = set(product_names)
+        if not product_names:
+            return
+        ContentVersion.bump(product_names, categories)
+        for product_name in product_names:
+            app.catalog_cache.invalidate(product_name)
+
     # update quantity column in listing table
     @staticmethod
     def change_product_quantity(product_id, quantity):
         try:
-            app.db.execute("""
+            rows = app.db.execute("""
             UPDATE ProductListing
             SET quantity = :quantity
             WHERE product_id = :product_id
+            RETURNING product_name
         """, product_id=product_id, quantity=quantity)
+            Seller.product_changed(row[0] for row in rows)
             return True
         except Exception as e:
             print(f"Failed to update item: {e}")
@@ -41,11 +92,25 @@ class Seller:
     @staticmethod
     def change_product_price(product_id, price):
         try:
-            app.db.execute("""
-            UPDATE ProductListing
-            SET price = :price
-            WHERE product_id = :product_id
+            # refresh the cheapest price in ProductStats in the same statement; the subquery
+            # still sees the old price of this listing so it is excluded and :price used instead
+            rows = app.db.execute("""
+            WITH upd AS (
+                UPDATE ProductListing
+                SET price = :price
+                WHERE product_id = :product_id
+                RETURNING product_name, price
+            )
+            UPDATE ProductStats ps
+            SET min_price = LEAST(upd.price, (
+                SELECT MIN(pl.price)
+                FROM ProductListing pl
+                WHERE pl.product_name = upd.product_name AND pl.product_id <> :product_id))
+            FROM upd
+            WHERE ps.product_name = upd.product_name
+            RETURNING ps.product_name
         """, product_id=product_id, price=price)
+            Seller.product_changed(row[0] for row in rows)
             return True
         except Exception as e:
             print(f"Failed to update item: {e}")
@@ -67,7 +132,17 @@ class Seller:
     @staticmethod
     def fulfill_order_item(purchase_id, product_id):
         try:
-            app.db.execute('BEGIN')
+            Seller.mark_item_fulfilled(purchase_id, product_id)
+            return True
+        except Exception as e:
+            print(f"Failed to fulfill order item: {e}")
+            return False
+
+    # the fulfillment itself, one SERIALIZABLE transaction that is rerun if it races another one
+    @staticmethod
+    @retry_serializable()
+    def mark_item_fulfilled(purchase_id, product_id):
+        with app.db.begin():
             # Mark specific items as fulfilled
             current_time = datetime.now()
             app.db.execute('''
@@ -93,23 +168,21 @@ class Seller:
                 WHERE purchase_id = :purchase_id
                 ''', purchase_id=purchase_id)
 
-            app.db.execute('COMMIT')
-            return True
-        except Exception as e:
-            app.db.execute('ROLLBACK')
-            print(f"Failed to fulfill order item: {e}")
-            return False
-
     # update columns of product catalog table
     @staticmethod
     def update_product_catlog(name, category, description, image_url):
         try:
-            app.db.execute('''
-            UPDATE ProductCatalog 
+            # old.category is the category before the update, its pages change too
+            rows = app.db.execute('''
+            UPDATE ProductCatalog pc
             SET category=:category, description=:description, image_url=:image_url
-            WHERE product_name = :name
+            FROM (SELECT category FROM ProductCatalog WHERE product_name = :name) old
+            WHERE pc.product_name = :name
+            RETURNING old.category
             ''',
             name=name,category=category,description=description,image_url=image_url)
+            app.suggestions.update(name, category)
+            Seller.product_changed([name], [row[0] for row in rows])
             return True
         except Exception as e:
             print(f"Failed to add product: {e}")
@@ -168,10 +241,17 @@ class Seller:
             seller_status = Seller.is_seller(creator_id)
             if not seller_status:
                 Seller.add_seller(creator_id)
+            # every catalog entry gets an (empty) ProductStats row
             app.db.execute('''
-            INSERT INTO ProductCatalog(product_name, category, image_url, description, creator_id)
-            VALUES(:product_name, :category, :image_url, :description, :creator_id)''',
+            WITH ins AS (
+                INSERT INTO ProductCatalog(product_name, category, image_url, description, creator_id)
+                VALUES(:product_name, :category, :image_url, :description, :creator_id)
+                RETURNING product_name
+            )
+            INSERT INTO ProductStats(product_name)
+            SELECT product_name FROM ins''',
             product_name=product_name, category=category, image_url=image_url, description=description, creator_id=creator_id)
+            app.suggestions.add(product_name, category)
             return True
         except Exception as e:
             print(f"Failed to add product: {e}")
@@ -181,11 +261,13 @@ class Seller:
     @staticmethod
     def remove_listing(product_id):
         try:
-            app.db.execute('''
+            rows = app.db.execute('''
             UPDATE ProductListing
             SET active = false
             WHERE product_id =:product_id
+            RETURNING product_name
             ''', product_id=product_id)
+            Seller.product_changed(row[0] for row in rows)
             return True
         except Exception as e:
             print(f"Failed to delete product: {e}")
@@ -197,16 +279,26 @@ class Seller:
     def add_product_listing(product_name, seller_id, price, quantity):
        try:
             if (Seller.check_if_already_sold(product_name, seller_id)):
-                app.db.execute('''
-                               UPDATE ProductListing
-                               SET price=:price, quantity=:quantity
-                               WHERE product_name=:product_name AND seller_id=:seller_id
+                app.db.execute(f'''
+                               WITH upd AS (
+                                   UPDATE ProductListing
+                                   SET price=:price, quantity=:quantity
+                                   WHERE product_name=:product_name AND seller_id=:seller_id
+                                   RETURNING product_name, price
+                               )
+                               {Seller.REFRESH_MIN_PRICE.format(cte='upd')}
                                ''', price=price, quantity=quantity, product_name=product_name, seller_id=seller_id)
+                Seller.product_changed([product_name])
                 return True
-            app.db.execute('''
-            INSERT INTO ProductListing(product_name, seller_id, price, quantity)
-            VALUES(:product_name, :seller_id, :price, :quantity)''',
+            app.db.execute(f'''
+            WITH ins AS (
+                INSERT INTO ProductListing(product_name, seller_id, price, quantity)
+                VALUES(:product_name, :seller_id, :price, :quantity)
+                RETURNING product_name, price
+            )
+            {Seller.REFRESH_MIN_PRICE.format(cte='ins')}''',
             product_name=product_name, seller_id=seller_id, price=price, quantity=quantity)
+            Seller.product_changed([product_name])
             return True
        except Exception as e:
             print(f"Failed to add product: {e}")
@@ -303,24 +395,19 @@ class Seller:
     # get products for a seller w/o pagination
     @staticmethod
     def get_products_by_seller(seller_id):
-        rows = app.db.execute('''
+        # review count and average come from the maintained ProductStats summary
+        rows = app.db.execute(f'''
         SELECT p.product_id, p.product_name, seller_id, price, quantity, category, image_url,
                 description, creator_id, 
-                COALESCE(pr.total_reviews, 0) AS total_reviews,
-                COALESCE(pr.average_rating, 0) AS avg_rating,
+                COALESCE(ps.total_reviews, 0) AS total_reviews,
+                {ProductStats.AVG_RATING} AS avg_rating,
                 COALESCE(o.total_purchases, 0) AS total_purchases
 
         FROM ProductListing p
 
         NATURAL JOIN ProductCatalog
 
-        LEFT JOIN (
-            SELECT product_name,
-                   COUNT(rating) AS total_reviews,
-                   ROUND(AVG(rating), 1) AS average_rating
-            FROM ProductReview
-            GROUP BY product_name
-        ) pr ON p.product_name = pr.product_name
+        LEFT JOIN ProductStats ps ON ps.product_name = p.product_name
 
         LEFT JOIN (
             SELECT product_id,
@@ -1,7 +1,10 @@
 from flask import current_app as app
 from datetime import datetime
+from .rating_histogram import RatingHistogram
 
 class SellerReview:
+    __slots__ = ('buyer_id', 'seller_id', 'rating', 'comment', 'date_time', 'seller_firstname', 'seller_lastname')
+
     def __init__(self, buyer_id, seller_id, rating, comment, date_time, seller_firstname=None, seller_lastname=None):
         self.buyer_id = buyer_id
         self.seller_id = seller_id
@@ -70,31 +73,27 @@ class SellerReview:
         return [SellerReview(*row) for row in rows]
     
     @staticmethod
-    # Get the overall/average rating for a specific seller
+    # Get the overall/average rating for a specific seller (read from their rating histogram)
     def get_seller_review_summary(seller_id):
-        rows = app.db.execute('''
-        SELECT AVG(sr.rating) AS average_rating,
-            MIN(sr.rating) AS lowest_rating,
-            MAX(sr.rating) AS highest_rating,
-            COUNT(sr.rating) AS total_ratings
-        FROM SellerReview sr
-        WHERE sr.seller_id = :seller_id
-        ''', seller_id=seller_id)
-        return {
-            'average_rating' : rows[0][0] if rows else None,
-            'lowest_rating' : rows[0][1] if rows else None,
-            'highest_rating' : rows[0][2] if rows else None,
-            'total_ratings' : rows[0][3] if rows else None
-        }
+        return RatingHistogram.get('seller', seller_id).summary()
 
     
     @staticmethod
     # Write a new seller review
     def new_seller_review(seller_id, buyer_id, rating, comment, date_time):
         try:
-            rows = app.db.execute('''
-            INSERT INTO SellerReview (seller_id, buyer_id, rating, comment, date_time)
-            VALUES (:seller_id, :buyer_id, :rating, :comment, :date_time)
+            # same statement also counts the rating in the seller's rating histogram
+            rows = app.db.execute(f'''
+            WITH ins AS (
+                INSERT INTO SellerReview (seller_id, buyer_id, rating, comment, date_time)
+                VALUES (:seller_id, :buyer_id, :rating, :comment, :date_time)
+                RETURNING seller_id, rating
+            )
+            INSERT INTO SellerRatingHistogram (seller_id, {RatingHistogram.COLUMNS})
+            SELECT ins.seller_id, {RatingHistogram.one_hot('ins.rating')}
+            FROM ins
+            ON CONFLICT (seller_id) DO UPDATE
+            SET {RatingHistogram.add_excluded('SellerRatingHistogram')}
             ''', seller_id=seller_id, buyer_id=buyer_id, rating=rating, comment=comment, date_time=date_time)
             return True
         except Exception as e:
@@ -105,10 +104,18 @@ class SellerReview:
     # Delete seller review
     def delete_seller_review(seller_id, buyer_id):
         try:
-            rows = app.db.execute('''
-                DELETE 
-                FROM SellerReview
-                WHERE seller_id = :seller_id AND buyer_id = :buyer_id
+            # same statement also takes the rating out of the seller's rating histogram
+            rows = app.db.execute(f'''
+                WITH del AS (
+                    DELETE 
+                    FROM SellerReview
+                    WHERE seller_id = :seller_id AND buyer_id = :buyer_id
+                    RETURNING seller_id, rating
+                )
+                UPDATE SellerRatingHistogram h
+                SET {RatingHistogram.shift('h', removed='del.rating')}
+                FROM del
+                WHERE h.seller_id = del.seller_id
                 ''', seller_id=seller_id, buyer_id=buyer_id)
             return True
         except Exception as e:
@@ -119,10 +126,22 @@ class SellerReview:
     # Edit seller review
     def edit_seller_review(seller_id, buyer_id, rating, comment, date_time):
         try:
-            rows = app.db.execute('''
-                UPDATE SellerReview 
-                SET rating = :rating, comment = :comment, date_time = :date_time
-                WHERE seller_id = :seller_id AND buyer_id = :buyer_id
+            # old.rating is read from the statement snapshot, i.e. before the update is applied
+            rows = app.db.execute(f'''
+                WITH old AS (
+                    SELECT seller_id, rating
+                    FROM SellerReview
+                    WHERE seller_id = :seller_id AND buyer_id = :buyer_id
+                ), upd AS (
+                    UPDATE SellerReview 
+                    SET rating = :rating, comment = :comment, date_time = :date_time
+                    WHERE seller_id = :seller_id AND buyer_id = :buyer_id
+                    RETURNING seller_id, rating
+                )
+                UPDATE SellerRatingHistogram h
+                SET {RatingHistogram.shift('h', added='upd.rating', removed='old.rating')}
+                FROM upd JOIN old ON old.seller_id = upd.seller_id
+                WHERE h.seller_id = upd.seller_id
                 ''', seller_id=seller_id, buyer_id=buyer_id, rating=rating, comment=comment, date_time=date_time)
             return True
         except Exception as e:
@@ -177,39 +196,22 @@ class SellerReview:
         # 2) standard sorting options
 
         if sort_by == "top_helpful_recent":
-            # top 3 most helpful reviews is default by proj requirements for upvote
-            top_helpful_reviews = app.db.execute('''
-                SELECT sr.buyer_id, u.firstname, u.lastname, sr.seller_id, sr.rating, sr.comment, sr.date_time, COUNT(sru.voter_id) AS upvote_count
-                FROM SellerReview sr
-                JOIN Users u ON sr.buyer_id = u.user_id
-                LEFT JOIN SellerReviewUpvote sru 
-                ON sr.buyer_id = sru.buyer_id AND sr.seller_id = sru.seller_id
-                WHERE sr.seller_id = :seller_id
-                GROUP BY sr.buyer_id, u.firstname, u.lastname, sr.seller_id, sr.rating, sr.comment, sr.date_time
-                ORDER BY upvote_count DESC
-                LIMIT 3
-            ''', seller_id=seller_id)
-
-            # use buyer_id, seller_id to filter out the queries we need!
-            top_helpful_ids = [(row[0], row[3]) for row in top_helpful_reviews]
-
-            # get rest of reviews by time
-            all_recent_reviews = app.db.execute('''
-                SELECT sr.buyer_id, u.firstname, u.lastname, sr.seller_id, sr.rating, sr.comment, sr.date_time, COUNT(sru.voter_id) AS upvote_count
-                FROM SellerReview sr
-                JOIN Users u ON sr.buyer_id = u.user_id
-                LEFT JOIN SellerReviewUpvote sru 
-                ON sr.buyer_id = sru.buyer_id AND sr.seller_id = sru.seller_id
-                WHERE sr.seller_id = :seller_id AND (sr.buyer_id, sr.seller_id) NOT IN :top_helpful_ids
-                GROUP BY sr.buyer_id, u.firstname, u.lastname, sr.seller_id, sr.rating, sr.comment, sr.date_time
-                ORDER BY sr.date_time DESC
-            ''', seller_id=seller_id, top_helpful_ids=tuple(top_helpful_ids))
-
-            # combine results for special sorting case
-            combined_reviews = top_helpful_reviews + all_recent_reviews
-
-            # paginate combined list
-            paginated_combined_reviews = combined_reviews[offset : offset + items_per_page]
+            # top 3 most helpful reviews is default by proj requirements for upvote, then the rest by
+            # most recent -- one query, helpful_rank numbers the seller's reviews by upvotes and
+            # everything after the first 3 sorts as 4 and by date
+            paginated_combined_reviews = app.db.execute('''
+                SELECT buyer_id, firstname, lastname, seller_id, rating, comment, date_time, upvote_count
+                FROM (
+                    SELECT sr.buyer_id, u.firstname, u.lastname, sr.seller_id, sr.rating, sr.comment, sr.date_time,
+                        sr.upvote_count,
+                        ROW_NUMBER() OVER (ORDER BY sr.upvote_count DESC, sr.date_time DESC, sr.buyer_id) AS helpful_rank
+                    FROM SellerReview sr
+                    JOIN Users u ON sr.buyer_id = u.user_id
+                    WHERE sr.seller_id = :seller_id
+                ) ranked
+                ORDER BY LEAST(helpful_rank, 4), date_time DESC, buyer_id
+                LIMIT :items_per_page OFFSET :offset
+            ''', seller_id=seller_id, items_per_page=items_per_page, offset=offset)
 
             return [
                 {
@@ -228,7 +230,7 @@ class SellerReview:
         else:
             # all other sorting cases
             sort_column = {
-                "helpful": "upvote_count DESC, sr.date_time DESC",
+                "helpful": "sr.upvote_count DESC, sr.date_time DESC",
                 "rating_high": "sr.rating DESC",
                 "rating_low": "sr.rating ASC",
                 "date_newest": "sr.date_time DESC",
@@ -236,13 +238,10 @@ class SellerReview:
             }.get(sort_by)
 
             rows = app.db.execute(f'''
-                SELECT sr.buyer_id, u.firstname, u.lastname, sr.seller_id, sr.rating, sr.comment, sr.date_time, COUNT(sru.voter_id) AS upvote_count
+                SELECT sr.buyer_id, u.firstname, u.lastname, sr.seller_id, sr.rating, sr.comment, sr.date_time, sr.upvote_count
                 FROM SellerReview sr
                 JOIN Users u ON sr.buyer_id = u.user_id
-                LEFT JOIN SellerReviewUpvote sru 
-                ON sr.buyer_id = sru.buyer_id AND sr.seller_id = sru.seller_id
                 WHERE sr.seller_id = :seller_id
-                GROUP BY sr.buyer_id, u.firstname, u.lastname, sr.seller_id, sr.rating, sr.comment, sr.date_time
                 ORDER BY {sort_column}
                 LIMIT :items_per_page OFFSET :offset
             ''', seller_id=seller_id, items_per_page=items_per_page, offset=offset)
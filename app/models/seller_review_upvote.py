@@ -1,4 +1,5 @@
 from flask import current_app as app
+from app.db import retry_serializable
 
 class SellerReviewUpvote:
     def __init__(self, buyer_id, seller_id, voter_id):
@@ -9,17 +10,62 @@ class SellerReviewUpvote:
     @staticmethod
     # Get the total number of upvotes for a specific seller review
     def get(buyer_id, seller_id):
+        # the count is kept on the review row by the upvote writes below, plus the clicks still
+        # waiting in app.upvote_buffer (checked against the stored upvotes of the same voters)
+        overlay = app.upvote_buffer.overlay('seller', (seller_id, buyer_id))
         rows = app.db.execute('''
-        SELECT COUNT(*) AS upvote_count
-        FROM SellerReviewUpvote sru
-        WHERE sru.buyer_id = :buyer_id AND sru.seller_id = :seller_id
-        ''', buyer_id=buyer_id, seller_id=seller_id)
+        SELECT upvote_count, ARRAY(
+            SELECT voter_id
+            FROM SellerReviewUpvote
+            WHERE buyer_id = :buyer_id AND seller_id = :seller_id
+                AND voter_id = ANY(CAST(:voter_ids AS INT[])))
+        FROM SellerReview
+        WHERE buyer_id = :buyer_id AND seller_id = :seller_id
+        ''', buyer_id=buyer_id, seller_id=seller_id, voter_ids=list(overlay))
                 
-        return rows[0]['upvote_count'] if rows else 0
+        return app.upvote_buffer.adjust_count(rows[0][0], set(rows[0][1]), overlay) if rows else 0
+
+    @staticmethod
+    # Upvote info for a seller review, same shape as ProductReviewUpvote.get_product_review_upvotes
+    def get_seller_review_upvotes(seller_id, buyer_id):
+        return {
+            "upvote_count": SellerReviewUpvote.get(buyer_id, seller_id)
+        }
     
+    @staticmethod
+    # Upvote count and whether voter_id (None when logged out) upvoted, for several reviews of a
+    # seller at once: buyer_id -> {"upvote_count", "user_upvoted"}. Reviews that don't exist are left out
+    def get_seller_review_upvote_info(seller_id, buyer_ids, voter_id=None):
+        overlays = {buyer_id: app.upvote_buffer.overlay('seller', (seller_id, buyer_id)) for buyer_id in buyer_ids}
+        # the voters whose stored upvotes matter: the current user and everyone with a buffered click
+        voter_ids = {voter for overlay in overlays.values() for voter in overlay}
+        if voter_id is not None:
+            voter_ids.add(voter_id)
+        rows = app.db.execute('''
+        SELECT sr.buyer_id, sr.upvote_count, ARRAY(
+            SELECT sru.voter_id
+            FROM SellerReviewUpvote sru
+            WHERE sru.seller_id = sr.seller_id AND sru.buyer_id = sr.buyer_id
+                AND sru.voter_id = ANY(CAST(:voter_ids AS INT[])))
+        FROM SellerReview sr
+        WHERE sr.seller_id = :seller_id AND sr.buyer_id = ANY(CAST(:buyer_ids AS INT[]))
+        ''', seller_id=seller_id, buyer_ids=list(buyer_ids), voter_ids=list(voter_ids))
+        upvote_info = {}
+        for buyer_id, upvote_count, stored in rows:
+            stored, overlay = set(stored), overlays[buyer_id]
+            upvote_info[buyer_id] = {
+                "upvote_count": app.upvote_buffer.adjust_count(upvote_count, stored, overlay),
+                "user_upvoted": overlay.get(voter_id, voter_id in stored) if voter_id is not None else False
+            }
+        return upvote_info
+
     @staticmethod
     # Check if a user has an upvote
     def check_user_seller_review_upvote(seller_id, buyer_id, voter_id):
+        # their latest click wins when it isn't written yet
+        overlay = app.upvote_buffer.overlay('seller', (seller_id, buyer_id))
+        if voter_id in overlay:
+            return overlay[voter_id]
         rows = app.db.execute('''
         SELECT *
         FROM SellerReviewUpvote
@@ -30,10 +76,22 @@ class SellerReviewUpvote:
     @staticmethod
     # Upvote a seller review
     def upvote_seller_review(seller_id, buyer_id, voter_id):
+        if app.upvote_buffer.enabled:
+            # written with the other clicks by the buffer's next flush
+            app.upvote_buffer.record('seller', (seller_id, buyer_id), voter_id, True)
+            return True
         try:
+            # add the upvote and count it on the review in the same statement
             rows = app.db.execute('''
-            INSERT INTO SellerReviewUpvote (seller_id, buyer_id, voter_id)
-            VALUES (:seller_id, :buyer_id, :voter_id)
+            WITH voted AS (
+                INSERT INTO SellerReviewUpvote (seller_id, buyer_id, voter_id)
+                VALUES (:seller_id, :buyer_id, :voter_id)
+                RETURNING seller_id, buyer_id
+            )
+            UPDATE SellerReview sr
+            SET upvote_count = sr.upvote_count + 1
+            FROM voted v
+            WHERE sr.seller_id = v.seller_id AND sr.buyer_id = v.buyer_id
             ''', seller_id=seller_id, buyer_id=buyer_id, voter_id=voter_id)
             return True
         except Exception as e:
@@ -43,11 +101,21 @@ class SellerReviewUpvote:
     @staticmethod
     # Remove upvote for a seller review
     def remove_upvote_seller_review(seller_id, buyer_id, voter_id):
+        if app.upvote_buffer.enabled:
+            app.upvote_buffer.record('seller', (seller_id, buyer_id), voter_id, False)
+            return True
         try:
             rows = app.db.execute('''
-                DELETE 
-                FROM SellerReviewUpvote
-                WHERE seller_id = :seller_id AND buyer_id = :buyer_id AND voter_id = :voter_id
+                WITH removed AS (
+                    DELETE 
+                    FROM SellerReviewUpvote
+                    WHERE seller_id = :seller_id AND buyer_id = :buyer_id AND voter_id = :voter_id
+                    RETURNING seller_id, buyer_id
+                )
+                UPDATE SellerReview sr
+                SET upvote_count = sr.upvote_count - 1
+                FROM removed r
+                WHERE sr.seller_id = r.seller_id AND sr.buyer_id = r.buyer_id
                 ''', seller_id=seller_id, buyer_id=buyer_id, voter_id=voter_id)
             return True
         except Exception as e:
@@ -57,13 +125,63 @@ class SellerReviewUpvote:
     @staticmethod
     # Remove all upvotes for a seller review (in the case that a seller review is deleted)
     def delete_seller_review_upvotes(seller_id, buyer_id):
+        app.upvote_buffer.discard('seller', (seller_id, buyer_id))
         try:
             rows = app.db.execute('''
-                DELETE
-                FROM SellerReviewUpvote
+                WITH removed AS (
+                    DELETE
+                    FROM SellerReviewUpvote
+                    WHERE seller_id = :seller_id AND buyer_id = :buyer_id
+                )
+                UPDATE SellerReview
+                SET upvote_count = 0
                 WHERE seller_id = :seller_id AND buyer_id = :buyer_id
                 ''', seller_id=seller_id, buyer_id=buyer_id)
             return True
         except Exception as e:
             print(f"Failed to delete item: {e}")
-            return False
\ No newline at end of file
+            return False
+
+    # write a batch of buffered clicks (see controllers/upvoteBuffer.py): rows of
+    # (seller_id, buyer_id, voter_id, upvoted), at most one per review and voter. Same as
+    # ProductReviewUpvote.apply_upvotes
+    @staticmethod
+    @retry_serializable()
+    def apply_upvotes(rows):
+        seller_ids, buyer_ids, voter_ids, upvoted = (list(column) for column in zip(*rows))
+        app.db.execute('''
+        WITH clicks AS (
+            SELECT *
+            FROM unnest(CAST(:seller_ids AS INT[]), CAST(:buyer_ids AS INT[]),
+                        CAST(:voter_ids AS INT[]), CAST(:upvoted AS BOOLEAN[]))
+                AS c(seller_id, buyer_id, voter_id, upvoted)
+        ),
+        added AS (
+            INSERT INTO SellerReviewUpvote (seller_id, buyer_id, voter_id)
+            SELECT c.seller_id, c.buyer_id, c.voter_id
+            FROM clicks c
+            JOIN SellerReview sr ON sr.seller_id = c.seller_id AND sr.buyer_id = c.buyer_id
+            WHERE c.upvoted
+            ON CONFLICT DO NOTHING
+            RETURNING seller_id, buyer_id
+        ),
+        removed AS (
+            DELETE FROM SellerReviewUpvote sru
+            USING clicks c
+            WHERE NOT c.upvoted AND sru.seller_id = c.seller_id AND sru.buyer_id = c.buyer_id
+                AND sru.voter_id = c.voter_id
+            RETURNING sru.seller_id, sru.buyer_id
+        )
+        UPDATE SellerReview sr
+        SET upvote_count = sr.upvote_count + d.delta
+        FROM (
+            SELECT seller_id, buyer_id, SUM(delta) AS delta
+            FROM (
+                SELECT seller_id, buyer_id, 1 AS delta FROM added
+                UNION ALL
+                SELECT seller_id, buyer_id, -1 FROM removed
+            ) changes
+            GROUP BY seller_id, buyer_id
+        ) d
+        WHERE sr.seller_id = d.seller_id AND sr.buyer_id = d.buyer_id AND d.delta <> 0
+        ''', seller_ids=seller_ids, buyer_ids=buyer_ids, voter_ids=voter_ids, upvoted=upvoted)
@@ -0,0 +1,168 @@
+from flask import current_app as app
+
+# StockHold is a cart's time limited claim on listing stock. Adding an item to a cart holds a unit
+# of the listing (ProductListing.reserved counts the held units, so available stock is
+# quantity - reserved), removing it gives the unit back, checkout turns the holds into the actual
+# stock decrement (CartDAL.submit_order) and holds older than STOCK_HOLD_SECONDS are released in
+# batches by sweep(). A hold always sits on top of a cart item, never the other way around: an item
+# whose hold expired stays in the cart and checkout falls back to whatever stock is still free.
+class StockHold:
+    # current time in the same convention as Orders.date_time
+    NOW = "(current_timestamp AT TIME ZONE 'UTC')"
+
+    def __init__(self, uid, product_id, quantity, expires_at):
+        self.uid = uid
+        self.product_id = product_id
+        self.quantity = quantity
+        self.expires_at = expires_at
+
+    @staticmethod
+    def get_by_user(uid):
+        rows = app.db.execute('''
+        SELECT uid, product_id, quantity, expires_at
+        FROM StockHold
+        WHERE uid = :uid
+        ORDER BY product_id
+        ''', uid=uid)
+        return [StockHold(*row) for row in rows]
+
+    @staticmethod
+    # hold quantity more units of a listing for uid (and restart the hold's clock).
+    # Returns the units now held, or None when there isn't that much stock free
+    def hold(uid, product_id, quantity=1):
+        rows = app.db.execute(f'''
+        WITH take AS (
+            UPDATE ProductListing
+            SET reserved = reserved + :quantity
+            WHERE product_id = :product_id AND quantity - reserved >= :quantity
+            RETURNING product_id
+        )
+        INSERT INTO StockHold (uid, product_id, quantity, expires_at)
+        SELECT :uid, product_id, :quantity, {StockHold.NOW} + make_interval(secs => :ttl)
+        FROM take
+        ON CONFLICT (uid, product_id)
+        DO UPDATE SET quantity = StockHold.quantity + EXCLUDED.quantity, expires_at = EXCLUDED.expires_at
+        RETURNING quantity
+        ''', uid=uid, product_id=product_id, quantity=quantity, ttl=app.config['STOCK_HOLD_SECONDS'])
+        return rows[0][0] if rows else None
+
+    @staticmethod
+    # give back what uid holds of a listing beyond keep units (keep=0 releases the whole hold)
+    def release(uid, product_id, keep=0):
+        app.db.execute('''
+        WITH h AS (
+            SELECT quantity, GREATEST(quantity - :keep, 0) AS released
+            FROM StockHold
+            WHERE uid = :uid AND product_id = :product_id
+            FOR UPDATE
+        ),
+        shrunk AS (
+            UPDATE StockHold s
+            SET quantity = s.quantity - h.released
+            FROM h
+            WHERE s.uid = :uid AND s.product_id = :product_id AND h.released < h.quantity
+        ),
+        dropped AS (
+            DELETE FROM StockHold s
+            USING h
+            WHERE s.uid = :uid AND s.product_id = :product_id AND h.released = h.quantity
+        )
+        UPDATE ProductListing pl
+        SET reserved = pl.reserved - h.released
+        FROM h
+        WHERE pl.product_id = :product_id AND h.released > 0
+        ''', uid=uid, product_id=product_id, keep=keep)
+
+    @staticmethod
+    # set uid's holds on several listings to exactly the given quantities (0 drops the hold) in one
+    # statement, restarting their clocks. Returns the product_ids whose hold couldn't grow for lack of
+    # free stock; the caller must roll back when that isn't empty, the other holds were already moved
+    def set_holds(uid, product_ids, quantities):
+        rows = app.db.execute(f'''
+        WITH target AS (
+            SELECT t.product_id, t.quantity, COALESCE(h.quantity, 0) AS held
+            FROM unnest(CAST(:product_ids AS INT[]), CAST(:quantities AS INT[])) AS t(product_id, quantity)
+            LEFT JOIN StockHold h ON h.uid = :uid AND h.product_id = t.product_id
+        ),
+        moved AS (
+            UPDATE ProductListing pl
+            SET reserved = pl.reserved + (t.quantity - t.held)
+            FROM target t
+            WHERE pl.product_id = t.product_id AND t.quantity <> t.held
+                AND (t.quantity < t.held OR pl.quantity - pl.reserved >= t.quantity - t.held)
+            RETURNING pl.product_id
+        ),
+        kept AS (
+            INSERT INTO StockHold (uid, product_id, quantity, expires_at)
+            SELECT :uid, t.product_id, t.quantity, {StockHold.NOW} + make_interval(secs => :ttl)
+            FROM target t
+            WHERE t.quantity > 0 AND (t.quantity = t.held OR t.product_id IN (SELECT product_id FROM moved))
+            ON CONFLICT (uid, product_id)
+            DO UPDATE SET quantity = EXCLUDED.quantity, expires_at = EXCLUDED.expires_at
+        ),
+        dropped AS (
+            DELETE FROM StockHold h
+            USING target t
+            WHERE h.uid = :uid AND h.product_id = t.product_id AND t.quantity = 0
+        )
+        SELECT t.product_id
+        FROM target t
+        WHERE t.quantity <> t.held AND t.product_id NOT IN (SELECT product_id FROM moved)
+        ''', uid=uid, product_ids=product_ids, quantities=quantities, ttl=app.config['STOCK_HOLD_SECONDS'])
+        return [row[0] for row in rows]
+
+    @staticmethod
+    # release every hold of uid (their cart was emptied)
+    def release_all(uid):
+        app.db.execute('''
+        WITH released AS (
+            DELETE FROM StockHold
+            WHERE uid = :uid
+            RETURNING product_id, quantity
+        )
+        UPDATE ProductListing pl
+        SET reserved = pl.reserved - r.quantity
+        FROM released r
+        WHERE pl.product_id = r.product_id
+        ''', uid=uid)
+
+    @staticmethod
+    # release up to batch_size expired holds, returns how many were released.
+    # Holds another transaction is working on (a checkout) are skipped rather than waited for
+    def sweep(batch_size):
+        rows = app.db.execute(f'''
+        WITH expired AS (
+            DELETE FROM StockHold
+            WHERE (uid, product_id) IN (
+                SELECT uid, product_id
+                FROM StockHold
+                WHERE expires_at < {StockHold.NOW}
+                ORDER BY expires_at
+                LIMIT :batch_size
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING product_id, quantity
+        ),
+        freed AS (
+            UPDATE ProductListing pl
+            SET reserved = pl.reserved - e.quantity
+            FROM (
+                SELECT product_id, SUM(quantity) AS quantity
+                FROM expired
+                GROUP BY product_id
+            ) e
+            WHERE pl.product_id = e.product_id
+        )
+        SELECT COUNT(*) FROM expired
+        ''', batch_size=batch_size)
+        return rows[0][0]
+
+    @staticmethod
+    # sweep in batches until no expired holds are left
+    def sweep_all(batch_size):
+        total = 0
+        while True:
+            released = StockHold.sweep(batch_size)
+            total += released
+            if released < batch_size:
+                return total
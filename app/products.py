@@ -1,4 +1,7 @@
+import base64
+import json
 import math
+from flask import current_app as app
 from flask import request
 from flask import jsonify
 from flask_login import current_user
@@ -7,13 +10,45 @@ from flask_login import current_user
 from .models.product import Product
 from .models.productCatalog import ProductCatalog
 from .models.productListing import ProductListing
+from .db import unit_of_work
+from .conditional import versioned
+from .models.content_version import ContentVersion
 
 
 from flask import Blueprint
 bp = Blueprint('products', __name__)
 
 
+# cursors are opaque to clients: urlsafe base64 of the filter, the last sort value and the last product_id
+def encode_cursor(filter, sort_value, product_id):
+   payload = json.dumps([filter, str(sort_value) if sort_value is not None else None, product_id])
+   return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+# returns (sort value, product_id) or raises ValueError if the cursor is malformed or was made for another filter
+def decode_cursor(cursor, filter):
+   try:
+       cursor_filter, sort_value, product_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+   except Exception:
+       raise ValueError("Invalid cursor")
+   if cursor_filter != filter or not isinstance(product_id, int):
+       raise ValueError("Invalid cursor")
+   return sort_value, product_id
+
+
+# ?category= values of the frontend -> category names in the catalog
+CATEGORIES = ProductCatalog.CATEGORIES
+
+
+# ContentVersion scope a /products response depends on
+def products_scope():
+   category = request.args.get('category', "all", type=str)
+   return ContentVersion.category_scope(CATEGORIES.get(category, category))
+
+
 @bp.route('/products', methods=['GET'])
+@unit_of_work(read_only=True)
+@versioned(products_scope)
 def get_products():
    category = request.args.get('category', "all", type=str)
    search_term = request.args.get('search', type=str)
@@ -24,14 +59,7 @@ def get_products():
 
 
    #default category is "all"
-   if category == "flowers":
-       category = "Flowers"
-   elif category == "succulents":
-       category = "Succulents"
-   elif category == "herbs":
-       category = "Herbs"
-   elif category == "fruit-veg":
-       category = "Fruits and Vegetables"
+   category = CATEGORIES.get(category, category)
 
 
    #default filtering is None
@@ -50,25 +78,66 @@ def get_products():
    elif filter == "total_purchases":
        column = 'total_purchases'
        order_by = 'DESC'
+   elif filter == "relevance":
+       # best full-text matches for ?search= first, no particular order without a search
+       column = 'relevance'
+       order_by = 'DESC'
 
 
-   products = ProductCatalog.get_products_by_category(category, search_term = search_term, column = column, order_by = order_by, limit = limit, offset = offset)
-   total_products = ProductCatalog.get_total_products(category, search_term = search_term)
+   # infinite-scroll clients pass ?cursor= (empty for the first batch) and get nextCursor back,
+   # the React pager keeps using ?page=
+   if 'cursor' in request.args:
+       if column == 'relevance':
+           return jsonify({'error': 'relevance sorting is only available with page numbers'}), 400
+       cursor = request.args.get('cursor', "", type=str)
+       after = None
+       if cursor:
+           try:
+               after = decode_cursor(cursor, filter)
+           except ValueError as e:
+               return jsonify({'error': str(e)}), 400
+       products = ProductCatalog.get_products_after(category, after = after, search_term = search_term, column = column, order_by = order_by, limit = limit + 1)
+       next_cursor = None
+       if len(products) > limit:
+           products = products[:limit]
+           last = products[-1]
+           next_cursor = encode_cursor(filter, ProductCatalog.sort_value(last, column), last.product_id)
+       return jsonify({
+           'products': [product.to_dict() for product in products],
+           'nextCursor': next_cursor
+       })
+
+   products, total_products = ProductCatalog.get_products_page(category, search_term = search_term, column = column, order_by = order_by, limit = limit, offset = offset)
    total_pages = math.ceil(total_products/limit)
 
 
    return jsonify({
-       'products': [product.__dict__ for product in products],
+       'products': [product.to_dict() for product in products],
        'totalPages': total_pages
    })
 
+# typeahead for the search box, answered from the in-memory index without touching the database
+@bp.route('/products/suggest', methods=['GET'])
+def suggest_products():
+   prefix = request.args.get('q', "", type=str)
+   k = min(request.args.get('k', 8, type=int), 20)
+   if app.suggestions.is_stale(app.config['SUGGEST_REFRESH_SECONDS']):
+       try:
+           app.suggestions.reload()
+       except Exception as e:
+           # keep serving the old index until the database is back
+           print(f"Failed to reload suggestion index: {e}")
+   return jsonify({'suggestions': app.suggestions.suggest(prefix, k)})
+
 @bp.route('/products_listings/<product_name>', methods=['GET'])
+@unit_of_work(read_only=True)
 def get_listing_by_name(product_name):
     products = ProductListing.get_listing_by_name(product_name)
-    return jsonify([product.__dict__ for product in products])
+    return jsonify([product.to_dict() for product in products])
 
 @bp.route('/products/<product_name>', methods=['GET'])
+@unit_of_work(read_only=True)
 def get_product_by_name(product_name):
     products = ProductCatalog.get_product_by_name(product_name)
-    return jsonify([product.__dict__ for product in products])
+    return jsonify([product.to_dict() for product in products])
 
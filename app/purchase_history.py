@@ -2,6 +2,7 @@
 from flask_login import current_user
 from flask import jsonify, Blueprint, request
 from .models.buys import Buys
+from .db import unit_of_work
 from flask import request, jsonify
 
 # Create the blueprint
@@ -15,6 +16,7 @@ bp = Blueprint('purchase_history', __name__)
 # METHOD
 # PURCHASE HISTORY: Get the purchase history for a user, paginated and ordered by the request
 @bp.route('/purchase_history', methods=['GET'])
+@unit_of_work(read_only=True)
 def get_purchase_history():
     # Check user is logged in
     if current_user.is_authenticated:
@@ -42,17 +44,19 @@ def get_purchase_history():
         return jsonify({"message": "User not authenticated"}), 401
     
 @bp.route('/get-all-buys', methods = ['GET'])
+@unit_of_work(read_only=True)
 def all_buys_details ():
     # Load in the data using the model method
-    details = Buys.get_all_buys()
+    details = Buys.get_all_buys_dicts()
 
     # Return the converted data as a JSON
-    return jsonify([detail.__dict__ for detail in details]), 200
+    return jsonify(details), 200
 
 # ____________
 # METHOD
 # BUYS BY ORDER: Get all the products in a specific order
 @bp.route('/buys-by-order/<int:order_id>', methods = ['GET'])
+@unit_of_work(read_only=True)
 def order_details(order_id):
     # Load in the data using the model method
     details = Buys.get_buys_by_order(order_id)
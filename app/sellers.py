@@ -6,6 +6,7 @@ from .models.product import Product
 from .models.user import User
 from .models.seller import Seller
 from .models.category import Category
+from .db import unit_of_work
 
 import pdb
 
@@ -118,6 +119,7 @@ def make_listing():
 
 # get all fulfilled order items
 @bp.route('/get_fulfilled_ordered_items', methods=['GET'])
+@unit_of_work(read_only=True)
 def get_fulfilled_ordered_items():
     page = int(request.args.get('currentPage'))
     items_per_page = int(request.args.get('itemsPerPage'))
@@ -127,28 +129,12 @@ def get_fulfilled_ordered_items():
         items, total = Seller.get_fulfilled_ordered_items_by_seller(current_user.uid, page, items_per_page)
     if not items:
         return jsonify({'fulfilled':[], 'total':0}), 200
-    items_list = [
-        {
-            "product_id": p.product_id,
-            'purchase_id': p.purchase_id,
-            "order_quantity": p.order_quantity,
-            "at_price": p.at_price,
-            "fulfillment_time":p.fulfillment_time,
-            "name" :p.name,
-            "price" :p.price,
-            "category":p.category,
-            "description":p.description,
-            "image_url":p.image_url,
-            "product_quantity":p.product_quantity,
-            "date_time":p.date_time,
-            "fulfillment_status":str(p.fulfillment_status),
-            'address' :p.address,
-        } for p in items
-    ]
+    items_list = [p.to_dict() for p in items]
     return jsonify({'fulfilled': items_list, 'total':total}), 200
 
 # get all unfulfilled order items
 @bp.route('/get_unfulfilled_ordered_items', methods=['GET'])
+@unit_of_work(read_only=True)
 def get_unfulfilled_ordered_items():
     page = int(request.args.get('currentPage'))
     items_per_page = int(request.args.get('itemsPerPage'))
@@ -159,29 +145,14 @@ def get_unfulfilled_ordered_items():
     if not items:
         return jsonify({'fulfilled':[], 'total':0}), 200
     items_list = [
-        {
-            "product_id": p.product_id,
-            'purchase_id': p.purchase_id,
-            "order_quantity": p.order_quantity,
-            "at_price": p.at_price,
-            "fulfillment_time":p.fulfillment_time,
-            "name" :p.name,
-            "price" :p.price,
-            "category":p.category,
-            "description":p.description,
-            "image_url":p.image_url,
-            "product_quantity":p.product_quantity,
-            "date_time":p.date_time,
-            "fulfillment_status":str(p.fulfillment_status),
-            'address' :p.address,
-            'fillable': p.product_quantity >= p.order_quantity
-        } for p in items
+        dict(p.to_dict(), fillable=p.product_quantity >= p.order_quantity) for p in items
     ]
     print(items_list)
     return jsonify({'unfulfilled': items_list, 'total':total}), 200
 
 # get paginated inventory of active items
 @bp.route('/my_inventory', methods=['GET'])
+@unit_of_work(read_only=True)
 def get_inventory():
     page = int(request.args.get('currentPage'))
     items_per_page = int(request.args.get('itemsPerPage'))
@@ -210,6 +181,7 @@ def get_inventory():
 
 # Get paginated products by seller for UserDetailPage
 @bp.route('/get_paginated_products_by_seller/<int:seller_id>', methods=['GET'])
+@unit_of_work(read_only=True)
 def get_paginated_products(seller_id):
     page = int(request.args.get('page', 1))
     items_per_page = int(request.args.get('page_size', 3)) # if no input stick to 3
@@ -5,15 +5,39 @@ from .models.product_review import ProductReview
 from .models.product_review_upvote import ProductReviewUpvote
 from .models.seller_review_upvote import SellerReviewUpvote
 from .models.buys import Buys
+from .db import unit_of_work
+from .conditional import versioned
+from .models.content_version import ContentVersion
 from datetime import datetime
 
 bp = Blueprint('social', __name__)
 
+# most reviews one upvote info request may ask about
+MAX_UPVOTE_INFO_REVIEWS = 100
+
+# ?buyerIds=1,2,3 of the upvote info endpoints, None when malformed or too many
+def parse_buyer_ids():
+    try:
+        buyer_ids = [int(buyer_id) for buyer_id in request.args.get('buyerIds', '').split(',') if buyer_id.strip()]
+    except ValueError:
+        return None
+    return buyer_ids if len(buyer_ids) <= MAX_UPVOTE_INFO_REVIEWS else None
+
+# ?includeUpvotes=true of the paginated review endpoints
+def includes_upvotes():
+    return request.args.get('includeUpvotes', 'false').lower() == 'true'
+
+# upvote count and the current user's upvote of each review on a page, merged into the review dicts
+def add_upvote_info(reviews, upvote_info):
+    for review in reviews:
+        review.update(upvote_info.get(review['buyer_id'], {}))
+
 ## PRODUCT REVIEWS APIs ###
 
 # Incorporate fulfillment status check into writing reviews (only write reviews for fulfilled orders - this is on the frontend/by structure of queries)
 # Count the amount of fulfilled purchases of a product to determine whether a user can write a review -- ProductDetailPage
 @bp.route('/count_fulfilled_purchases_of_product/<product_name>', methods = ['GET'])
+@unit_of_work(read_only=True)
 def count_fulfilled_purchases_of_product(product_name):
     # by nature of where query is executed, currently don't need to check auth
     if not current_user.is_authenticated:
@@ -23,6 +47,7 @@ def count_fulfilled_purchases_of_product(product_name):
 
 # Get the review for a specified product by current user -- ProductDetailPage "My Review" Component
 @bp.route('/get_product_review/<product_name>', methods = ['GET'])
+@unit_of_work(read_only=True)
 def get_product_review(product_name):
     # only get review if user logged in
     if not current_user.is_authenticated:
@@ -38,6 +63,7 @@ def get_product_review(product_name):
 # Get all of the reviews for a specific product by the name of the product --- for ProductDetail page
 # Note currently used, was endpoint used for milestone
 @bp.route('/get_all_reviews_for_product/<product_name>', methods = ['GET']) # this API is case sensitive
+@unit_of_work(read_only=True)
 def get_all_reviews_for_product_by_name(product_name):
     # check input
     if not product_name:
@@ -51,7 +77,12 @@ def get_all_reviews_for_product_by_name(product_name):
         return jsonify({'product_reviews': None}), 200 # empty, no reviews yet
 
 # Get the PAGINATED and SORTED overall/average rating for a product -- for ProductDetail page 
+# includeUpvotes=true adds each review's user_upvoted (and the count including unflushed clicks),
+# saving the page the per-review upvote requests; those answers skip the ETag, since buffered
+# clicks only bump the product's ContentVersion when they are flushed
 @bp.route('/get_paginated_reviews_for_product/<product_name>', methods=['GET'])
+@unit_of_work(read_only=True)
+@versioned(ContentVersion.product_scope, unless=includes_upvotes)
 def get_paginated_reviews_for_product_by_name(product_name):
     if not product_name:
         return jsonify({'error': 'Missing product_name'}), 400
@@ -65,6 +96,10 @@ def get_paginated_reviews_for_product_by_name(product_name):
     product_reviews = ProductReview.get_paginated_reviews_for_product_by_name(
         product_name, page, items_per_page, sort_by
     )
+    if includes_upvotes() and product_reviews:
+        voter_id = current_user.id if current_user.is_authenticated else None
+        add_upvote_info(product_reviews, ProductReviewUpvote.get_product_review_upvote_info(
+            product_name, [review['buyer_id'] for review in product_reviews], voter_id))
     total_reviews = ProductReview.count_reviews_for_product_by_name(product_name)
     total_pages = (total_reviews + items_per_page - 1) // items_per_page
     
@@ -75,6 +110,8 @@ def get_paginated_reviews_for_product_by_name(product_name):
     
 # Get the rating summary for a product -- ProductDetailPage
 @bp.route('/get_product_rating_summary/<product_name>', methods = ['GET'])
+@unit_of_work(read_only=True)
+@versioned(ContentVersion.product_scope)
 def get_product_rating_summary(product_name):
     if not product_name:
         return jsonify({'error': 'Missing product_name'}), 400
@@ -141,6 +178,7 @@ def delete_product_review(product_name):
 # Incorporate fulfillment status check into writing reviews (only write reviews for fulfilled orders)
 # Count the amount of fulfilled purchases of product by a seller to determine whether a user can write a review -- SellerDetail
 @bp.route('/count_fulfilled_purchases_of_seller_products/<seller_id>', methods = ['GET'])
+@unit_of_work(read_only=True)
 def count_fulfilled_purchases_of_seller_products(seller_id):
     # by nature of where query is executed, currently don't need to check auth
     if not current_user.is_authenticated:
@@ -150,6 +188,7 @@ def count_fulfilled_purchases_of_seller_products(seller_id):
 
 # Get the review for a specified seller by current user -- UserDetailPage "My Review" Component
 @bp.route('/get_seller_review/<seller_id>', methods = ['GET'])
+@unit_of_work(read_only=True)
 def get_seller_review(seller_id):
     # only get review if user logged in
     if not current_user.is_authenticated:
@@ -164,6 +203,7 @@ def get_seller_review(seller_id):
     
 # Get all reviews for a seller by all users
 @bp.route('/get_all_reviews_for_seller/<seller_id>', methods = ['GET'])
+@unit_of_work(read_only=True)
 def get_all_reviews_for_seller(seller_id):
     # check input
     if not seller_id:
@@ -178,6 +218,7 @@ def get_all_reviews_for_seller(seller_id):
 
 # Get the overall/average rating for a specific seller
 @bp.route('/get_average_rating_for_seller/<seller_id>', methods = ['GET'])
+@unit_of_work(read_only=True)
 def get_average_rating_for_seller(seller_id):
     # check input
     if not seller_id:
@@ -191,6 +232,7 @@ def get_average_rating_for_seller(seller_id):
     
 # Get the rating summary for a seller -- UserDetailPage
 @bp.route('/get_seller_review_summary/<user_id>', methods = ['GET'])
+@unit_of_work(read_only=True)
 def get_seller_review_summary(user_id):
     if not user_id:
         return jsonify({'error': 'Missing user_id'}), 400
@@ -198,7 +240,9 @@ def get_seller_review_summary(user_id):
     return jsonify(seller_review_summary), 200
 
 # Get the PAGINATED and SORTED overall/average rating for a seller -- for UserDetail page 
-@bp.route('/get_paginated_reviews_for_seller/<seller_id>', methods=['GET'])
+# includeUpvotes=true works as for the product reviews
+@bp.route('/get_paginated_reviews_for_seller/<int:seller_id>', methods=['GET'])
+@unit_of_work(read_only=True)
 def get_paginated_reviews_for_seller(seller_id):
     # Get pagination and sorting parameters from request arguments
     page = int(request.args.get('page', 1))
@@ -207,6 +251,10 @@ def get_paginated_reviews_for_seller(seller_id):
 
     # Fetch paginated and sorted reviews and total count from the database
     seller_reviews = SellerReview.get_paginated_reviews_for_seller(seller_id, page, items_per_page, sort_by)
+    if includes_upvotes() and seller_reviews:
+        voter_id = current_user.id if current_user.is_authenticated else None
+        add_upvote_info(seller_reviews, SellerReviewUpvote.get_seller_review_upvote_info(
+            seller_id, [review['buyer_id'] for review in seller_reviews], voter_id))
     total_reviews = SellerReview.count_reviews_for_seller(seller_id)
     total_pages = (total_reviews + items_per_page - 1) // items_per_page
     
@@ -277,12 +325,26 @@ def delete_seller_review(seller_id):
 
 # Get the total number of upvotes for a specific product review, and the upvotes associated with it
 @bp.route('/get_product_review_upvotes/<product_name>/<int:buyer_id>', methods = ['GET'])
+@unit_of_work(read_only=True)
 def get_product_review_upvotes(product_name, buyer_id):
     product_review_upvotes = ProductReviewUpvote.get_product_review_upvotes(product_name, buyer_id)
     return jsonify({'product_review_upvote_info' : product_review_upvotes}), 200
 
+# Upvote counts and the current user's upvote state of several reviews of a product in one request,
+# ?buyerIds=1,2,3 names the reviews by their authors
+@bp.route('/get_product_review_upvote_info/<product_name>', methods = ['GET'])
+@unit_of_work(read_only=True)
+def get_product_review_upvote_info(product_name):
+    buyer_ids = parse_buyer_ids()
+    if buyer_ids is None:
+        return jsonify({'error': f'buyerIds must be at most {MAX_UPVOTE_INFO_REVIEWS} comma separated ids'}), 400
+    voter_id = current_user.id if current_user.is_authenticated else None
+    upvote_info = ProductReviewUpvote.get_product_review_upvote_info(product_name, buyer_ids, voter_id)
+    return jsonify({'upvote_info': [dict(info, buyer_id=buyer_id) for buyer_id, info in upvote_info.items()]}), 200
+
 # Check whether a user has upvotes a product review
 @bp.route('/check_user_product_review_upvote/<product_name>/<int:buyer_id>', methods = ['GET'])
+@unit_of_work(read_only=True)
 def check_user_product_review_upvote(product_name, buyer_id):
     if not current_user.is_authenticated:
         return jsonify({"error": "Unauthorized"}), 401
@@ -318,12 +380,25 @@ def remove_upvote_product_review(product_name, buyer_id):
 
 # Get the total number of upvotes for a specific seller review, and the upvotes associated with it
 @bp.route('/get_seller_review_upvotes/<int:seller_id>/<int:buyer_id>', methods = ['GET'])
+@unit_of_work(read_only=True)
 def get_seller_review_upvotes(seller_id, buyer_id):
     seller_review_upvotes = SellerReviewUpvote.get_seller_review_upvotes(seller_id, buyer_id)
     return jsonify({'seller_review_upvote_info' : seller_review_upvotes}), 200
 
+# Upvote counts and the current user's upvote state of several reviews of a seller in one request
+@bp.route('/get_seller_review_upvote_info/<int:seller_id>', methods = ['GET'])
+@unit_of_work(read_only=True)
+def get_seller_review_upvote_info(seller_id):
+    buyer_ids = parse_buyer_ids()
+    if buyer_ids is None:
+        return jsonify({'error': f'buyerIds must be at most {MAX_UPVOTE_INFO_REVIEWS} comma separated ids'}), 400
+    voter_id = current_user.id if current_user.is_authenticated else None
+    upvote_info = SellerReviewUpvote.get_seller_review_upvote_info(seller_id, buyer_ids, voter_id)
+    return jsonify({'upvote_info': [dict(info, buyer_id=buyer_id) for buyer_id, info in upvote_info.items()]}), 200
+
 # Check whether a user has upvoted a seller review
 @bp.route('/check_user_seller_review_upvote/<int:seller_id>/<int:buyer_id>', methods = ['GET'])
+@unit_of_work(read_only=True)
 def check_user_seller_review_upvote(seller_id, buyer_id):
     if not current_user.is_authenticated:
         return jsonify({"error": "Unauthorized"}), 401
@@ -360,6 +435,7 @@ def remove_upvote_seller_review(seller_id, buyer_id):
 # Get all reviews of a specific "sold version" product (all of the unique product ids (determined by diff sellers) for a specific product)
 # Get the overall/average rating for a specific product (by the product id, corresponding to a specific seller)
 @bp.route('/get_average_rating_for_product_by_id/<product_id>', methods = ['GET'])
+@unit_of_work(read_only=True)
 def get_average_rating_for_product_by_id(product_id):
     # check input
     if not product_id:
@@ -394,6 +470,7 @@ def get_average_rating_for_product_by_id(product_id):
 # Display user's social center in Public View
 # Get all paginated product reviews and all paginated seller reviews
 @bp.route('/user_reviews/<int:author_id>', methods = ['GET'])
+@unit_of_work(read_only=True)
 def get_paginated_reviews_by_author(author_id):
     # grab info about pagination from frontend
     product_page = int(request.args.get('productPage', 1))
@@ -423,6 +500,7 @@ def get_paginated_reviews_by_author(author_id):
 # # Display user's social center in My Account
 # # Get all paginated product reviews and all paginated seller reviews
 @bp.route('/my_reviews', methods = ['GET'])
+@unit_of_work(read_only=True)
 def get_paginated_reviews_by_user():
     if current_user.is_authenticated: 
         # grab info about pagination from frontend
@@ -454,6 +532,7 @@ def get_paginated_reviews_by_user():
 
 
 @bp.route('/get_seller_reviews_by/<int:user_id>', methods=['GET'])
+@unit_of_work(read_only=True)
 def get_seller_reviews_by(user_id):
     try:
         # Fetch reviews for the specified user_id
@@ -478,6 +557,7 @@ def get_seller_reviews_by(user_id):
         return jsonify({"message": "An error occurred while fetching reviews", "error": str(e)}), 500
 
 @bp.route('/get_product_reviews_by/<int:user_id>', methods=['GET'])
+@unit_of_work(read_only=True)
 def get_product_reviews_by(user_id):
     try:
         # Fetch reviews for the specified user_id
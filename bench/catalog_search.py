@@ -0,0 +1,118 @@
+'''
+Catalog search benchmark: LOWER(...) LIKE '%term%' against the tsvector/GIN search used by /products.
+
+Builds a scratch catalog (a TEMP table, nothing in the real tables is touched) of --rows products
+from the same plant names and description template as db/generated/genProduct.py, then times both
+search predicates for a few typical search box inputs.
+
+    python bench/catalog_search.py --rows 100000 --repeat 20
+
+Connection settings come from .flaskenv, the same as the app.
+'''
+import argparse
+import os
+import statistics
+import sys
+import time
+
+from dotenv import load_dotenv
+from sqlalchemy import create_engine, text
+
+# the app package reads its Config from the environment on import
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+load_dotenv(os.path.join(ROOT, '.flaskenv'))
+sys.path.insert(0, ROOT)
+from app.config import Config
+from app.models.productCatalog import ProductCatalog
+
+ADJECTIVES = ["Blooming", "Verdant", "Lush", "Delicate", "Fragrant", "Vibrant", "Thorny", "Elegant", "Hardy",
+              "Glossy", "Budding", "Trailing", "Bushy", "Exotic", "Dwarf", "Giant", "Shady", "Bright", "Compact",
+              "Spiky", "Soft", "Tropical", "Frosty", "Golden", "Silver", "Sunny", "Colorful", "Sweet", "Miniature",
+              "Royal", "Wild", "Fresh", "Hearty", "Evergreen", "Bold", "Leafy", "Medicinal", "Smooth", "Textured"]
+PLANTS = ["Rose", "Tulip", "Sunflower", "Daisy", "Lily", "Orchid", "Marigold", "Daffodil", "Peony", "Lavender",
+          "Aloe Vera", "Echeveria", "Jade Plant", "Panda Plant", "Christmas Cactus", "Ghost Plant", "Lithops",
+          "Basil", "Thyme", "Rosemary", "Mint", "Cilantro", "Parsley", "Oregano", "Sage", "Dill", "Chives",
+          "Tomato", "Pepper", "Lettuce", "Spinach", "Carrot", "Strawberry", "Blueberry", "Lemon", "Potato"]
+CARE = ["labor-intensive", "low-maintenance", "simple", "difficult", "effortless"]
+SUN = ["direct", "indirect", "no", "dappled", "low", "full"]
+
+# what people type into the search box: whole words, prefixes while typing, two-word names, misses
+SEARCHES = ["dill", "lav", "royal potato", "low-maintenance", "cactus", "zzz"]
+
+SETUP = '''
+CREATE TEMP TABLE bench_catalog (
+    product_name VARCHAR(255) NOT NULL PRIMARY KEY,
+    description VARCHAR(1023) NOT NULL,
+    search_vector tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', product_name), 'A') ||
+        setweight(to_tsvector('english', description), 'B')
+    ) STORED
+);
+INSERT INTO bench_catalog (product_name, description)
+SELECT name, 'A hardy plant known for its ' || lower(adj) || ' appearance and its ' || care
+    || ' care. Ideal for spaces with ' || sun || ' sunlight, the ' || name || ' is perfect for plant lovers.'
+FROM (
+    SELECT i,
+        (:adjectives)[1 + i % cardinality(:adjectives)] AS adj,
+        (:adjectives)[1 + i % cardinality(:adjectives)] || ' ' || (:plants)[1 + (i / 7) % cardinality(:plants)]
+            || ' ' || i AS name,
+        (:care)[1 + (i / 3) % cardinality(:care)] AS care,
+        (:sun)[1 + (i / 5) % cardinality(:sun)] AS sun
+    FROM generate_series(1, :rows) AS i
+) g;
+CREATE INDEX bench_catalog_search_idx ON bench_catalog USING GIN (search_vector);
+ANALYZE bench_catalog;
+'''
+
+LIKE_QUERY = '''
+SELECT COUNT(*) FROM bench_catalog
+WHERE LOWER(product_name) LIKE :like_term OR LOWER(description) LIKE :like_term
+'''
+
+SEARCH_QUERY = f'''
+SELECT COUNT(*) FROM bench_catalog
+WHERE {ProductCatalog.SEARCH_CONDITION}
+'''
+
+
+def time_query(conn, query, repeat, **params):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        matches = conn.execute(text(query), params).scalar()
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+    return matches, statistics.median(timings), p95
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=100000, help='catalog size (default 100000)')
+    parser.add_argument('--repeat', type=int, default=20, help='runs per query (default 20)')
+    args = parser.parse_args()
+
+    engine = create_engine(Config.SQLALCHEMY_DATABASE_URI)
+
+    with engine.connect() as conn:
+        start = time.perf_counter()
+        for statement in SETUP.split(';'):
+            if statement.strip():
+                conn.execute(text(statement), {'rows': args.rows, 'adjectives': ADJECTIVES, 'plants': PLANTS,
+                                               'care': CARE, 'sun': SUN})
+        print(f"built {args.rows} catalog rows in {time.perf_counter() - start:.1f}s\n")
+
+        print(f"{'search':<18}{'matches':>9}{'LIKE p50':>11}{'LIKE p95':>11}{'FTS p50':>11}{'FTS p95':>11}{'speedup':>9}")
+        for search in SEARCHES:
+            like_matches, like_p50, like_p95 = time_query(conn, LIKE_QUERY, args.repeat,
+                                                          like_term=f"%{search.lower()}%")
+            fts_matches, fts_p50, fts_p95 = time_query(conn, SEARCH_QUERY, args.repeat,
+                                                       search_term=ProductCatalog.search_query(search))
+            print(f"{search:<18}{fts_matches:>9}{like_p50:>9.2f}ms{like_p95:>9.2f}ms"
+                  f"{fts_p50:>9.2f}ms{fts_p95:>9.2f}ms{like_p50 / max(fts_p50, 1e-6):>8.1f}x")
+            if like_matches != fts_matches:
+                print(f"{'':<18}(LIKE matched {like_matches}: substring vs word-prefix semantics)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,206 @@
+'''
+Checkout contention benchmark: many buyers checking out the same hot listing at once.
+
+Gives --buyers users a cart holding --quantity of one listing with only --stock units left, then
+fires all their checkouts (CartManager.place_order, the code behind POST /place-order) from a pool
+of --workers threads and reports:
+
+    - orders/sec and p50/p99 checkout latency
+    - outcomes (placed, out of stock, other errors)
+    - serialization failures retried / given up on (app.db.transaction_stats())
+    - oversell violations: more units sold than were in stock, negative stock, or stock and
+      OrderContains disagreeing about how much was sold
+
+Run it against a scratch database loaded from the generated data, it places real orders:
+
+    db/setup.sh generated/                # or pass --seed to have this script run it
+    python bench/checkout_contention.py --buyers 300 --stock 100 --workers 32
+
+Buyers are users with a checkout-bench-* email, created on the first run and reused after that.
+Connection and pool settings come from .flaskenv, the same as the app.
+'''
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from dotenv import load_dotenv
+
+# the app package reads its Config from the environment on import
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+load_dotenv(os.path.join(ROOT, '.flaskenv'))
+sys.path.insert(0, ROOT)
+from app import create_app
+from app.controllers.cartManager import CartManager
+from app.models.cart import Cart
+
+BENCH_EMAIL = 'checkout-bench-%s@example.com'
+
+
+def seed():
+    subprocess.run([os.path.join(ROOT, 'db', 'setup.sh'), 'generated/'], check=True,
+                   stdout=subprocess.DEVNULL)
+
+
+# the listing everyone buys: --product, or the one with the most stock
+def pick_listing(app, product_id):
+    if product_id is not None:
+        rows = app.db.execute('''
+            SELECT product_id, seller_id FROM ProductListing WHERE product_id = :product_id
+        ''', product_id=product_id)
+        if not rows:
+            raise SystemExit(f"no listing {product_id}")
+        return rows[0]
+    return app.db.execute('''
+        SELECT product_id, seller_id FROM ProductListing ORDER BY quantity DESC, product_id LIMIT 1
+    ''')[0]
+
+
+# bench users 1..n, creating the ones that don't exist yet
+def bench_buyers(app, n):
+    emails = [BENCH_EMAIL % i for i in range(1, n + 1)]
+    app.db.execute('''
+        INSERT INTO Users (email, address, balance, firstname, lastname, password)
+        SELECT e, 'nowhere', 0, 'Bench', 'Buyer', '!'
+        FROM unnest(CAST(:emails AS VARCHAR[])) AS e
+        WHERE NOT EXISTS (SELECT 1 FROM Users u WHERE u.email = e)
+    ''', emails=emails)
+    rows = app.db.execute('''
+        SELECT user_id FROM Users WHERE email = ANY(CAST(:emails AS VARCHAR[])) ORDER BY user_id
+    ''', emails=emails)
+    return [row[0] for row in rows]
+
+
+# reset stock (dropping any cart holds on it), carts and balances so every buyer can afford exactly
+# one order of the listing. The carts hold no stock, so checkout competes for the free stock
+def prepare(app, product_id, buyers, stock, quantity):
+    with app.db.begin():
+        app.db.execute('''
+            DELETE FROM StockHold WHERE product_id = :product_id
+        ''', product_id=product_id)
+        app.db.execute('''
+            UPDATE ProductListing SET quantity = :stock, reserved = 0 WHERE product_id = :product_id
+        ''', stock=stock, product_id=product_id)
+        app.db.execute('''
+            DELETE FROM CartContains WHERE uid = ANY(:buyers)
+        ''', buyers=buyers)
+        app.db.execute('''
+            INSERT INTO CartContains (uid, product_id, quantity, at_price)
+            SELECT b, pl.product_id, :quantity, pl.price
+            FROM unnest(CAST(:buyers AS INT[])) AS b, ProductListing pl
+            WHERE pl.product_id = :product_id
+        ''', buyers=buyers, product_id=product_id, quantity=quantity)
+        Cart.refresh(buyers)
+        app.db.execute('''
+            UPDATE Users u
+            SET balance = pl.price * :quantity
+            FROM ProductListing pl
+            WHERE pl.product_id = :product_id AND u.user_id = ANY(:buyers)
+        ''', buyers=buyers, product_id=product_id, quantity=quantity)
+        return app.db.execute('SELECT COALESCE(MAX(purchase_id), 0) FROM Orders')[0][0]
+
+
+def checkout(app, uid):
+    with app.app_context():
+        start = time.perf_counter()
+        response = CartManager.place_order(uid)
+        elapsed = time.perf_counter() - start
+    return elapsed, response
+
+
+def outcome(response):
+    if response.get('success'):
+        return 'placed'
+    if response.get('error', '').startswith('Insufficient stock'):
+        return 'out of stock'
+    return 'error: ' + response.get('error', '')[:60]
+
+
+def check_oversell(app, product_id, stock, quantity, last_purchase_id, placed):
+    left = app.db.execute('''
+        SELECT quantity FROM ProductListing WHERE product_id = :product_id
+    ''', product_id=product_id)[0][0]
+    ordered = app.db.execute('''
+        SELECT COALESCE(SUM(quantity), 0) FROM OrderContains
+        WHERE product_id = :product_id AND purchase_id > :last_purchase_id
+    ''', product_id=product_id, last_purchase_id=last_purchase_id)[0][0]
+    violations = []
+    if left < 0:
+        violations.append(f"stock went negative ({left})")
+    if ordered > stock:
+        violations.append(f"sold {ordered} units with only {stock} in stock")
+    if stock - left != ordered:
+        violations.append(f"stock dropped by {stock - left} but orders hold {ordered} units")
+    if ordered != placed * quantity:
+        violations.append(f"{placed} successful checkouts but orders hold {ordered} units")
+    return left, violations
+
+
+def percentile(sorted_values, p):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * p))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--buyers', type=int, default=300, help='concurrent buyers (default 300)')
+    parser.add_argument('--stock', type=int, default=100, help='units of the listing in stock (default 100)')
+    parser.add_argument('--quantity', type=int, default=1, help='units in each cart (default 1)')
+    parser.add_argument('--workers', type=int, default=32, help='checkout threads (default 32)')
+    parser.add_argument('--product', type=int, help='product_id of the hot listing (default: most stocked)')
+    parser.add_argument('--seed', action='store_true',
+                        help='recreate the database from db/generated first (drops it!)')
+    args = parser.parse_args()
+
+    if args.seed:
+        seed()
+    app = create_app()
+
+    with app.app_context():
+        product_id, seller_id = pick_listing(app, args.product)
+        buyers = bench_buyers(app, args.buyers)
+        last_purchase_id = prepare(app, product_id, buyers, args.stock, args.quantity)
+    print(f"{len(buyers)} buyers x {args.quantity} of listing {product_id} (seller {seller_id}), "
+          f"{args.stock} in stock, {args.workers} workers\n")
+
+    retries_before = app.db.transaction_stats()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        results = list(pool.map(lambda uid: checkout(app, uid), buyers))
+    wall = time.perf_counter() - start
+    retries_after = app.db.transaction_stats()
+
+    outcomes = {}
+    for _, response in results:
+        key = outcome(response)
+        outcomes[key] = outcomes.get(key, 0) + 1
+    placed = outcomes.get('placed', 0)
+    latencies = sorted(elapsed * 1000 for elapsed, _ in results)
+
+    print(f"{'orders/sec':<28}{placed / wall:>10.1f}")
+    print(f"{'checkouts/sec':<28}{len(results) / wall:>10.1f}")
+    print(f"{'latency p50':<28}{statistics.median(latencies):>8.1f}ms")
+    print(f"{'latency p99':<28}{percentile(latencies, 0.99):>8.1f}ms")
+    for key, count in sorted(outcomes.items()):
+        print(f"{key:<28}{count:>10}")
+    for key in ('serialization_retries', 'serialization_failures'):
+        print(f"{key:<28}{retries_after[key] - retries_before[key]:>10}")
+    pool_stats = app.db.pool_stats()
+    print(f"{'pool max wait':<28}{pool_stats['max_wait_ms']:>8.1f}ms")
+    print(f"{'pool timeouts':<28}{pool_stats['timeouts']:>10}")
+
+    with app.app_context():
+        left, violations = check_oversell(app, product_id, args.stock, args.quantity, last_purchase_id, placed)
+    print(f"{'stock left':<28}{left:>10}\n")
+    if violations:
+        print("OVERSELL VIOLATIONS:")
+        for violation in violations:
+            print(f"  {violation}")
+        sys.exit(1)
+    print("no oversell")
+
+
+if __name__ == '__main__':
+    main()
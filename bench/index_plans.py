@@ -0,0 +1,189 @@
+'''
+Index pack report: EXPLAIN ANALYZE of the hot DAL queries without and with the indexes of
+db/migrations/007_hot_query_indexes.sql.
+
+For every query the indexes were added for, picks the busiest product / seller / buyer / order of
+the database as parameters, then runs EXPLAIN (ANALYZE, BUFFERS) once with the pack's indexes
+dropped and once with them in place, and reports execution time, shared buffers touched and the
+indexes the plan used. The "before" run drops the indexes inside a transaction that is rolled back,
+so nothing changes for good, but DROP INDEX locks the tables meanwhile: run it against a scratch
+database loaded from the generated data, not a live one.
+
+    db/setup.sh generated/
+    python bench/index_plans.py --repeat 5 --plans
+
+Connection settings come from .flaskenv, the same as the app.
+'''
+import argparse
+import os
+import re
+import statistics
+import sys
+
+from dotenv import load_dotenv
+from sqlalchemy import create_engine, text
+
+# the app package reads its Config from the environment on import
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+load_dotenv(os.path.join(ROOT, '.flaskenv'))
+sys.path.insert(0, ROOT)
+from app.config import Config
+from app.models.productCatalog import ProductCatalog
+
+MIGRATION = os.path.join(ROOT, 'db', 'migrations', '007_hot_query_indexes.sql')
+
+# parameters: the entities with the most rows behind them, where a missing index hurts most
+SAMPLES = {
+    'product_name': 'SELECT product_name FROM ProductListing GROUP BY product_name ORDER BY COUNT(*) DESC LIMIT 1',
+    'seller_id': 'SELECT seller_id FROM ProductListing GROUP BY seller_id ORDER BY COUNT(*) DESC LIMIT 1',
+    'buyer_id': 'SELECT buyer_id FROM Buys GROUP BY buyer_id ORDER BY COUNT(*) DESC LIMIT 1',
+    'purchase_id': 'SELECT MAX(purchase_id) FROM OrderContains',
+    'reviewed_product': 'SELECT product_name FROM ProductReview GROUP BY product_name ORDER BY COUNT(*) DESC LIMIT 1',
+    'reviewed_seller': 'SELECT seller_id FROM SellerReview GROUP BY seller_id ORDER BY COUNT(*) DESC LIMIT 1',
+}
+
+# DAL method -> (its query, parameter names taken from SAMPLES)
+QUERIES = {
+    'ProductListing.load_listing_by_name': ('''
+        SELECT pl.product_id, pl.product_name, pl.seller_id, pl.price, pl.quantity, pl.active,
+            u.firstname || ' ' || u.lastname AS seller_name
+        FROM ProductListing pl
+        JOIN Users u ON pl.seller_id = u.user_id
+        WHERE product_name = :product_name
+    ''', ['product_name']),
+    'ProductCatalog.load_product_by_name': (
+        ProductCatalog.DEFAULT_GET_QUERY + ' WHERE p.product_name = :product_name',
+        ['product_name']),
+    'Seller.change_product_price (min price)': ('''
+        SELECT MIN(pl.price)
+        FROM ProductListing pl
+        WHERE pl.product_name = :product_name AND pl.seller_id <> :seller_id
+    ''', ['product_name', 'seller_id']),
+    'Seller.get_paginated_products_by_seller': ('''
+        SELECT p.product_id, p.product_name, p.seller_id, p.price, p.quantity, c.category, c.image_url, c.description, c.creator_id
+        FROM ProductListing p
+        JOIN ProductCatalog c ON p.product_name = c.product_name
+        WHERE p.seller_id = :seller_id AND active = true
+        ORDER BY p.product_id
+        LIMIT 10 OFFSET 0
+    ''', ['seller_id']),
+    'Seller.get_unfulfilled_ordered_items_by_seller': ('''
+        SELECT ProductListing.product_id, OrderContains.quantity as order_quantity, at_price, fulfillment_time,
+            product_name, price, category, image_url, description, ProductListing.quantity as product_quantity,
+            Orders.date_time, fulfillment_status,
+            address, purchase_id
+        FROM OrderContains
+        JOIN ProductListing ON ProductListing.product_id=OrderContains.product_id
+        NATURAL JOIN ProductCatalog
+        NATURAL JOIN Orders
+        NATURAL JOIN Buys
+        JOIN Users ON buyer_id=user_id
+        WHERE seller_id = :seller_id AND fulfillment_time IS NULL
+        ORDER BY date_time DESC
+        LIMIT 10 OFFSET 0
+    ''', ['seller_id']),
+    'Buys.count_fulfilled_purchases_of_product': ('''
+        SELECT COUNT(*)
+        FROM Orders o
+        JOIN OrderContains oc ON o.purchase_id = oc.purchase_id
+        JOIN Buys b ON b.purchase_id = o.purchase_id
+        JOIN ProductListing pl ON oc.product_id = pl.product_id
+        JOIN ProductCatalog p ON pl.product_name = p.product_name
+        WHERE b.buyer_id = :buyer_id
+        AND p.product_name = :product_name
+        AND o.fulfillment_status = true
+    ''', ['buyer_id', 'product_name']),
+    'Buys.get_buys_by_order (order joins)': ('''
+        SELECT Buys.buyer_id, Buys.purchase_id, OrderContains.product_id, OrderContains.quantity
+        FROM Buys
+            JOIN Orders ON Buys.purchase_id = Orders.purchase_id
+            JOIN OrderContains ON Orders.purchase_id = OrderContains.purchase_id
+        WHERE Buys.purchase_id = :purchase_id
+    ''', ['purchase_id']),
+    'ProductReview.get_paginated_reviews_for_product_by_name (date_newest)': ('''
+        SELECT pr.buyer_id, u.firstname, u.lastname, pr.product_name, pr.rating, pr.comment, pr.date_time, pr.upvote_count
+        FROM ProductReview pr
+        JOIN Users u ON pr.buyer_id = u.user_id
+        WHERE pr.product_name = :reviewed_product
+        ORDER BY pr.date_time DESC
+        LIMIT 10 OFFSET 0
+    ''', ['reviewed_product']),
+    'SellerReview.get_paginated_reviews_for_seller (date_newest)': ('''
+        SELECT sr.buyer_id, u.firstname, u.lastname, sr.seller_id, sr.rating, sr.comment, sr.date_time, sr.upvote_count
+        FROM SellerReview sr
+        JOIN Users u ON sr.buyer_id = u.user_id
+        WHERE sr.seller_id = :reviewed_seller
+        ORDER BY sr.date_time DESC
+        LIMIT 10 OFFSET 0
+    ''', ['reviewed_seller']),
+}
+
+
+def pack_indexes():
+    with open(MIGRATION) as f:
+        return re.findall(r'CREATE INDEX IF NOT EXISTS (\w+)', f.read())
+
+
+def plan_nodes(node):
+    yield node
+    for child in node.get('Plans', []):
+        yield from plan_nodes(child)
+
+
+# median execution time (ms), shared buffers hit+read and indexes used over repeat EXPLAIN ANALYZE runs
+def explain(conn, query, params, repeat):
+    timings = []
+    for _ in range(repeat):
+        plan = conn.execute(text('EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) ' + query), params).scalar()[0]
+        timings.append(plan['Execution Time'])
+    nodes = list(plan_nodes(plan['Plan']))
+    buffers = plan['Plan'].get('Shared Hit Blocks', 0) + plan['Plan'].get('Shared Read Blocks', 0)
+    indexes = sorted({node['Index Name'] for node in nodes if 'Index Name' in node})
+    text_plan = '\n'.join(row[0] for row in conn.execute(text('EXPLAIN ' + query), params))
+    return statistics.median(timings), buffers, indexes, text_plan
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=5, help='EXPLAIN ANALYZE runs per query (default 5)')
+    parser.add_argument('--plans', action='store_true', help='print the before and after plans as well')
+    args = parser.parse_args()
+
+    engine = create_engine(Config.SQLALCHEMY_DATABASE_URI)
+    indexes = pack_indexes()
+
+    with engine.connect() as conn:
+        missing = [name for name in indexes
+                   if conn.execute(text('SELECT to_regclass(:name)'), {'name': name}).scalar() is None]
+        if missing:
+            print(f"missing {', '.join(missing)}: apply the migration first (db/migrate.sh)")
+            sys.exit(1)
+        conn.execute(text('ANALYZE'))
+        conn.commit()
+        samples = {name: conn.execute(text(query)).scalar() for name, query in SAMPLES.items()}
+        conn.commit()
+        print('parameters: ' + ', '.join(f"{name}={value!r}" for name, value in samples.items()) + '\n')
+
+        results = {}
+        for phase in ('before', 'after'):
+            transaction = conn.begin()
+            if phase == 'before':
+                for name in indexes:
+                    conn.execute(text(f'DROP INDEX {name}'))
+            for method, (query, names) in QUERIES.items():
+                params = {name: samples[name] for name in names}
+                results.setdefault(method, {})[phase] = explain(conn, query, params, args.repeat)
+            transaction.rollback()
+
+    print(f"{'query':<72}{'before':>10}{'after':>10}{'speedup':>9}{'buffers':>16}  indexes after")
+    for method, phases in results.items():
+        before_ms, before_buffers, _, before_plan = phases['before']
+        after_ms, after_buffers, after_indexes, after_plan = phases['after']
+        print(f"{method:<72}{before_ms:>8.2f}ms{after_ms:>8.2f}ms{before_ms / max(after_ms, 1e-6):>8.1f}x"
+              f"{before_buffers:>8}>{after_buffers:<7}  {', '.join(after_indexes) or '-'}")
+        if args.plans:
+            print(f"\n-- before\n{before_plan}\n-- after\n{after_plan}\n")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+'''
+JSON encoding and response compression benchmark for typical /products and /purchase_history payloads.
+
+Builds the payloads the way the routes do (ProductCatalog.to_dict() with Decimal prices, order
+dicts with datetimes) from made-up rows, no database needed, then times the stdlib JSON provider
+against app/json_provider.py and reports how many bytes gzip and brotli (if installed) save and
+what they cost in CPU at the configured level.
+
+    python bench/json_payloads.py --products 48 --orders 50 --repeat 2000
+
+orjson and brotli are optional; without them the fast provider and the br column fall back / are skipped.
+'''
+import argparse
+import datetime
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from decimal import Decimal
+
+from dotenv import load_dotenv
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+
+# the app package reads its Config from the environment on import
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+load_dotenv(os.path.join(ROOT, '.flaskenv'))
+sys.path.insert(0, ROOT)
+from app.config import Config
+from app import compression
+from app.json_provider import FastJSONProvider, orjson
+from app.models.productCatalog import ProductCatalog
+
+PLANTS = ["Rose", "Tulip", "Sunflower", "Lavender", "Aloe Vera", "Jade Plant", "Basil", "Rosemary", "Tomato",
+          "Strawberry", "Lemon", "Orchid"]
+CATEGORIES = ["Flowers", "Succulents", "Herbs", "Vegetables", "Fruits"]
+STATUSES = ["Fulfilled", "Pending"]
+
+
+def products_payload(count):
+    products = [
+        ProductCatalog(i, f"{random.choice(PLANTS)} {i}", Decimal(random.randint(100, 9999)) / 100,
+                       random.choice(CATEGORIES),
+                       f"A hardy plant known for its lush appearance and its simple care, number {i}.",
+                       f"https://example.com/images/{i}.jpg", random.randint(0, 400),
+                       Decimal(random.randint(100, 500)) / 100, random.randint(0, 2000))
+        for i in range(count)
+    ]
+    return {'products': [product.to_dict() for product in products], 'totalPages': 42}
+
+
+def purchases_payload(count):
+    start = datetime.datetime(2024, 1, 1)
+    purchases = [
+        {
+            'order_id': i,
+            'purchase_date': start + datetime.timedelta(minutes=37 * i),
+            'total_amount': Decimal(random.randint(500, 50000)) / 100,
+            'number_of_items': random.randint(1, 8),
+            'fulfillment_status': random.choice(STATUSES)
+        }
+        for i in range(count)
+    ]
+    return {'purchases': purchases, 'total_pages': 7, 'total_orders': count * 7}
+
+
+def time_it(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1e6)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--products', type=int, default=48, help='products on the page (default 48)')
+    parser.add_argument('--orders', type=int, default=50, help='orders on the page (default 50)')
+    parser.add_argument('--repeat', type=int, default=2000, help='runs per measurement (default 2000)')
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    app.config.from_object(Config)
+    stdlib = DefaultJSONProvider(app)
+    fast = FastJSONProvider(app)
+    level = app.config['RESPONSE_COMPRESSION_LEVEL']
+    encodings = ['gzip'] + (['br'] if compression.brotli is not None else [])
+    print(f"orjson {'installed' if orjson is not None else 'missing, fast provider falls back to stdlib'}, "
+          f"brotli {'installed' if compression.brotli is not None else 'missing'}, level {level}\n")
+
+    random.seed(0)
+    payloads = {'/products': products_payload(args.products), '/purchase_history': purchases_payload(args.orders)}
+    compact = {'separators': (',', ':')}
+
+    print(f"{'payload':<20}{'stdlib':>10}{'fast':>10}{'speedup':>9}{'bytes':>8}"
+          + ''.join(f"{e + ' bytes':>13}{e + ' us':>10}" for e in encodings))
+    for name, payload in payloads.items():
+        stdlib_us = time_it(lambda: stdlib.dumps(payload, **compact), args.repeat)
+        fast_us = time_it(lambda: fast.dumps(payload, **compact), args.repeat)
+        body = fast.dumps(payload, **compact)
+        if json.loads(body) != json.loads(stdlib.dumps(payload, **compact)):
+            print(f"{name}: fast provider output differs from stdlib")
+            sys.exit(1)
+        data = body.encode()
+        line = f"{name:<20}{stdlib_us:>8.1f}us{fast_us:>8.1f}us{stdlib_us / max(fast_us, 1e-6):>8.1f}x{len(data):>8}"
+        for encoding in encodings:
+            compressed = compression.compress(data, encoding, level)
+            compress_us = time_it(lambda: compression.compress(data, encoding, level), max(1, args.repeat // 10))
+            line += f"{len(compressed):>6} ({len(compressed) / len(data):>3.0%}){compress_us:>8.1f}us"
+        print(line)
+
+
+if __name__ == '__main__':
+    main()
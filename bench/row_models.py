@@ -0,0 +1,118 @@
+'''
+Row model benchmark: memory and throughput of turning a large query result into a JSON response.
+
+Compares, for --rows result rows shaped like Buys.get_all_buys (buyer_id, purchase_id, at_balance)
+and like the /products page (ProductCatalog):
+  - dict    a plain class with a per-instance __dict__, serialized via __dict__ (how the routes used to work)
+  - slots   the __slots__ model serialized via to_dict()
+  - rows    no model object at all, each row zipped into a dict (DB.execute_dicts)
+Reports the memory held by the materialized result (tracemalloc) and the time to build it and encode
+it with app/json_provider.py. Rows are made up tuples, the same shape the driver hands back, so no
+database is needed.
+
+    python bench/row_models.py --rows 10000 --repeat 20
+'''
+import argparse
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+from decimal import Decimal
+
+from dotenv import load_dotenv
+from flask import Flask
+
+# the app package reads its Config from the environment on import
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+load_dotenv(os.path.join(ROOT, '.flaskenv'))
+sys.path.insert(0, ROOT)
+from app.config import Config
+from app.json_provider import FastJSONProvider
+from app.models.buys import Buys
+from app.models.productCatalog import ProductCatalog
+
+BUYS_COLUMNS = ['buyer_id', 'purchase_id', 'at_balance']
+CATALOG_COLUMNS = ['product_id', 'product_name', 'min_price', 'category', 'description', 'image_url',
+                   'total_reviews', 'avg_rating', 'total_purchases']
+
+
+# the models before they had __slots__
+class DictBuys:
+    def __init__(self, buyer_id, purchase_id, at_balance):
+        self.buyer_id = buyer_id
+        self.purchase_id = purchase_id
+        self.at_balance = at_balance
+
+
+class DictProductCatalog:
+    def __init__(self, product_id, product_name, min_price, category, description, image_url, total_reviews=0,
+                 avg_rating=0, total_purchases=0):
+        self.product_id = product_id
+        self.product_name = product_name
+        self.min_price = min_price
+        self.category = category
+        self.description = description
+        self.image_url = image_url
+        self.total_reviews = total_reviews
+        self.avg_rating = avg_rating
+        self.total_purchases = total_purchases
+
+
+def buys_rows(count):
+    return [(i % 500, i, Decimal(100000 - i) / 100) for i in range(count)]
+
+
+def catalog_rows(count):
+    return [(i, f"Royal Potato {i}", Decimal(1000 + i % 900) / 100, 'Vegetables',
+             f"A hardy plant known for its royal appearance and its simple care, number {i}.",
+             f"https://example.com/images/{i}.jpg", i % 300, Decimal(35) / 10, i % 2000)
+            for i in range(count)]
+
+
+def strategies(model, dict_model, columns):
+    return {
+        'dict': (lambda rows: [dict_model(*row) for row in rows], lambda objs: [obj.__dict__ for obj in objs]),
+        'slots': (lambda rows: [model(*row) for row in rows], lambda objs: [obj.to_dict() for obj in objs]),
+        'rows': (lambda rows: [dict(zip(columns, row)) for row in rows], lambda objs: objs),
+    }
+
+
+def measure(build, serialize, rows, provider, repeat):
+    tracemalloc.start()
+    objs = build(rows)
+    held, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del objs
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        provider.dumps(serialize(build(rows)), separators=(',', ':'))
+        timings.append((time.perf_counter() - start) * 1000)
+    return held, statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=10000, help='rows in the result (default 10000)')
+    parser.add_argument('--repeat', type=int, default=20, help='runs per measurement (default 20)')
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    app.config.from_object(Config)
+    provider = FastJSONProvider(app)
+
+    cases = {
+        'Buys': (buys_rows(args.rows), strategies(Buys, DictBuys, BUYS_COLUMNS)),
+        'ProductCatalog': (catalog_rows(args.rows), strategies(ProductCatalog, DictProductCatalog, CATALOG_COLUMNS)),
+    }
+    print(f"{'result':<16}{'path':<8}{'held':>10}{'per row':>10}{'build+encode':>15}{'rows/s':>12}")
+    for name, (rows, paths) in cases.items():
+        for path, (build, serialize) in paths.items():
+            held, ms = measure(build, serialize, rows, provider, args.repeat)
+            print(f"{name:<16}{path:<8}{held / 1024:>8.0f}KB{held / len(rows):>9.0f}B{ms:>13.1f}ms"
+                  f"{len(rows) / (ms / 1000):>12.0f}")
+
+
+if __name__ == '__main__':
+    main()
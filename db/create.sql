@@ -22,10 +22,17 @@ CREATE TABLE ProductCatalog(
     image_url VARCHAR(255) NOT NULL,
     description VARCHAR(1023) NOT NULL,
     creator_id INT, 
+    -- full-text search document for the catalog search box, name ranks above description
+    search_vector tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', product_name), 'A') ||
+        setweight(to_tsvector('english', description), 'B')
+    ) STORED,
     FOREIGN KEY (category) REFERENCES Category(category_name),
     FOREIGN KEY (creator_id) REFERENCES Sellers(seller_id)
 );
 
+CREATE INDEX productcatalog_search_idx ON ProductCatalog USING GIN (search_vector);
+
 CREATE TABLE ProductListing (
     product_id INT NOT NULL PRIMARY KEY GENERATED BY DEFAULT AS IDENTITY,
     product_name VARCHAR(255) NOT NULL,
@@ -33,21 +40,34 @@ CREATE TABLE ProductListing (
     price DECIMAL(12,2) NOT NULL,
     quantity INT NOT NULL,
     active BOOLEAN NOT NULL DEFAULT true,
+    -- units held by carts (sum of StockHold.quantity), available = quantity - reserved
+    reserved INT NOT NULL DEFAULT 0,
     FOREIGN KEY (seller_id) REFERENCES Sellers(seller_id),
     FOREIGN KEY (product_name) REFERENCES ProductCatalog(product_name)
 );
 
+-- listings of a product (cheapest first) and active listings of a seller, see 007_hot_query_indexes.sql
+CREATE INDEX productlisting_name_price_idx ON ProductListing (product_name, price);
+CREATE INDEX productlisting_seller_idx ON ProductListing (seller_id, active);
+
 CREATE TABLE SellerReview (
     buyer_id INT NOT NULL,
     seller_id INT NOT NULL,
     rating INT NOT NULL,
     comment VARCHAR(1023),
     date_time TIMESTAMP NOT NULL DEFAULT (current_timestamp AT TIME ZONE 'UTC'),
+    -- number of SellerReviewUpvote rows, kept by app/models/seller_review_upvote.py
+    upvote_count INT NOT NULL DEFAULT 0,
     PRIMARY KEY (buyer_id, seller_id),
     FOREIGN KEY (buyer_id) REFERENCES Users(user_id),
     FOREIGN KEY (seller_id) REFERENCES Sellers(seller_id)
 );
 
+-- "most helpful" seller review pages
+CREATE INDEX sellerreview_helpful_idx ON SellerReview (seller_id, upvote_count DESC, date_time DESC);
+-- "newest"/"oldest" seller review pages
+CREATE INDEX sellerreview_recent_idx ON SellerReview (seller_id, date_time DESC);
+
 CREATE TABLE SellerReviewUpvote (
     buyer_id INT NOT NULL,
     seller_id INT NOT NULL,
@@ -63,11 +83,18 @@ CREATE TABLE ProductReview (
     rating INT NOT NULL,
     comment VARCHAR(1023),
     date_time TIMESTAMP NOT NULL DEFAULT (current_timestamp AT TIME ZONE 'UTC'),
+    -- number of ProductReviewUpvote rows, kept by app/models/product_review_upvote.py
+    upvote_count INT NOT NULL DEFAULT 0,
     PRIMARY KEY (buyer_id, product_name),
     FOREIGN KEY (buyer_id) REFERENCES Users(user_id),
     FOREIGN KEY (product_name) REFERENCES ProductCatalog(product_name)
 );
 
+-- "most helpful" product review pages
+CREATE INDEX productreview_helpful_idx ON ProductReview (product_name, upvote_count DESC, date_time DESC);
+-- "newest"/"oldest" product review pages
+CREATE INDEX productreview_recent_idx ON ProductReview (product_name, date_time DESC);
+
 CREATE TABLE ProductReviewUpvote (
     buyer_id INT NOT NULL,
     product_name VARCHAR(255) NOT NULL,
@@ -95,9 +122,15 @@ CREATE TABLE OrderContains (
     PRIMARY KEY (purchase_id, product_id)
 );
 
+-- order lines of a listing (seller order pages)
+CREATE INDEX ordercontains_product_idx ON OrderContains (product_id);
+
+-- running total and number of distinct items of each user's cart, kept current by CartDAL
+-- (see app/models/cart.py); rebuild with `flask carts rebuild`
 CREATE TABLE Cart (
     uid INT NOT NULL PRIMARY KEY,
     total_price DECIMAL(12,2),
+    item_count INT NOT NULL DEFAULT 0,
     FOREIGN KEY (uid) REFERENCES Users(user_id)
 );
 
@@ -111,9 +144,63 @@ CREATE TABLE CartContains (
     FOREIGN KEY (product_id) REFERENCES ProductListing(product_id)
 );
 
+-- time limited hold a cart has on listing stock (see app/models/stock_hold.py),
+-- turned into a stock decrement at checkout or released by the sweeper once expired
+CREATE TABLE StockHold (
+    uid INT NOT NULL REFERENCES Users(user_id),
+    product_id INT NOT NULL REFERENCES ProductListing(product_id),
+    quantity INT NOT NULL,
+    expires_at TIMESTAMP NOT NULL,
+    PRIMARY KEY (uid, product_id)
+);
+
+CREATE INDEX stockhold_expires_idx ON StockHold (expires_at);
+
 CREATE TABLE Buys (
     buyer_id INT NOT NULL REFERENCES Users(user_id),
     purchase_id INT NOT NULL REFERENCES Orders(purchase_id), 
     at_balance FLOAT NOT NULL,
     PRIMARY KEY(buyer_id, purchase_id)
-);
\ No newline at end of file
+);
+
+-- buyer of an order, the primary key only serves lookups by buyer
+CREATE INDEX buys_purchase_idx ON Buys (purchase_id);
+
+-- per product summary read by the catalog page, kept current by the write paths
+-- (see app/models/product_stats.py); rebuild with `flask stats rebuild`
+CREATE TABLE ProductStats (
+    product_name VARCHAR(255) NOT NULL PRIMARY KEY REFERENCES ProductCatalog(product_name),
+    min_price DECIMAL(12,2),
+    total_reviews INT NOT NULL DEFAULT 0,
+    rating_sum INT NOT NULL DEFAULT 0,
+    total_purchases INT NOT NULL DEFAULT 0
+);
+
+-- reviews per star rating of each product and seller, kept by the review write paths
+-- (see app/models/rating_histogram.py)
+CREATE TABLE ProductRatingHistogram (
+    product_name VARCHAR(255) NOT NULL PRIMARY KEY REFERENCES ProductCatalog(product_name),
+    star_1 INT NOT NULL DEFAULT 0,
+    star_2 INT NOT NULL DEFAULT 0,
+    star_3 INT NOT NULL DEFAULT 0,
+    star_4 INT NOT NULL DEFAULT 0,
+    star_5 INT NOT NULL DEFAULT 0
+);
+
+CREATE TABLE SellerRatingHistogram (
+    seller_id INT NOT NULL PRIMARY KEY REFERENCES Sellers(seller_id),
+    star_1 INT NOT NULL DEFAULT 0,
+    star_2 INT NOT NULL DEFAULT 0,
+    star_3 INT NOT NULL DEFAULT 0,
+    star_4 INT NOT NULL DEFAULT 0,
+    star_5 INT NOT NULL DEFAULT 0
+);
+
+-- change counters per "product:<name>" / "category:<category>" / "category:all", bumped by every
+-- write to what those pages show; ETags and the catalog cache are built on them
+-- (see app/models/content_version.py)
+CREATE TABLE ContentVersion (
+    scope VARCHAR(300) NOT NULL PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP NOT NULL
+);
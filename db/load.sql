@@ -11,16 +11,16 @@ SELECT pg_catalog.setval('public.users_user_id_seq',
 \COPY Category FROM 'Category.csv' WITH DELIMITER ',' NULL '' CSV
 
 \COPY ProductCatalog FROM 'ProductCatalog.csv' WITH DELIMITER ',' NULL '' CSV
-\COPY ProductListing FROM 'ProductListing.csv' WITH DELIMITER ',' NULL '' CSV
+\COPY ProductListing (product_id, product_name, seller_id, price, quantity, active) FROM 'ProductListing.csv' WITH DELIMITER ',' NULL '' CSV
 SELECT pg_catalog.setval('public.productlisting_product_id_seq',
                          (SELECT MAX(product_id)+1 FROM ProductListing),
                          false);
 
-\COPY SellerReview FROM 'SellerReview.csv' WITH DELIMITER ',' NULL '' CSV
+\COPY SellerReview (buyer_id, seller_id, rating, comment, date_time) FROM 'SellerReview.csv' WITH DELIMITER ',' NULL '' CSV
 
 \COPY SellerReviewUpvote FROM 'SellerReviewUpvote.csv' WITH DELIMITER ',' NULL '' CSV
 
-\COPY ProductReview FROM 'ProductReview.csv' WITH DELIMITER ',' NULL '' CSV
+\COPY ProductReview (buyer_id, product_name, rating, comment, date_time) FROM 'ProductReview.csv' WITH DELIMITER ',' NULL '' CSV
 
 \COPY ProductReviewUpvote FROM 'ProductReviewUpvote.csv' WITH DELIMITER ',' NULL '' CSV
 
@@ -31,8 +31,79 @@ SELECT pg_catalog.setval('public.orders_purchase_id_seq',
 
 \COPY OrderContains FROM 'OrderContains.csv' WITH DELIMITER ',' NULL '' CSV
 
-\COPY Cart FROM 'Cart.csv' WITH DELIMITER ',' NULL '' CSV
+\COPY Cart (uid, total_price) FROM 'Cart.csv' WITH DELIMITER ',' NULL '' CSV
 
 \COPY CartContains FROM 'CartContains.csv' WITH DELIMITER ',' NULL ' ' CSV
 
 \COPY Buys FROM 'Buys.csv' WITH DELIMITER ',' NULL '' CSV
+
+
+-- build the ProductStats summary from the tables loaded above
+-- (same query as ProductStats.COMPUTE_QUERY in app/models/product_stats.py)
+INSERT INTO ProductStats (product_name, min_price, total_reviews, rating_sum, total_purchases)
+SELECT pc.product_name,
+    mp.min_price,
+    COALESCE(pr.total_reviews, 0),
+    COALESCE(pr.rating_sum, 0),
+    COALESCE(o.total_purchases, 0)
+FROM ProductCatalog pc
+LEFT JOIN (
+    SELECT product_name, MIN(price) AS min_price
+    FROM ProductListing
+    GROUP BY product_name
+) mp ON mp.product_name = pc.product_name
+LEFT JOIN (
+    SELECT product_name, COUNT(rating) AS total_reviews, SUM(rating) AS rating_sum
+    FROM ProductReview
+    GROUP BY product_name
+) pr ON pr.product_name = pc.product_name
+LEFT JOIN (
+    SELECT pl.product_name, COUNT(oc.product_id) AS total_purchases
+    FROM OrderContains oc
+    JOIN ProductListing pl ON pl.product_id = oc.product_id
+    GROUP BY pl.product_name
+) o ON o.product_name = pc.product_name;
+
+-- recompute the cart totals from the cart items loaded above, the generated totals are floats
+-- (same query as Cart.COMPUTE_QUERY in app/models/cart.py)
+INSERT INTO Cart (uid, total_price, item_count)
+SELECT uid, SUM(quantity * at_price), COUNT(*)
+FROM CartContains
+GROUP BY uid
+ON CONFLICT (uid)
+DO UPDATE SET total_price = EXCLUDED.total_price, item_count = EXCLUDED.item_count;
+
+-- count the upvotes loaded above onto their reviews
+UPDATE ProductReview pr
+SET upvote_count = u.upvotes
+FROM (
+    SELECT buyer_id, product_name, COUNT(*) AS upvotes
+    FROM ProductReviewUpvote
+    GROUP BY buyer_id, product_name
+) u
+WHERE pr.buyer_id = u.buyer_id AND pr.product_name = u.product_name;
+
+UPDATE SellerReview sr
+SET upvote_count = u.upvotes
+FROM (
+    SELECT buyer_id, seller_id, COUNT(*) AS upvotes
+    FROM SellerReviewUpvote
+    GROUP BY buyer_id, seller_id
+) u
+WHERE sr.buyer_id = u.buyer_id AND sr.seller_id = u.seller_id;
+
+-- rating histograms of the reviews loaded above
+-- (same query as RatingHistogram.compute_query in app/models/rating_histogram.py)
+INSERT INTO ProductRatingHistogram (product_name, star_1, star_2, star_3, star_4, star_5)
+SELECT product_name,
+    COUNT(*) FILTER (WHERE rating = 1), COUNT(*) FILTER (WHERE rating = 2), COUNT(*) FILTER (WHERE rating = 3),
+    COUNT(*) FILTER (WHERE rating = 4), COUNT(*) FILTER (WHERE rating = 5)
+FROM ProductReview
+GROUP BY product_name;
+
+INSERT INTO SellerRatingHistogram (seller_id, star_1, star_2, star_3, star_4, star_5)
+SELECT seller_id,
+    COUNT(*) FILTER (WHERE rating = 1), COUNT(*) FILTER (WHERE rating = 2), COUNT(*) FILTER (WHERE rating = 3),
+    COUNT(*) FILTER (WHERE rating = 4), COUNT(*) FILTER (WHERE rating = 5)
+FROM SellerReview
+GROUP BY seller_id;
@@ -0,0 +1,51 @@
+#!/bin/bash
+# Applies the migrations in db/migrations/ that the database hasn't seen yet, in file name
+# order, and records each in SchemaMigration. Every migration runs in one transaction together
+# with its SchemaMigration row, so a failing one leaves nothing behind and stops the run.
+# The migrations cover every schema change since the original course schema (000 ProductStats
+# through the latest); create.sql is that schema with all of them folded in, and each migration
+# is written to be a no-op against it. setup.sh runs this after loading a fresh database, which
+# only records them as applied; on an existing database built from the original schema or a
+# later create.sql, run it on every deploy:
+#     db/migrate.sh            apply pending migrations
+#     db/migrate.sh --status   list applied and pending migrations
+
+mypath=`realpath "$0"`
+mybase=`dirname "$mypath"`
+
+source $mybase/../.flaskenv
+dbname=$DB_NAME
+
+psql -q -v ON_ERROR_STOP=1 $dbname -c "
+CREATE TABLE IF NOT EXISTS SchemaMigration (
+    version INT NOT NULL PRIMARY KEY,
+    name VARCHAR(255) NOT NULL,
+    applied_at TIMESTAMP NOT NULL DEFAULT (current_timestamp AT TIME ZONE 'UTC')
+)" || exit 1
+
+applied=`psql -qtA $dbname -c "SELECT version FROM SchemaMigration ORDER BY version"` || exit 1
+
+pending=0
+for file in $mybase/migrations/[0-9][0-9][0-9]_*.sql; do
+    name=`basename $file .sql`
+    # 10# so that 008 isn't read as octal
+    version=$((10#${name%%_*}))
+    if grep -qx "$version" <<< "$applied"; then
+        if [ "$1" == "--status" ]; then
+            echo "applied  $name"
+        fi
+        continue
+    fi
+    pending=$((pending + 1))
+    if [ "$1" == "--status" ]; then
+        echo "pending  $name"
+        continue
+    fi
+    echo "applying $name"
+    psql -q -1 -v ON_ERROR_STOP=1 $dbname -f $file \
+        -c "INSERT INTO SchemaMigration (version, name) VALUES ($version, '$name')" || exit 1
+done
+
+if [ "$1" != "--status" ]; then
+    echo "$pending migrations applied"
+fi
@@ -0,0 +1,38 @@
+-- per product catalog summary (app/models/product_stats.py), read by the catalog page and kept
+-- by the review, listing and checkout writes; numbered 000 as the later migrations and the app
+-- expect it to exist
+-- fresh databases get this from create.sql; run on existing ones with
+--     psql -af db/migrations/000_product_stats.sql $DB_NAME
+CREATE TABLE IF NOT EXISTS ProductStats (
+    product_name VARCHAR(255) NOT NULL PRIMARY KEY REFERENCES ProductCatalog(product_name),
+    min_price DECIMAL(12,2),
+    total_reviews INT NOT NULL DEFAULT 0,
+    rating_sum INT NOT NULL DEFAULT 0,
+    total_purchases INT NOT NULL DEFAULT 0
+);
+
+-- (same query as ProductStats.COMPUTE_QUERY), rows already there are kept
+INSERT INTO ProductStats (product_name, min_price, total_reviews, rating_sum, total_purchases)
+SELECT pc.product_name,
+    mp.min_price,
+    COALESCE(pr.total_reviews, 0),
+    COALESCE(pr.rating_sum, 0),
+    COALESCE(o.total_purchases, 0)
+FROM ProductCatalog pc
+LEFT JOIN (
+    SELECT product_name, MIN(price) AS min_price
+    FROM ProductListing
+    GROUP BY product_name
+) mp ON mp.product_name = pc.product_name
+LEFT JOIN (
+    SELECT product_name, COUNT(rating) AS total_reviews, SUM(rating) AS rating_sum
+    FROM ProductReview
+    GROUP BY product_name
+) pr ON pr.product_name = pc.product_name
+LEFT JOIN (
+    SELECT pl.product_name, COUNT(oc.product_id) AS total_purchases
+    FROM OrderContains oc
+    JOIN ProductListing pl ON pl.product_id = oc.product_id
+    GROUP BY pl.product_name
+) o ON o.product_name = pc.product_name
+ON CONFLICT (product_name) DO NOTHING;
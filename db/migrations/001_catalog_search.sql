@@ -0,0 +1,9 @@
+-- full-text search for /products?search= (replaces LOWER(...) LIKE '%term%')
+-- fresh databases get this from create.sql; run on existing ones with
+--     psql -af db/migrations/001_catalog_search.sql $DB_NAME
+ALTER TABLE ProductCatalog ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS (
+    setweight(to_tsvector('english', product_name), 'A') ||
+    setweight(to_tsvector('english', description), 'B')
+) STORED;
+
+CREATE INDEX IF NOT EXISTS productcatalog_search_idx ON ProductCatalog USING GIN (search_vector);
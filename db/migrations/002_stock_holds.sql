@@ -0,0 +1,14 @@
+-- cart holds on listing stock (app/models/stock_hold.py)
+-- fresh databases get this from create.sql; run on existing ones with
+--     psql -af db/migrations/002_stock_holds.sql $DB_NAME
+ALTER TABLE ProductListing ADD COLUMN IF NOT EXISTS reserved INT NOT NULL DEFAULT 0;
+
+CREATE TABLE IF NOT EXISTS StockHold (
+    uid INT NOT NULL REFERENCES Users(user_id),
+    product_id INT NOT NULL REFERENCES ProductListing(product_id),
+    quantity INT NOT NULL,
+    expires_at TIMESTAMP NOT NULL,
+    PRIMARY KEY (uid, product_id)
+);
+
+CREATE INDEX IF NOT EXISTS stockhold_expires_idx ON StockHold (expires_at);
@@ -0,0 +1,13 @@
+-- cart totals maintained by CartDAL (app/models/cart.py)
+-- fresh databases get this from create.sql; run on existing ones with
+--     psql -af db/migrations/003_cart_totals.sql $DB_NAME
+ALTER TABLE Cart ADD COLUMN IF NOT EXISTS item_count INT NOT NULL DEFAULT 0;
+
+UPDATE Cart SET total_price = 0, item_count = 0;
+
+INSERT INTO Cart (uid, total_price, item_count)
+SELECT uid, SUM(quantity * at_price), COUNT(*)
+FROM CartContains
+GROUP BY uid
+ON CONFLICT (uid)
+DO UPDATE SET total_price = EXCLUDED.total_price, item_count = EXCLUDED.item_count;
@@ -0,0 +1,8 @@
+-- change counters behind the catalog/review ETags (app/models/content_version.py)
+-- fresh databases get this from create.sql; run on existing ones with
+--     psql -af db/migrations/004_content_versions.sql $DB_NAME
+CREATE TABLE IF NOT EXISTS ContentVersion (
+    scope VARCHAR(300) NOT NULL PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP NOT NULL
+);
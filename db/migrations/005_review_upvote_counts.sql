@@ -0,0 +1,22 @@
+-- upvote counts kept on the review rows (app/models/product_review_upvote.py, seller_review_upvote.py)
+-- fresh databases get this from create.sql; run on existing ones with
+--     psql -af db/migrations/005_review_upvote_counts.sql $DB_NAME
+ALTER TABLE ProductReview ADD COLUMN IF NOT EXISTS upvote_count INT NOT NULL DEFAULT 0;
+ALTER TABLE SellerReview ADD COLUMN IF NOT EXISTS upvote_count INT NOT NULL DEFAULT 0;
+
+UPDATE ProductReview pr
+SET upvote_count = (
+    SELECT COUNT(*)
+    FROM ProductReviewUpvote pru
+    WHERE pru.buyer_id = pr.buyer_id AND pru.product_name = pr.product_name
+);
+
+UPDATE SellerReview sr
+SET upvote_count = (
+    SELECT COUNT(*)
+    FROM SellerReviewUpvote sru
+    WHERE sru.buyer_id = sr.buyer_id AND sru.seller_id = sr.seller_id
+);
+
+CREATE INDEX IF NOT EXISTS productreview_helpful_idx ON ProductReview (product_name, upvote_count DESC, date_time DESC);
+CREATE INDEX IF NOT EXISTS sellerreview_helpful_idx ON SellerReview (seller_id, upvote_count DESC, date_time DESC);
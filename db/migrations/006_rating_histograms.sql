@@ -0,0 +1,40 @@
+-- per product and seller rating histograms (app/models/rating_histogram.py)
+-- fresh databases get this from create.sql; run on existing ones with
+--     psql -af db/migrations/006_rating_histograms.sql $DB_NAME
+CREATE TABLE IF NOT EXISTS ProductRatingHistogram (
+    product_name VARCHAR(255) NOT NULL PRIMARY KEY REFERENCES ProductCatalog(product_name),
+    star_1 INT NOT NULL DEFAULT 0,
+    star_2 INT NOT NULL DEFAULT 0,
+    star_3 INT NOT NULL DEFAULT 0,
+    star_4 INT NOT NULL DEFAULT 0,
+    star_5 INT NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS SellerRatingHistogram (
+    seller_id INT NOT NULL PRIMARY KEY REFERENCES Sellers(seller_id),
+    star_1 INT NOT NULL DEFAULT 0,
+    star_2 INT NOT NULL DEFAULT 0,
+    star_3 INT NOT NULL DEFAULT 0,
+    star_4 INT NOT NULL DEFAULT 0,
+    star_5 INT NOT NULL DEFAULT 0
+);
+
+INSERT INTO ProductRatingHistogram (product_name, star_1, star_2, star_3, star_4, star_5)
+SELECT product_name,
+    COUNT(*) FILTER (WHERE rating = 1), COUNT(*) FILTER (WHERE rating = 2), COUNT(*) FILTER (WHERE rating = 3),
+    COUNT(*) FILTER (WHERE rating = 4), COUNT(*) FILTER (WHERE rating = 5)
+FROM ProductReview
+GROUP BY product_name
+ON CONFLICT (product_name) DO UPDATE
+SET star_1 = EXCLUDED.star_1, star_2 = EXCLUDED.star_2, star_3 = EXCLUDED.star_3,
+    star_4 = EXCLUDED.star_4, star_5 = EXCLUDED.star_5;
+
+INSERT INTO SellerRatingHistogram (seller_id, star_1, star_2, star_3, star_4, star_5)
+SELECT seller_id,
+    COUNT(*) FILTER (WHERE rating = 1), COUNT(*) FILTER (WHERE rating = 2), COUNT(*) FILTER (WHERE rating = 3),
+    COUNT(*) FILTER (WHERE rating = 4), COUNT(*) FILTER (WHERE rating = 5)
+FROM SellerReview
+GROUP BY seller_id
+ON CONFLICT (seller_id) DO UPDATE
+SET star_1 = EXCLUDED.star_1, star_2 = EXCLUDED.star_2, star_3 = EXCLUDED.star_3,
+    star_4 = EXCLUDED.star_4, star_5 = EXCLUDED.star_5;
@@ -0,0 +1,31 @@
+-- indexes for the predicates of the busiest DAL queries, each listed with the methods it serves.
+-- Already covered by a primary key prefix, so not repeated here: CartContains(uid), Buys(buyer_id),
+-- ProductReview(buyer_id), SellerReview(buyer_id); SellerReview(seller_id) and
+-- ProductReview(product_name) lookups use the *_helpful_idx indexes from 005.
+-- fresh databases get this from create.sql; db/migrate.sh applies it to existing ones, or
+--     psql -af db/migrations/007_hot_query_indexes.sql $DB_NAME
+-- compare the plans before and after with bench/index_plans.py
+
+-- ProductListing.load_listing_by_name, Product.get_listing_by_name, Seller.check_if_already_sold,
+-- the MIN(price) lookups of Seller.REFRESH_MIN_PRICE / change_product_price / ProductReview.new_product_review,
+-- and ProductCatalog.FROM_CLAUSE joining ProductStats.min_price back to the cheapest listing
+CREATE INDEX IF NOT EXISTS productlisting_name_price_idx ON ProductListing (product_name, price);
+
+-- Seller.get_products_by_seller, get_paginated_products_by_seller (active listings), and the
+-- seller_id filter of get_fulfilled_ordered_items_by_seller / get_unfulfilled_ordered_items_by_seller
+CREATE INDEX IF NOT EXISTS productlisting_seller_idx ON ProductListing (seller_id, active);
+
+-- the seller order pages above, which go from the seller's listings to their order lines, and
+-- Buys.count_fulfilled_purchases_of_product / count_fulfilled_purchases_of_seller_products, which
+-- can now start from the product's (seller's) few listings instead of the buyer's orders
+CREATE INDEX IF NOT EXISTS ordercontains_product_idx ON OrderContains (product_id);
+
+-- Buys.get_buys_by_order and the NATURAL JOIN Buys (by purchase_id) of the seller order pages;
+-- the primary key (buyer_id, purchase_id) only helps lookups by buyer
+CREATE INDEX IF NOT EXISTS buys_purchase_idx ON Buys (purchase_id);
+
+-- "newest"/"oldest" sorts of ProductReview.get_paginated_reviews_for_product_by_name
+CREATE INDEX IF NOT EXISTS productreview_recent_idx ON ProductReview (product_name, date_time DESC);
+
+-- "newest"/"oldest" sorts of SellerReview.get_paginated_reviews_for_seller
+CREATE INDEX IF NOT EXISTS sellerreview_recent_idx ON SellerReview (seller_id, date_time DESC);
@@ -21,3 +21,6 @@ createdb $dbname
 psql -af create.sql $dbname
 cd $datadir
 psql -af $mybase/load.sql $dbname
+
+# create.sql includes every migration in db/migrations/ (000-007), this only records them as applied
+$mybase/migrate.sh